@@ -0,0 +1,443 @@
+# Python imports
+import math
+
+import flask
+import numpy as np
+
+# Local imports
+import disparity_metrics
+import export
+import leaderboard
+import release_diff
+import table_query
+
+'''
+Read-only JSON API over the loaded disparity tables.
+
+    GET  /api/v1/groupings
+    GET  /api/v1/<grouping>/<phecode>
+    GET  /api/v1/<grouping>/<phecode>/figure      (the bar chart, as plotly JSON)
+    POST /api/v1/<grouping>            {"phecodes" : [401.1, 250.2, ...]}
+    GET  /api/v1/<grouping>/export/<table>?format=csv&filter_query=...&sort_by=Variance:desc
+    GET  /api/v1/<grouping>/phecodes?start=280&stop=290
+    GET  /api/v1/<grouping>/phecodes/<phecode>    (roll-up, children and codes below)
+    GET  /api/v1/releases
+    GET  /api/v1/diff?old=legacy&new=summary_stats&metric=Variance&top=10
+    GET  /api/v1/leaderboard?metric=Variance&top=10&groupings=age,sex&unique=1
+    GET  /api/v1/leaderboard/<phecode>            (rank in every grouping)
+
+Groupings are named by the lower-cased tab suffix (sex, age, ethnic, ses,
+country). Every route answers from the default release unless another one
+is named with ?release=<name>. Lookups go through the PheCode index of each grouping, so a batch is
+answered with one searchsorted and one positional take, whatever its size.
+'''
+
+API_PREFIX = '/api/v1'
+MAX_BATCH = 5000
+MAX_TOP = 1000
+
+# Exportable tables of a grouping
+EXPORT_TABLES = ('selection', 'prevalence', 'plotting', 'analysis', 'metrics')
+
+
+def clean(value):
+    # NaN is not valid JSON
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+def parse_phecode(value):
+    # JSON true / false would otherwise read as PheCodes 1 and 0
+    if isinstance(value, (bool, np.bool_)):
+        return None
+    try:
+        phecode = float(value)
+    except (TypeError, ValueError):
+        return None
+    return phecode if math.isfinite(phecode) else None
+
+
+def get_records(data, phecodes):
+    # Disparity metrics and per-trait prevalence of each PheCode, in request
+    # order. Returns the records and the PheCodes that were not found.
+    found, phenotypes, lengths, rows = data.index.rows_by_phecode(phecodes)
+
+    # The selection table is indexed by phenotype ('id') when it is loaded,
+    # so the rows are one lookup in that index and a positional take
+    metric_columns = [column for column in data.table_data.columns if column not in ('Disease', 'Phecode', 'id')]
+    positions = data.table_data.index.get_indexer(phenotypes)
+    metrics = data.table_data[metric_columns].iloc[positions].values.tolist()
+
+    traits = rows['Trait'].astype(str).tolist()
+    prevalences = rows['Prevalence'].values.astype('float64').round(2).tolist()
+    cases = rows['Cases'].values.tolist()
+    controls = rows['Controls'].values.tolist()
+
+    records = []
+    start = 0
+    for phecode, phenotype, length, values in zip(np.asarray(phecodes)[found].tolist(), phenotypes, lengths.tolist(), metrics):
+        stop = start + length
+        records.append({
+            'phecode' : phecode,
+            'phenotype' : phenotype,
+            'metrics' : {column : clean(value) for column, value in zip(metric_columns, values)},
+            'prevalence' : [
+                {'trait' : trait, 'prevalence' : clean(prevalence), 'cases' : case, 'controls' : control}
+                for trait, prevalence, case, control in zip(
+                    traits[start:stop], prevalences[start:stop], cases[start:stop], controls[start:stop]
+                )
+            ],
+        })
+        start = stop
+
+    missing = np.asarray(phecodes)[~found].tolist()
+
+    return records, missing
+
+
+def parse_sort_by(values):
+    # 'Variance:desc' -> the DataTable's sort_by entries
+    sort_by = []
+    for value in values:
+        column, _, direction = value.rpartition(':')
+        if not column or direction not in ('asc', 'desc'):
+            column, direction = value, 'asc'
+        sort_by.append({'column_id' : column, 'direction' : direction})
+    return sort_by
+
+
+def get_table_records(table_data):
+    return [
+        {column : clean(value) for column, value in record.items()}
+        for record in table_data.drop(columns = ['id'], errors = 'ignore').to_dict('records')
+    ]
+
+
+def create_blueprint(release_registry):
+    blueprint = flask.Blueprint('api', __name__, url_prefix = API_PREFIX)
+
+    def get_export_query(release_data, disp_type, table):
+        # Memoized on the release, so it is dropped when the release is evicted
+        return release_data.memoize(('export', disp_type, table), lambda: build_export_query(release_data, disp_type, table))
+
+    def build_export_query(release_data, disp_type, table):
+        data = release_data.grouping_data[disp_type]
+        if table == 'selection':
+            frame = data.table_data
+        elif table == 'prevalence':
+            frame = data.prev_data
+        elif table == 'plotting':
+            frame = data.plotting_data
+        elif table == 'metrics':
+            # Recomputed from the case and control counts
+            frame = disparity_metrics.compute_metrics(data.plotting_data)
+        else:
+            frame = release_data.groupings[disp_type].load_analysis_data(release_data.release.data_path)
+
+        # 'id' only duplicates Disease for the DataTables
+        frame = frame.drop(columns = ['id'], errors = 'ignore').reset_index(drop = True)
+        return table_query.TableQuery(frame)
+
+    def error(status, message):
+        return flask.jsonify({'error' : message}), status
+
+    def get_release():
+        name = flask.request.args.get('release', release_registry.default)
+        return release_registry.get(name) if name in release_registry else None
+
+    def unknown_release():
+        return error(404, f"Unknown release '{flask.request.args['release']}', expected one of {list(release_registry.releases)}")
+
+    def get_grouping(name):
+        # Returns (release, grouping) or an error response
+        release_data = get_release()
+        if release_data is None:
+            return None, unknown_release()
+
+        names = {disp_type.lower() : disp_type for disp_type in release_data.grouping_data}
+        if name.lower() not in names:
+            return None, error(404, f"Unknown grouping '{name}' in release '{release_data.name}', expected one of {sorted(names)}")
+
+        return (release_data, names[name.lower()]), None
+
+    @blueprint.route('/releases')
+    def list_releases():
+        loaded = release_registry.loaded()
+        return flask.jsonify({
+            'default' : release_registry.default,
+            'releases' : [
+                {
+                    'name' : release.name,
+                    'label' : release.label,
+                    'groupings' : [grouping.disp_type.lower() for grouping in release.groupings],
+                    'loaded' : release.name in loaded,
+                }
+                for release in release_registry.releases.values()
+            ]
+        })
+
+    @blueprint.route('/diff')
+    def diff_releases():
+        # Largest shifts of every grouping between two releases, and the
+        # PheCodes added and removed. The comparison is memoized on the new
+        # release, so it is dropped when that release is evicted.
+        names = {
+            side : flask.request.args.get(side, default)
+            for side, default in (('old', None), ('new', release_registry.default))
+        }
+        if names['old'] is None:
+            return error(400, "Name the release to compare with ?old=<name>")
+        for side, name in names.items():
+            if name not in release_registry:
+                return error(404, f"Unknown {side} release '{name}', expected one of {list(release_registry.releases)}")
+
+        metric = flask.request.args.get('metric', 'Variance')
+        if metric not in release_diff.SHIFTS:
+            return error(400, f"Unknown metric '{metric}', expected one of {release_diff.SHIFTS}")
+        try:
+            top = int(flask.request.args.get('top', release_diff.TOP))
+        except ValueError:
+            return error(400, "top must be an integer")
+        if not 0 <= top <= MAX_TOP:
+            return error(400, f"top must be between 0 and {MAX_TOP}")
+
+        old, new = release_registry.get(names['old']), release_registry.get(names['new'])
+        diff = new.memoize(('diff', old.name), lambda: release_diff.diff_releases(old, new))
+
+        return flask.jsonify({
+            'old' : diff.old,
+            'new' : diff.new,
+            'metric' : metric,
+            'definition' : release_diff.DEFINITION,
+            'added_groupings' : [disp_type.lower() for disp_type in diff.added_groupings],
+            'removed_groupings' : [disp_type.lower() for disp_type in diff.removed_groupings],
+            'groupings' : [
+                {
+                    'name' : disp_type.lower(),
+                    'compared' : len(grouping_diff.changes),
+                    'groups' : grouping_diff.groups,
+                    'added' : get_table_records(grouping_diff.added),
+                    'removed' : get_table_records(grouping_diff.removed),
+                    'largest_shifts' : get_table_records(release_diff.largest_shifts(grouping_diff.changes, metric, top))
+                        if f"{metric} shift" in grouping_diff.changes.columns else [],
+                }
+                for disp_type, grouping_diff in diff.groupings.items()
+            ]
+        })
+
+    @blueprint.route('/leaderboard')
+    def get_leaderboard():
+        release_data = get_release()
+        if release_data is None:
+            return unknown_release()
+        board = release_data.leaderboard
+
+        metric = flask.request.args.get('metric', 'Variance')
+        if metric not in board.metrics():
+            return error(400, f"Unknown metric '{metric}', expected one of {board.metrics()}")
+        try:
+            top = int(flask.request.args.get('top', leaderboard.TOP))
+        except ValueError:
+            return error(400, "top must be an integer")
+        if not 0 <= top <= MAX_TOP:
+            return error(400, f"top must be between 0 and {MAX_TOP}")
+
+        disp_types = None
+        if flask.request.args.get('groupings'):
+            names = {disp_type.lower() : disp_type for disp_type in board.disp_types}
+            requested = flask.request.args['groupings'].lower().split(',')
+            unknown = [name for name in requested if name not in names]
+            if unknown:
+                return error(404, f"Unknown groupings {unknown} in release '{release_data.name}', expected some of {sorted(names)}")
+            disp_types = [names[name] for name in requested]
+
+        unique = flask.request.args.get('unique', '0').lower() in ('1', 'true', 'yes')
+        results = board.top(metric, top, disp_types, unique)
+        results['Grouping'] = results['Grouping'].str.lower()
+
+        return flask.jsonify({
+            'release' : release_data.name,
+            'metric' : metric,
+            'unique' : unique,
+            'results' : get_table_records(results),
+        })
+
+    @blueprint.route('/leaderboard/<phecode>')
+    def get_leaderboard_ranks(phecode):
+        release_data = get_release()
+        if release_data is None:
+            return unknown_release()
+
+        value = parse_phecode(phecode)
+        if value is None:
+            return error(400, f"'{phecode}' is not a PheCode")
+
+        ranks = release_data.leaderboard.ranks_of(phecode = value)
+        if not len(ranks):
+            return error(404, f"PheCode {phecode} not found in release '{release_data.name}'")
+        ranks['Grouping'] = ranks['Grouping'].str.lower()
+
+        return flask.jsonify({
+            'release' : release_data.name,
+            'phecode' : value,
+            'phenotype' : ranks['Disease'].iloc[0],
+            'ranks' : get_table_records(ranks.drop(columns = ['Disease', 'Phecode'])),
+        })
+
+    @blueprint.route('/groupings')
+    def list_groupings():
+        release_data = get_release()
+        if release_data is None:
+            return unknown_release()
+
+        return flask.jsonify({
+            'release' : release_data.name,
+            'groupings' : [
+                {
+                    'name' : disp_type.lower(),
+                    'traits' : [str(trait) for trait in data.plotting_data['Trait'].unique()],
+                    'phenotypes' : len(data.index),
+                }
+                for disp_type, data in release_data.grouping_data.items()
+            ]
+        })
+
+    @blueprint.route('/<grouping>/<phecode>')
+    def get_phecode(grouping, phecode):
+        found, failure = get_grouping(grouping)
+        if failure is not None:
+            return failure
+        release_data, disp_type = found
+        data = release_data.grouping_data[disp_type]
+
+        value = parse_phecode(phecode)
+        if value is None:
+            return error(400, f"'{phecode}' is not a PheCode")
+
+        records, _ = get_records(data, [value])
+        if not records:
+            return error(404, f"PheCode {phecode} not found in {grouping}")
+
+        return flask.jsonify(dict(records[0], grouping = grouping.lower()))
+
+    @blueprint.route('/<grouping>/<phecode>/figure')
+    def get_figure(grouping, phecode):
+        # The tab's bar chart of one phenotype. Unlike the figures sent by the
+        # Dash callbacks (POSTs), it is a GET, so it is revalidated with its
+        # ETag like the rest of the API (see http_caching.py).
+        found, failure = get_grouping(grouping)
+        if failure is not None:
+            return failure
+        release_data, disp_type = found
+        data = release_data.grouping_data[disp_type]
+
+        value = parse_phecode(phecode)
+        if value is None:
+            return error(400, f"'{phecode}' is not a PheCode")
+
+        found, _, _, rows = data.index.rows_by_phecode([value])
+        if not found[0]:
+            return error(404, f"PheCode {phecode} not found in {grouping}")
+
+        return flask.Response(data.template.to_json(rows), mimetype = 'application/json')
+
+    @blueprint.route('/<grouping>', methods = ['POST'])
+    def get_phecodes(grouping):
+        found, failure = get_grouping(grouping)
+        if failure is not None:
+            return failure
+        release_data, disp_type = found
+        data = release_data.grouping_data[disp_type]
+
+        body = flask.request.get_json(silent = True)
+        requested = body.get('phecodes') if isinstance(body, dict) else None
+        if not isinstance(requested, list):
+            return error(400, 'Expected a JSON body like {"phecodes" : [401.1, 250.2]}')
+        if len(requested) > MAX_BATCH:
+            return error(413, f"At most {MAX_BATCH} PheCodes per request")
+
+        phecodes = [parse_phecode(value) for value in requested]
+        invalid = [value for value, phecode in zip(requested, phecodes) if phecode is None]
+        if invalid:
+            return error(400, f"Not PheCodes: {invalid[:10]}")
+
+        records, missing = get_records(data, phecodes)
+
+        return flask.jsonify({'grouping' : grouping.lower(), 'results' : records, 'missing' : missing})
+
+    @blueprint.route('/<grouping>/phecodes')
+    def get_phecode_range(grouping):
+        found, failure = get_grouping(grouping)
+        if failure is not None:
+            return failure
+        release_data, disp_type = found
+        data = release_data.grouping_data[disp_type]
+
+        start = parse_phecode(flask.request.args.get('start', 0))
+        stop = parse_phecode(flask.request.args.get('stop', 1000))
+        if start is None or stop is None:
+            return error(400, "start and stop must be PheCodes")
+
+        # Without a range, the top of the hierarchy
+        if 'start' not in flask.request.args and 'stop' not in flask.request.args:
+            return flask.jsonify({'grouping' : grouping.lower(), 'children' : data.hierarchy.children()})
+
+        return flask.jsonify({
+            'grouping' : grouping.lower(),
+            'start' : start,
+            'stop' : stop,
+            'results' : get_table_records(data.hierarchy.range(start, stop)),
+        })
+
+    @blueprint.route('/<grouping>/phecodes/<phecode>')
+    def get_phecode_node(grouping, phecode):
+        found, failure = get_grouping(grouping)
+        if failure is not None:
+            return failure
+        release_data, disp_type = found
+        data = release_data.grouping_data[disp_type]
+
+        try:
+            rollup = data.hierarchy.rollup(phecode)
+        except ValueError as exception:
+            return error(400, str(exception))
+        if rollup is None:
+            return error(404, f"No PheCode under {phecode} in {grouping}")
+
+        return flask.jsonify({
+            'grouping' : grouping.lower(),
+            'rollup' : rollup,
+            'children' : data.hierarchy.children(phecode),
+            'codes' : get_table_records(data.hierarchy.descendants(phecode)),
+        })
+
+    @blueprint.route('/<grouping>/export/<table>')
+    def export_table(grouping, table):
+        found, failure = get_grouping(grouping)
+        if failure is not None:
+            return failure
+        release_data, disp_type = found
+
+        if table not in EXPORT_TABLES:
+            return error(404, f"Unknown table '{table}', expected one of {list(EXPORT_TABLES)}")
+        if table == 'analysis' and release_data.groupings[disp_type].load_analysis_data is None:
+            return error(404, f"Release '{release_data.name}' has no analysis tables")
+
+        file_format = flask.request.args.get('format', 'csv')
+        if file_format not in export.FORMATS:
+            return error(400, f"Unknown format '{file_format}', expected one of {list(export.FORMATS)}")
+        if file_format == 'parquet' and not export.has_parquet():
+            return error(501, "Parquet export needs pyarrow installed on the server")
+
+        query = get_export_query(release_data, disp_type, table)
+        positions = query.positions(
+            flask.request.args.get('filter_query', ''),
+            parse_sort_by(flask.request.args.getlist('sort_by'))
+        )
+
+        return flask.Response(
+            flask.stream_with_context(export.iter_export(query.view_data, positions, file_format)),
+            mimetype = export.FORMATS[file_format],
+            headers = {'Content-Disposition' : f"attachment; filename={grouping.lower()}_{table}.{file_format}"}
+        )
+
+    return blueprint
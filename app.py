@@ -4,10 +4,6 @@ import pathlib
 import os
 import math
 from random import randint
-import pandas as pd
-
-# Plotting bits
-import plotly.express as px
 
 ## Dash components
 import dash
@@ -22,15 +18,31 @@ import flask
 # Local imports
 import components
 import tab_populator
+import groupings
+import figure_cache
+import figure_store
+import table_query
+import http_caching
+import api
+import releases
+import leaderboard
 
 ## App setup
 # Make sure not to change this file name or the variable names below,
 # the template is configured to execute 'server' on 'app.py'
 app = dash.Dash(
-    __name__, meta_tags=[{"name": "viewport", "content": "width=device-width"}]
+    __name__, meta_tags=[{"name": "viewport", "content": "width=device-width"}],
+    # Tab contents are rendered on demand, so their components are not in the initial layout
+    suppress_callback_exceptions = True,
+    # Brotli or gzip, whichever the browser accepts (Flask-Compress)
+    compress = True
 )
 app.title = 'UKB Disparities Atlas'
 server = app.server
+server.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+
+# ETags and Cache-Control for the layout and the JSON API
+http_caching.init_app(server, app.config.routes_pathname_prefix, path_prefixes = [api.API_PREFIX])
 
 # server = flask.Flask(__name__)
 # server.secret_key = os.environ.get('secret_key', str(randint(0, 1000000)))
@@ -43,174 +55,45 @@ server = app.server
 # Getting paths
 # get relative data folder
 PATH = pathlib.Path(__file__).parent
-DATA_PATH = PATH.joinpath("data").resolve()
-
-'''
-First, we'll process the view tables ( these tables will populate the searchable 
-tables from which a trait will be chosen ).
-
-This will have to be done for each type of disparity.
-'''
-
-## Grouping - Sex
-sex_table_data = pd.read_csv(DATA_PATH.joinpath("sex_selection_table.txt"), sep = '\t')
-sex_table_data.loc[:, 'Variance'] = 0.5*(sex_table_data['Difference'] ** 2)
-sex_table_data.loc[:, 'Variance'] = sex_table_data.loc[:, 'Variance'].round(2)
-
-sex_table_data.loc[:, 'Difference'] = sex_table_data.loc[:, 'Difference'].round(2)
-
-sex_table_data.columns = ['Phecode', 'Disease', 'Difference', 'Variance']
-sex_table_data = sex_table_data.loc[:, ['Disease', 'Phecode', 'Variance', 'Difference']]
-
-sex_table_data['id'] = sex_table_data['Disease']
-sex_table_data.set_index('id', inplace = True, drop = False)
-sex_table_data = sex_table_data.sort_values(by = ['Variance'], ascending = False)
-
-## Grouping - Age
-age_table_data = pd.read_csv(DATA_PATH.joinpath("age_selection_table.txt"), sep = '\t')
-age_table_data.loc[:, 'Maximum Difference'] = age_table_data.loc[:, 'Maximum Difference'].round(2)
-
-age_table_data.columns = ['Phecode', 'Disease', 'Variance', 'Maximum Difference']
-age_table_data = age_table_data.loc[:, ['Disease', 'Phecode', 'Variance', 'Maximum Difference']]
-
-age_table_data['id'] = age_table_data['Disease']
-age_table_data.set_index('id', inplace = True, drop = False)
-age_table_data = age_table_data.sort_values(by = ['Variance'], ascending = False)
-
-## Grouping - Ethnic Group
-ethnic_table_data = pd.read_csv(DATA_PATH.joinpath("ethnic_selection_table.txt"), sep = '\t')
-ethnic_table_data.loc[:, 'Maximum Difference'] = ethnic_table_data.loc[:, 'Maximum Difference'].round(2)
-
-ethnic_table_data.columns = ['Phecode', 'Disease', 'Variance', 'Maximum Difference']
-ethnic_table_data = ethnic_table_data.loc[:, ['Disease', 'Phecode', 'Variance', 'Maximum Difference']]
-
-ethnic_table_data['id'] = ethnic_table_data['Disease']
-ethnic_table_data.set_index('id', inplace = True, drop = False)
-ethnic_table_data = ethnic_table_data.sort_values(by = ['Variance'], ascending = False)
-
-## Grouping - Socio-economic status
-ses_table_data = pd.read_csv(DATA_PATH.joinpath("ses_selection_table.txt"), sep = '\t')
-ses_table_data.loc[:, 'Maximum Difference'] = ses_table_data.loc[:, 'Maximum Difference'].round(2)
-
-ses_table_data.columns = ['Phecode', 'Disease', 'Variance', 'Maximum Difference']
-ses_table_data = ses_table_data.loc[:, ['Disease', 'Phecode', 'Variance', 'Maximum Difference']]
-
-ses_table_data['id'] = ses_table_data['Disease']
-ses_table_data.set_index('id', inplace = True, drop = False)
-ses_table_data = ses_table_data.sort_values(by = ['Variance'], ascending = False)
 
 '''
-Next, we'll process data for the prevalence tables
+The releases that can be browsed (see releases.py). Each one is loaded on
+first use: its selection, prevalence and plotting tables for every grouping,
+indexed once so that callbacks never have to scan the tables. The default
+release is loaded here, so gunicorn workers share it.
 '''
-## Grouping - Sex
-sex_prev_data = pd.read_csv(DATA_PATH.joinpath("sex_prev_table.txt"), sep = '\t')
-
-sex_prev_data = sex_prev_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
-
-sex_prev_data['id'] = sex_prev_data['Disease']
-sex_prev_data.set_index('id', inplace = True, drop = False)
-sex_prev_data = sex_prev_data.sort_values(by = ['Male'], ascending = False)
-
-## Grouping - Age
-age_prev_data = pd.read_csv(DATA_PATH.joinpath("age_prev_table.txt"), sep = '\t')
 
-age_prev_data = age_prev_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
-age_prev_data = age_prev_data.loc[:, [colname for colname in age_prev_data.columns if colname != '30-39']]
+release_registry = releases.ReleaseRegistry()
+release_registry.get()
 
-age_prev_data['id'] = age_prev_data['Disease']
-age_prev_data.set_index('id', inplace = True, drop = False)
-age_prev_data = age_prev_data.sort_values(by = ['70-79'], ascending = False)
+SEARCH_RESULTS = 8
+# Seconds of typing pause before the query is sent
+SEARCH_DEBOUNCE = 0.25
 
-## Grouping - Ethnic Group
-ethnic_prev_data = pd.read_csv(DATA_PATH.joinpath("ethnic_prev_table.txt"), sep = '\t')
+# Top-k phenotypes across every grouping, after the grouping tabs
+LEADERBOARD_TAB = 'leaderboard_tab'
 
-ethnic_prev_data = ethnic_prev_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+# JSON API for pipelines, served from the same tables (see api.py)
+server.register_blueprint(api.create_blueprint(release_registry))
 
-ethnic_prev_data['id'] = ethnic_prev_data['Disease']
-ethnic_prev_data.set_index('id', inplace = True, drop = False)
-ethnic_prev_data = ethnic_prev_data.sort_values(by = ['Asian (all)'], ascending = False)
+# Caching built figures, keyed by ((release, grouping), phenotype)
+FIGURE_CACHE_SIZE = int(os.environ.get('FIGURE_CACHE_SIZE', 512))
+disp_figures = figure_cache.FigureCache(maxsize = FIGURE_CACHE_SIZE)
 
-## Grouping - Socio-economic status
-ses_prev_data = pd.read_csv(DATA_PATH.joinpath("ses_prev_table.txt"), sep = '\t')
-ses_prev_data.columns = ['Phenotype', 'PheCode', 'First Quintile of Deprivation', 'Second Quintile of Deprivation', 'Third Quintile of Deprivation', 'Fourth Quintile of Deprivation' ,'Fifth Quintile of Deprivation']
+# Drawing the bars in the browser instead of on the server (opt-in)
+CLIENTSIDE_FIGURES = os.environ.get('CLIENTSIDE_FIGURES', '') == '1'
 
-ses_prev_data = ses_prev_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+# Sending only the changed bars and axis range on each click; set to 0 to
+# send whole figures (served from the figure store and cache) instead
+FIGURE_PATCHES = os.environ.get('FIGURE_PATCHES', '1') == '1'
 
-ses_prev_data['id'] = ses_prev_data['Disease']
-ses_prev_data.set_index('id', inplace = True, drop = False)
-ses_prev_data = ses_prev_data.sort_values(by = ['Fifth Quintile of Deprivation'], ascending = False)
-
-
-'''
-Fianlly, we process data for visualization.
-'''
-
-## Grouping - Sex
-sex_plotting_data = pd.read_csv(DATA_PATH.joinpath("sex_plotting.txt"), sep = '\t')
-sex_plotting_data['id'] = sex_plotting_data['Phenotype']
-sex_plotting_data.set_index('id', inplace = True, drop = False)
-sex_plotting_data.columns = ['PheCode', 'Phenotype', 'Trait', 'Prevalence', 'Cases', 'Controls', 'id']
-sex_plotting_data = sex_plotting_data.astype({'Cases': 'int32', 'Controls' : 'int32'})
-sex_plotting_data['Pretty_cases'] = sex_plotting_data['Cases'].map("{:,}".format)
-sex_plotting_data['Pretty_controls'] = sex_plotting_data['Controls'].map("{:,}".format)
-sex_plotting_data.loc[sex_plotting_data['Trait'] == 'Total', 'Trait'] = 'Overall'
-
-## Grouping - Age
-age_plotting_data = pd.read_csv(DATA_PATH.joinpath("age_plotting.txt"), sep = '\t')
-age_plotting_data['id'] = age_plotting_data['Phenotype']
-age_plotting_data.set_index('id', inplace = True, drop = False)
-age_plotting_data.columns = ['PheCode', 'Phenotype', 'Trait', 'Prevalence', 'Cases', 'Controls', 'id']
-age_plotting_data = age_plotting_data.loc[age_plotting_data['Trait'] != '30-39', :]
-age_plotting_data = age_plotting_data.astype({'Cases': 'int32', 'Controls' : 'int32'})
-age_plotting_data['Pretty_cases'] = age_plotting_data['Cases'].map("{:,}".format)
-age_plotting_data['Pretty_controls'] = age_plotting_data['Controls'].map("{:,}".format)
-age_plotting_data.loc[age_plotting_data['Trait'] == 'Total', 'Trait'] = 'Overall'
-
-## Grouping - Ethnic Group
-ethnic_plotting_data = pd.read_csv(DATA_PATH.joinpath("ethnic_plotting.txt"), sep = '\t')
-ethnic_plotting_data['id'] = ethnic_plotting_data['Phenotype']
-ethnic_plotting_data.set_index('id', inplace = True, drop = False)
-ethnic_plotting_data.columns = ['PheCode', 'Phenotype', 'Trait', 'Prevalence', 'Cases', 'Controls', 'id']
-ethnic_plotting_data = ethnic_plotting_data.astype({'Cases': 'int32', 'Controls' : 'int32'})
-ethnic_plotting_data['Pretty_cases'] = ethnic_plotting_data['Cases'].map("{:,}".format)
-ethnic_plotting_data['Pretty_controls'] = ethnic_plotting_data['Controls'].map("{:,}".format)
-ethnic_plotting_data.loc[ethnic_plotting_data['Trait'] == 'Any other white background', 'Trait'] = 'Other White'
-ethnic_plotting_data.loc[ethnic_plotting_data['Trait'] == 'Any other mixed background', 'Trait'] = 'Other Mixed'
-ethnic_plotting_data.loc[ethnic_plotting_data['Trait'] == 'Any other Black background', 'Trait'] = 'Other Black'
-ethnic_plotting_data.loc[ethnic_plotting_data['Trait'] == 'Any other Asian background', 'Trait'] = 'Other Asian'
-ethnic_plotting_data = ethnic_plotting_data.loc[~ethnic_plotting_data['Trait'].isin(['Prefer not to answer', 'Do not know', 'Other ethnic group', 'Chinese (all)']),:]
-ethnic_plotting_data.loc[ethnic_plotting_data['Trait'] == 'Total', 'Trait'] = 'Overall'
-
-## Grouping - Socio-economic status
-ses_plotting_data = pd.read_csv(DATA_PATH.joinpath("ses_plotting.txt"), sep = '\t')
-ses_plotting_data['id'] = ses_plotting_data['Phenotype']
-ses_plotting_data.set_index('id', inplace = True, drop = False)
-ses_plotting_data.columns = ['PheCode', 'Phenotype', 'Trait', 'Prevalence', 'Cases', 'Controls', 'id']
-ses_plotting_data = ses_plotting_data.astype({'Cases': 'int32', 'Controls' : 'int32'})
-ses_plotting_data['Pretty_cases'] = ses_plotting_data['Cases'].map("{:,}".format)
-ses_plotting_data['Pretty_controls'] = ses_plotting_data['Controls'].map("{:,}".format)
-ses_plotting_data.loc[ses_plotting_data['Trait'] == '1', 'Trait'] = 'First Quintile of Deprivation<br>(Least Deprived)'
-ses_plotting_data.loc[ses_plotting_data['Trait'] == '2', 'Trait'] = 'Second Quintile of Deprivation'
-ses_plotting_data.loc[ses_plotting_data['Trait'] == '3', 'Trait'] = 'Third Quintile of Deprivation'
-ses_plotting_data.loc[ses_plotting_data['Trait'] == '4', 'Trait'] = 'Fourth Quintile of Deprivation'
-ses_plotting_data.loc[ses_plotting_data['Trait'] == '5', 'Trait'] = 'Fifth Quintile of Deprivation<br>(Most Deprived)'
-ses_plotting_data.loc[ses_plotting_data['Trait'] == 'Total', 'Trait'] = 'Overall'
-
-# Setting default values
-AGE_DEF_TRAIT = 'Essential hypertension'
-ETHNIC_DEF_TRAIT = 'Essential hypertension'
-SES_DEF_TRAIT = 'Tobacco use disorder'
-SEX_DEF_TRAIT = 'Inguinal hernia'
-
-# Storing current selections globally
-CURR_AGE_PREV = {'disease': AGE_DEF_TRAIT, 'cases' : AGE_DEF_TRAIT, 'controls': AGE_DEF_TRAIT, 'prev': AGE_DEF_TRAIT, 'figure': AGE_DEF_TRAIT}
-CURR_AGE_TABLE = {'disease': AGE_DEF_TRAIT, 'cases' : AGE_DEF_TRAIT, 'controls': AGE_DEF_TRAIT, 'prev': AGE_DEF_TRAIT, 'figure': AGE_DEF_TRAIT}
-CURR_SEX_PREV = {'disease': SEX_DEF_TRAIT, 'cases' : SEX_DEF_TRAIT, 'controls': SEX_DEF_TRAIT, 'prev': SEX_DEF_TRAIT, 'figure': SEX_DEF_TRAIT}
-CURR_SEX_TABLE = {'disease': SEX_DEF_TRAIT, 'cases' : SEX_DEF_TRAIT, 'controls': SEX_DEF_TRAIT, 'prev': SEX_DEF_TRAIT, 'figure': SEX_DEF_TRAIT}
-CURR_ETHNIC_PREV = {'disease': ETHNIC_DEF_TRAIT, 'cases' : ETHNIC_DEF_TRAIT, 'controls': ETHNIC_DEF_TRAIT, 'prev': ETHNIC_DEF_TRAIT, 'figure': ETHNIC_DEF_TRAIT}
-CURR_ETHNIC_TABLE = {'disease': ETHNIC_DEF_TRAIT, 'cases' : ETHNIC_DEF_TRAIT, 'controls': ETHNIC_DEF_TRAIT, 'prev': ETHNIC_DEF_TRAIT, 'figure': ETHNIC_DEF_TRAIT}
-CURR_SES_PREV = {'disease': SES_DEF_TRAIT, 'cases' : SES_DEF_TRAIT, 'controls': SES_DEF_TRAIT, 'prev': SES_DEF_TRAIT, 'figure': SES_DEF_TRAIT}
-CURR_SES_TABLE = {'disease': SES_DEF_TRAIT, 'cases' : SES_DEF_TRAIT, 'controls': SES_DEF_TRAIT, 'prev': SES_DEF_TRAIT, 'figure': SES_DEF_TRAIT}
+# Serving prebuilt figures of the default release when `python figure_store.py`
+# has been run. Only whole figures are served from it, so the store is not
+# loaded when figures are patched or drawn in the browser.
+FIGURE_STORE_PATH = os.environ.get('FIGURE_STORE_PATH', str(PATH.joinpath("cache").joinpath("figures.bin")))
+prebuilt_figures = None
+if not FIGURE_PATCHES and not CLIENTSIDE_FIGURES:
+    prebuilt_figures = figure_store.load_figure_store(FIGURE_STORE_PATH, release_registry.releases[release_registry.default])
 
 # Defining style elements
 left_unselected_tab = {
@@ -294,6 +177,82 @@ middle_selected_tab = {
 #################################  VIEW  ######################################
 ###############################################################################
 
+'''
+Tab contents are built on first use and memoized per release, so visitors
+only download the tables and graph of the tab they open.
+'''
+
+def get_tab_layout(release_data, tab_value):
+    return release_data.memoize(('tab', tab_value), lambda: build_tab_layout(release_data, tab_value))
+
+
+def build_tab_layout(release_data, tab_value):
+    if tab_value == LEADERBOARD_TAB:
+        return [
+            tab_populator.get_leaderboard_content(
+                release_data.leaderboard.metrics(),
+                [
+                    {'label' : release_data.groupings[disp_type].label, 'value' : disp_type}
+                    for disp_type in release_data.leaderboard.disp_types
+                ]
+            )
+        ]
+
+    if tab_value not in groupings.GROUPINGS_BY_TAB:
+        return [
+            html.Br(),
+            dcc.Markdown(
+                children = components.ABOUT_US,
+                dangerously_allow_html = True,
+                dedent = False
+            )
+        ]
+
+    disp_type = groupings.GROUPINGS_BY_TAB[tab_value].disp_type
+    if disp_type not in release_data.groupings:
+        return [
+            html.Br(),
+            html.P(
+                f"The {groupings.GROUPINGS_BY_TAB[tab_value].label} grouping is not part of the {release_data.release.label.lower()}.",
+                style = {'textAlign' : 'center'}
+            )
+        ]
+
+    grouping = release_data.groupings[disp_type]
+    data = release_data.grouping_data[disp_type]
+
+    figure = None
+    if FIGURE_PATCHES and not CLIENTSIDE_FIGURES:
+        figure = data.template.figure(data.index.rows(grouping.default_trait))
+
+    layout = [
+        tab_populator.get_tab_content(data.table_data, data.plotting_data, disp_type, figure = figure),
+        tab_populator.get_prev_table_content(data.prev_data, disp_type),
+    ]
+
+    if CLIENTSIDE_FIGURES:
+        layout.append(dcc.Store(id = 'figure_bundle' + disp_type, data = get_figure_bundle(release_data, disp_type)))
+    elif FIGURE_PATCHES:
+        layout.append(dcc.Store(id = 'figure_patch' + disp_type))
+        layout.append(dcc.Store(id = 'figure_styles' + disp_type, data = data.template.styles()))
+
+    return layout
+
+
+def get_figure_bundle(release_data, disp_type):
+    # Everything the browser needs to draw any phenotype of the grouping:
+    # the default phenotype's figure, whose traces and layout are reused as
+    # the template, and the compact arrays of every phenotype
+    grouping = release_data.groupings[disp_type]
+    data = release_data.grouping_data[disp_type]
+
+    bundle = data.index.bundle()
+    bundle['disp_type'] = disp_type
+    bundle['default_trait'] = grouping.default_trait
+    bundle['base'] = data.template.figure(data.index.rows(grouping.default_trait))
+
+    return bundle
+
 app.layout = html.Div(
     [
         dcc.Store(id="aggregate_data"),
@@ -388,217 +347,64 @@ app.layout = html.Div(
                     value = 'about_tab',
                     style = left_unselected_tab,
                     selected_style = left_selected_tab,
-                    children = [
-                        html.Br(),
-                        dcc.Markdown(
-                            children = components.ABOUT_US,
-                            dangerously_allow_html = True,
-                            dedent = False
-                        )
-                    ]
-                ),
-                dcc.Tab(
-                    label = 'Age',
-                    value = 'age_tab',
-                    style = middle_unselected_tab,
-                    selected_style = middle_selected_tab,
-                    children = [
-                        tab_populator.get_tab_content(age_table_data, age_plotting_data, 'Age'),
-
-                        html.Div(
-                            [
-                                html.Div(
-                                    [    
-                                        html.Div(
-                                            [
-                                                html.Div(
-                                                    [
-                                                        html.H5(
-                                                            "Disease Percent Prevalence",
-                                                            className="control_label",
-                                                        ),
-                                                        html.Br(),
-                                                        # Reading in table from our component library
-                                                        components.get_dash_table(age_prev_data, 'AgePrev'),
-
-                                                        html.Br()
-                                                    ],
-                                                
-                                                    className="pretty_container",
-                                                    style = {
-                                                        'borderStyle' : 'none',
-                                                    }
-                                                )
-                                            ],
-                                            className = 'pretty_container',
-                                            style = {
-                                                'width' : '100%'
-                                            }
-                                        ),
-                                    ],
-                                    className = 'container',
-                                    style = {
-                                                'width' : '90%'
-                                            }
-                                    
-                                )
-                            ],
-                            className="row flex-display"
-                        )
-                    ]
-                ),
-                dcc.Tab(
-                    label = 'Ethnicity',
-                    value = 'ethnic_tab',
-                    style = middle_unselected_tab,
-                    selected_style = middle_selected_tab,
-                    children = [
-                        tab_populator.get_tab_content(ethnic_table_data, ethnic_plotting_data, 'Ethnic'),
-
-                         html.Div(
-                            [
-                                html.Div(
-                                    [    
-                                        html.Div(
-                                            [
-                                                html.Div(
-                                                    [
-                                                        html.H5(
-                                                            "Disease Percent Prevalence",
-                                                            className="control_label",
-                                                        ),
-                                                        html.Br(),
-                                                        # Reading in table from our component library
-                                                        components.get_dash_table(ethnic_prev_data, 'EthnicPrev'),
-
-                                                        html.Br()
-                                                    ],
-                                                
-                                                    className="pretty_container",
-                                                    style = {
-                                                        'borderStyle' : 'none',
-                                                    }
-                                                )
-                                            ],
-                                            className = 'pretty_container',
-                                            style = {
-                                                'width' : '100%'
-                                            }
-                                        ),
-                                    ],
-                                    className = 'container',
-                                    style = {
-                                                'width' : '90%'
-                                            }
-                                    
-                                )
-                            ],
-                            className="row flex-display"
-                        )
-                    ]
                 ),
+            ] + [
                 dcc.Tab(
-                    label = 'Sex',
-                    value = 'sex_tab',
+                    label = grouping.label,
+                    value = grouping.tab_value,
                     style = middle_unselected_tab,
                     selected_style = middle_selected_tab,
-                    children = [
-                        tab_populator.get_tab_content(sex_table_data, sex_plotting_data, 'Sex'),
-
-                         html.Div(
-                            [
-                                html.Div(
-                                    [    
-                                        html.Div(
-                                            [
-                                                html.Div(
-                                                    [
-                                                        html.H5(
-                                                            "Disease Percent Prevalence",
-                                                            className="control_label",
-                                                        ),
-                                                        html.Br(),
-                                                        # Reading in table from our component library
-                                                        components.get_dash_table(sex_prev_data, 'SexPrev'),
-
-                                                        html.Br()
-                                                    ],
-                                                
-                                                    className="pretty_container",
-                                                    style = {
-                                                        'borderStyle' : 'none',
-                                                    }
-                                                )
-                                            ],
-                                            className = 'pretty_container',
-                                            style = {
-                                                'width' : '100%'
-                                            }
-                                        ),
-                                    ],
-                                    className = 'container',
-                                    style = {
-                                                'width' : '90%'
-                                            }
-                                    
-                                )
-                            ],
-                            className="row flex-display"
-                        )
-                    ]
-                ),
+                )
+                for grouping in groupings.GROUPINGS
+            ] + [
                 dcc.Tab(
-                    label = 'Socioeconomic',
-                    value = 'ses_tab',
+                    label = 'Leaderboard',
+                    value = LEADERBOARD_TAB,
                     style = right_unselected_tab,
                     selected_style = right_selected_tab,
-                    children = [
-                        tab_populator.get_tab_content(ses_table_data, ses_plotting_data, 'SES'),
-
-                         html.Div(
-                            [
-                                html.Div(
-                                    [    
-                                        html.Div(
-                                            [
-                                                html.Div(
-                                                    [
-                                                        html.H5(
-                                                            "Disease Percent Prevalence",
-                                                            className="control_label",
-                                                        ),
-                                                        html.Br(),
-                                                        # Reading in table from our component library
-                                                        components.get_dash_table(ses_prev_data, 'SESPrev'),
-
-                                                        html.Br()
-                                                    ],
-                                                
-                                                    className="pretty_container",
-                                                    style = {
-                                                        'borderStyle' : 'none',
-                                                    }
-                                                )
-                                            ],
-                                            className = 'pretty_container',
-                                            style = {
-                                                'width' : '100%'
-                                            }
-                                        ),
-                                    ],
-                                    className = 'container',
-                                    style = {
-                                                'width' : '90%'
-                                            }
-                                    
-                                )
-                            ],
-                            className="row flex-display"
-                        )
-                    ]
                 ),
             ]
         ),
+
+        # Data release, kept for the browser session, and the global phenotype
+        # search, which shows the chosen phenotype in the open tab
+        html.Div(
+            [
+                dcc.Dropdown(
+                    id = 'release',
+                    options = release_registry.options(),
+                    value = release_registry.default,
+                    clearable = False,
+                    searchable = False,
+                    persistence = True,
+                    persistence_type = 'session',
+                    style = {'marginBottom' : '1rem'}
+                ),
+                dcc.Input(
+                    id = 'phenotype_search',
+                    type = 'text',
+                    placeholder = 'Search phenotypes or PheCodes',
+                    autoComplete = 'off',
+                    debounce = SEARCH_DEBOUNCE,
+                    style = {'width' : '100%'}
+                ),
+                dcc.RadioItems(
+                    id = 'phenotype_search_results',
+                    options = [],
+                    labelStyle = {'display' : 'block', 'cursor' : 'pointer'}
+                ),
+                # The last picked hit, see pick_search_result
+                dcc.Store(id = 'phenotype_search_pick'),
+            ],
+            className = 'pretty_container',
+            style = {'width' : '50%', 'margin' : '2rem auto 0 auto'}
+        ),
+
+        # Only the selected tab is rendered, see render_tab below
+        html.Div(
+            id = 'tab_content',
+            children = get_tab_layout(release_registry.get(), 'about_tab')
+        ),
     ],
     id="mainContainer",
     style={"display": "flex", "flex-direction": "column"},
@@ -620,529 +426,311 @@ def human_format(num):
 
 
 
-# Populating information tiles
-@app.callback(
-    Output('disease_textSex', 'children'),
-    [
-        Input('datatable-row-idsSex', 'active_cell'),
-        Input('datatable-row-idsSexPrev', 'active_cell'),
-    ]
-    )
-def update_disease_name(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_SEX_PREV
-    global CURR_SEX_TABLE
-    
-    curr_prev = CURR_SEX_PREV['disease'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_SEX_TABLE['disease'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_SEX_TABLE['disease'] else curr_prev
-
-    # Updating for next round
-    CURR_SEX_TABLE['disease'] = curr_table
-    CURR_SEX_PREV['disease'] = curr_prev
-
-    return f"{active_row_id} ({(sex_table_data.loc[sex_table_data['Disease'] == active_row_id, 'Phecode'].values[0])})"
+def get_active_row_id(disp_type, active_cell, prev_cell, searched, default_trait):
+    # The table (or search box) that fired the callback decides which
+    # phenotype is shown. Deriving this from the request keeps the callbacks
+    # free of server-side state, so any worker or thread can answer any click.
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
 
-@app.callback(
-    Output('disease_textAge', 'children'),
-    [
-        Input('datatable-row-idsAge', 'active_cell'),
-        Input('datatable-row-idsAgePrev', 'active_cell'),
-    ]
-    )
-def update_disease_name(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_AGE_PREV
-    global CURR_AGE_TABLE
-    
-    curr_prev = CURR_AGE_PREV['disease'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_AGE_TABLE['disease'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_AGE_TABLE['disease'] else curr_prev
+    if searched is not None and 'phenotype_search_pick.data' in triggered:
+        return searched
+    if prev_cell is not None and 'datatable-row-ids' + disp_type + 'Prev.active_cell' in triggered:
+        return prev_cell['row_id']
+    if active_cell is not None:
+        return active_cell['row_id']
+    if prev_cell is not None:
+        return prev_cell['row_id']
+    # A tab opened after a search shows the searched phenotype
+    if searched is not None:
+        return searched
 
-    # Updating for next round
-    CURR_AGE_TABLE['disease'] = curr_table
-    CURR_AGE_PREV['disease'] = curr_prev
+    return default_trait
 
-    return f"{active_row_id} ({(age_table_data.loc[age_table_data['Disease'] == active_row_id, 'Phecode'].values[0])})"
 
+# Rendering the selected tab of the selected release
 @app.callback(
-    Output('disease_textEthnic', 'children'),
+    Output('tab_content', 'children'),
     [
-        Input('datatable-row-idsEthnic', 'active_cell'),
-        Input('datatable-row-idsEthnicPrev', 'active_cell'),
-    ]
+        Input('disparity_tabs', 'value'),
+        Input('release', 'value'),
+    ],
+    prevent_initial_call = True
     )
-def update_disease_name(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_ETHNIC_PREV
-    global CURR_ETHNIC_TABLE
-    
-    curr_prev = CURR_ETHNIC_PREV['disease'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_ETHNIC_TABLE['disease'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_ETHNIC_TABLE['disease'] else curr_prev
+def render_tab(tab_value, release):
+    return get_tab_layout(release_registry.get(release), tab_value)
 
-    # Updating for next round
-    CURR_ETHNIC_TABLE['disease'] = curr_table
-    CURR_ETHNIC_PREV['disease'] = curr_prev
-
-    return f"{active_row_id} ({(ethnic_table_data.loc[ethnic_table_data['Disease'] == active_row_id, 'Phecode'].values[0])})"
 
+# Typeahead search
 @app.callback(
-    Output('disease_textSES', 'children'),
+    Output('phenotype_search_results', 'options'),
     [
-        Input('datatable-row-idsSES', 'active_cell'),
-        Input('datatable-row-idsSESPrev', 'active_cell'),
-    ]
-    )
-def update_disease_name(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_SES_PREV
-    global CURR_SES_TABLE
-    
-    curr_prev = CURR_SES_PREV['disease'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_SES_TABLE['disease'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_SES_TABLE['disease'] else curr_prev
-
-    # Updating for next round
-    CURR_SES_TABLE['disease'] = curr_table
-    CURR_SES_PREV['disease'] = curr_prev
-
-    return f"{active_row_id} ({(ses_table_data.loc[ses_table_data['Disease'] == active_row_id, 'Phecode'].values[0])})"
-
-### Sex
-@app.callback(
-    Output('caseTextSex', 'children'),
+        Input('phenotype_search', 'value'),
+        Input('release', 'value'),
+    ],
     [
-        Input('datatable-row-idsSex', 'active_cell'),
-        Input('datatable-row-idsSexPrev', 'active_cell'),
-    ]
+        State('phenotype_search_results', 'options'),
+    ],
+    prevent_initial_call = True
     )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_SEX_PREV
-    global CURR_SEX_TABLE
-    
-    curr_prev = CURR_SEX_PREV['cases'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_SEX_TABLE['cases'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_SEX_TABLE else curr_prev
-
-    # Updating for next round
-    CURR_SEX_TABLE['cases'] = curr_table
-    CURR_SEX_PREV['cases'] = curr_prev
-
-    # Null value
-    cases = 0
-    cases = sex_plotting_data[(sex_plotting_data.Phenotype == active_row_id) & (sex_plotting_data.Trait == "Overall")].Cases.unique()[0]
-    # return human_format(int(cases))
-    return format(cases, ',d')
-
-@app.callback(
-    Output('controlTextSex', 'children'),
-    [
-        Input('datatable-row-idsSex', 'active_cell'),
-        Input('datatable-row-idsSexPrev', 'active_cell'),
+def update_search_results(query, release, shown):
+    # Runs as the user types, once they pause for SEARCH_DEBOUNCE
+    search_index = release_registry.get(release).search_index
+    options = [
+        {'label' : f"{phenotype} ({phecode})", 'value' : phenotype}
+        for phenotype, phecode in search_index.search(query, limit = SEARCH_RESULTS)
     ]
-    )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_SEX_PREV
-    global CURR_SEX_TABLE
-    
-    curr_prev = CURR_SEX_PREV['controls'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_SEX_TABLE['controls'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_SEX_TABLE['controls'] else curr_prev
-
-    # Updating for next round
-    CURR_SEX_TABLE['controls'] = curr_table
-    CURR_SEX_PREV['controls'] = curr_prev
-    
-    controls = sex_plotting_data[(sex_plotting_data.Phenotype == active_row_id) & (sex_plotting_data.Trait == "Overall")].Controls.unique()[0]
-    # return human_format(int(controls))
-    return format(controls, ',d')
+    return dash.no_update if options == shown else options
 
 
+# A picked hit is handed to the tabs through phenotype_search_pick and the
+# choice is cleared, so the same hit can be picked again after a table click
 @app.callback(
-    Output('prevalenceTextSex', 'children'),
     [
-        Input('datatable-row-idsSex', 'active_cell'),
-        Input('datatable-row-idsSexPrev', 'active_cell'),
-    ]
-    )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_SEX_PREV
-    global CURR_SEX_TABLE
-    
-    curr_prev = CURR_SEX_PREV['prev'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_SEX_TABLE['prev'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_SEX_TABLE['prev'] else curr_prev
-
-    # Updating for next round
-    CURR_SEX_TABLE['prev'] = curr_table
-    CURR_SEX_PREV['prev'] = curr_prev
-    
-    prevalence = sex_plotting_data[(sex_plotting_data.Phenotype == active_row_id) & (sex_plotting_data.Trait == "Overall")].Prevalence.unique()[0]
-    return str(prevalence) + "%"
-
-
-## Age
-@app.callback(
-    Output('caseTextAge', 'children'),
+        Output('phenotype_search_pick', 'data'),
+        Output('phenotype_search_results', 'value'),
+    ],
     [
-        Input('datatable-row-idsAge', 'active_cell'),
-        Input('datatable-row-idsAgePrev', 'active_cell'),
-    ]
-    )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_AGE_PREV
-    global CURR_AGE_TABLE
-    
-    curr_prev = CURR_AGE_PREV['cases'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_AGE_TABLE['cases'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_AGE_TABLE['cases'] else curr_prev
-
-    # Updating for next round
-    CURR_AGE_TABLE['cases'] = curr_table
-    CURR_AGE_PREV['cases'] = curr_prev
-
-    # Null value
-    cases = 0
-    cases = age_plotting_data[(age_plotting_data.Phenotype == active_row_id) & (age_plotting_data.Trait == "Overall")].Cases.unique()[0]
-    # return human_format(int(cases))
-    return format(cases, ',d')
-
-@app.callback(
-    Output('controlTextAge', 'children'),
+        Input('phenotype_search_results', 'value'),
+    ],
     [
-        Input('datatable-row-idsAge', 'active_cell'),
-        Input('datatable-row-idsAgePrev', 'active_cell'),
-    ]
+        State('phenotype_search_pick', 'data'),
+    ],
+    prevent_initial_call = True
     )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_AGE_PREV
-    global CURR_AGE_TABLE
-    
-    curr_prev = CURR_AGE_PREV['controls'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_AGE_TABLE['controls'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_AGE_TABLE['controls'] else curr_prev
-
-    # Updating for next round
-    CURR_AGE_TABLE['controls'] = curr_table
-    CURR_AGE_PREV['controls'] = curr_prev
-    
-    controls = age_plotting_data[(age_plotting_data.Phenotype == active_row_id) & (age_plotting_data.Trait == "Overall")].Controls.unique()[0]
-    # return human_format(int(controls))
-    return format(controls, ',d')
+def pick_search_result(picked, pick):
+    if picked is None:
+        return dash.no_update, dash.no_update
+    return {'phenotype' : picked, 'picks' : (pick or {}).get('picks', 0) + 1}, None
 
-@app.callback(
-    Output('prevalenceTextAge', 'children'),
-    [
-        Input('datatable-row-idsAge', 'active_cell'),
-        Input('datatable-row-idsAgePrev', 'active_cell'),
-    ]
-    )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_AGE_PREV
-    global CURR_AGE_TABLE
-    
-    curr_prev = CURR_AGE_PREV['prev'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_AGE_TABLE['prev'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_AGE_TABLE['prev'] else curr_prev
-
-    # Updating for next round
-    CURR_AGE_TABLE['prev'] = curr_table
-    CURR_AGE_PREV['prev'] = curr_prev
-    
-    prevalence = age_plotting_data[(age_plotting_data.Phenotype == active_row_id) & (age_plotting_data.Trait == "Overall")].Prevalence.unique()[0]
-    return str(prevalence) + "%"
-
-
-## Ethnic
-@app.callback(
-    Output('caseTextEthnic', 'children'),
-    [
-        Input('datatable-row-idsEthnic', 'active_cell'),
-        Input('datatable-row-idsEthnicPrev', 'active_cell'),
-    ]
-    )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_ETHNIC_PREV
-    global CURR_ETHNIC_TABLE
-    
-    curr_prev = CURR_ETHNIC_PREV['cases'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_ETHNIC_TABLE['cases'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_ETHNIC_TABLE['cases'] else curr_prev
-
-    # Updating for next round
-    CURR_ETHNIC_TABLE['cases'] = curr_table
-    CURR_ETHNIC_PREV['cases'] = curr_prev
-
-    # Null value
-    cases = 0
-    cases = ethnic_plotting_data[(ethnic_plotting_data.Phenotype == active_row_id) & (ethnic_plotting_data.Trait == "Overall")].Cases.unique()[0]
-    # return human_format(int(cases))
-    return format(cases, ',d')
 
+# Searching from Home opens the first disparity tab
 @app.callback(
-    Output('controlTextEthnic', 'children'),
+    Output('disparity_tabs', 'value'),
     [
-        Input('datatable-row-idsEthnic', 'active_cell'),
-        Input('datatable-row-idsEthnicPrev', 'active_cell'),
-    ]
-    )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_ETHNIC_PREV
-    global CURR_ETHNIC_TABLE
-    
-    curr_prev = CURR_ETHNIC_PREV['controls'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_ETHNIC_TABLE['controls'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_ETHNIC_TABLE['controls'] else curr_prev
-
-    # Updating for next round
-    CURR_ETHNIC_TABLE['controls'] = curr_table
-    CURR_ETHNIC_PREV['controls'] = curr_prev
-
-    controls = ethnic_plotting_data[(ethnic_plotting_data.Phenotype == active_row_id) & (ethnic_plotting_data.Trait == "Overall")].Controls.unique()[0]
-    # return human_format(int(controls))
-    return format(controls, ',d')
-
-@app.callback(
-    Output('prevalenceTextEthnic', 'children'),
+        Input('phenotype_search_pick', 'data'),
+    ],
     [
-        Input('datatable-row-idsEthnic', 'active_cell'),
-        Input('datatable-row-idsEthnicPrev', 'active_cell'),
-    ]
+        State('disparity_tabs', 'value'),
+    ],
+    prevent_initial_call = True
     )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_ETHNIC_PREV
-    global CURR_ETHNIC_TABLE
-    
-    curr_prev = CURR_ETHNIC_PREV['prev'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_ETHNIC_TABLE['prev'] if active_cell is None else active_cell['row_id']
+def open_searched_phenotype(pick, tab_value):
+    if pick is None or tab_value in groupings.GROUPINGS_BY_TAB:
+        return dash.no_update
+    return groupings.GROUPINGS[0].tab_value
 
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_ETHNIC_TABLE['prev'] else curr_prev
 
-    # Updating for next round
-    CURR_ETHNIC_TABLE['prev'] = curr_table
-    CURR_ETHNIC_PREV['prev'] = curr_prev
-
-    prevalence = ethnic_plotting_data[(ethnic_plotting_data.Phenotype == active_row_id) & (ethnic_plotting_data.Trait == "Overall")].Prevalence.unique()[0]
-    return str(prevalence) + "%"
-
-## Socio-Economic Status
+# Leaderboard: the top phenotypes across the chosen groupings, and the ranks
+# of the clicked one in every grouping, both read off the release's rank indexes
 @app.callback(
-    Output('caseTextSES', 'children'),
     [
-        Input('datatable-row-idsSES', 'active_cell'),
-        Input('datatable-row-idsSESPrev', 'active_cell'),
-    ]
-    )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_SES_PREV
-    global CURR_SES_TABLE
-    
-    curr_prev = CURR_SES_PREV['cases'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_SES_TABLE['cases'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_SES_TABLE['cases'] else curr_prev
-
-    # Updating for next round
-    CURR_SES_TABLE['cases'] = curr_table
-    CURR_SES_PREV['cases'] = curr_prev
-
-    # Null value
-    cases = 0
-    cases = ses_plotting_data[(ses_plotting_data.Phenotype == active_row_id) & (ses_plotting_data.Trait == "Overall")].Cases.unique()[0]
-    # return human_format(int(cases))
-    return format(cases, ',d')
-
-@app.callback(
-    Output('controlTextSES', 'children'),
+        Output('leaderboard_table', 'data'),
+        Output('leaderboard_table', 'columns'),
+    ],
+    [
+        Input('leaderboard_metric', 'value'),
+        Input('leaderboard_groupings', 'value'),
+        Input('leaderboard_top', 'value'),
+        Input('leaderboard_unique', 'value'),
+    ],
     [
-        Input('datatable-row-idsSES', 'active_cell'),
-        Input('datatable-row-idsSESPrev', 'active_cell'),
+        State('release', 'value'),
     ]
     )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_SES_PREV
-    global CURR_SES_TABLE
-    
-    curr_prev = CURR_SES_PREV['controls'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_SES_TABLE['controls'] if active_cell is None else active_cell['row_id']
+def update_leaderboard(metric, disp_types, top, unique, release):
+    if top is None:
+        return dash.no_update, dash.no_update
 
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_SES_TABLE['controls'] else curr_prev
+    release_data = release_registry.get(release)
+    disp_types = [disp_type for disp_type in disp_types or [] if disp_type in release_data.grouping_data]
+    results = release_data.leaderboard.top(metric, int(top), disp_types, bool(unique))
+    results['Grouping'] = [release_data.groupings[disp_type].label for disp_type in results['Grouping']]
+    results['id'] = results['Disease']
 
-    # Updating for next round
-    CURR_SES_TABLE['controls'] = curr_table
-    CURR_SES_PREV['controls'] = curr_prev
+    return results.to_dict('records'), [components.get_table_column(column) for column in results.columns if column != 'id']
 
-    controls = ses_plotting_data[(ses_plotting_data.Phenotype == active_row_id) & (ses_plotting_data.Trait == "Overall")].Controls.unique()[0]
-    # return human_format(int(controls))
-    return format(controls, ',d')
 
 @app.callback(
-    Output('prevalenceTextSES', 'children'),
     [
-        Input('datatable-row-idsSES', 'active_cell'),
-        Input('datatable-row-idsSESPrev', 'active_cell'),
-    ]
-    )
-def update_disease_title(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_SES_PREV
-    global CURR_SES_TABLE
-    
-    curr_prev = CURR_SES_PREV['prev'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_SES_TABLE['prev'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_SES_TABLE['prev'] else curr_prev
-
-    # Updating for next round
-    CURR_SES_TABLE['prev'] = curr_table
-    CURR_SES_PREV['prev'] = curr_prev
-    
-    prevalence = ses_plotting_data[(ses_plotting_data.Phenotype == active_row_id) & (ses_plotting_data.Trait == "Overall")].Prevalence.unique()[0]
-    return str(prevalence) + "%"
-
-# Populating graphs
-
-# Sex
-@app.callback(
-    Output('disp_graphSex', 'figure'),
+        Output('leaderboard_phenotype', 'children'),
+        Output('leaderboard_ranks', 'data'),
+        Output('leaderboard_ranks', 'columns'),
+    ],
     [
-        Input('datatable-row-idsSex', 'active_cell'),
-        Input('datatable-row-idsSexPrev', 'active_cell')
-    ]
-    )
-def make_figure(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_SEX_PREV
-    global CURR_SEX_TABLE
-    
-    curr_prev = CURR_SEX_PREV['figure'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_SEX_TABLE['figure'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_SEX_TABLE['figure'] else curr_prev
-
-    # Updating for next round
-    CURR_SEX_TABLE['figure'] = curr_table
-    CURR_SEX_PREV['figure'] = curr_prev
-
-    return components.get_sex_disp_plot(sex_plotting_data, active_row_id)
-
-# Age
-@app.callback(
-    Output('disp_graphAge', 'figure'),
+        Input('leaderboard_table', 'active_cell'),
+        Input('leaderboard_table', 'data'),
+    ],
     [
-        Input('datatable-row-idsAge', 'active_cell'),
-        Input('datatable-row-idsAgePrev', 'active_cell')
+        State('release', 'value'),
     ]
     )
-def make_figure(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_AGE_PREV
-    global CURR_AGE_TABLE
-    
-    curr_prev = CURR_AGE_PREV['figure'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_AGE_TABLE['figure'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_AGE_TABLE['figure'] else curr_prev
-
-    # Updating for next round
-    CURR_AGE_TABLE['figure'] = curr_table
-    CURR_AGE_PREV['figure'] = curr_prev
-    
-    return components.get_age_disp_plot(age_plotting_data, active_row_id)
-
-# Ethnic
-
-@app.callback(
-    Output('disp_graphEthnic', 'figure'),
-    [
-        Input('datatable-row-idsEthnic', 'active_cell'),
-        Input('datatable-row-idsEthnicPrev', 'active_cell')
-    ]
+def update_leaderboard_ranks(active_cell, data, release):
+    # The clicked phenotype, or the top one
+    if not data:
+        return "No phenotypes selected", [], []
+    row = active_cell['row'] if active_cell and active_cell['row'] < len(data) else 0
+
+    release_data = release_registry.get(release)
+    ranks = release_data.leaderboard.ranks_of(data[row]['Disease'])
+
+    records = []
+    for record in ranks.to_dict('records'):
+        shown = {'Grouping' : release_data.groupings[record['Grouping']].label}
+        for metric in leaderboard.RANKED:
+            shown[metric] = record[metric]
+            shown[f"{metric} rank"] = f"{record[f'{metric} rank']} of {record[f'{metric} of']}" if record[f"{metric} rank"] else None
+        records.append(shown)
+
+    columns = ['Grouping'] + [column for metric in leaderboard.RANKED for column in (metric, f"{metric} rank")]
+    return f"{data[row]['Disease']} ({data[row]['Phecode']})", records, [components.get_table_column(column) for column in columns]
+
+
+# Serving the visible page of each table
+def register_table_callbacks(table_id, disp_type, table):
+    # `table` is the GroupingData field behind the DataTable
+    @app.callback(
+        [
+            Output('datatable-row-ids' + table_id, 'data'),
+            Output('datatable-row-ids' + table_id, 'page_count'),
+        ],
+        [
+            Input('datatable-row-ids' + table_id, 'page_current'),
+            Input('datatable-row-ids' + table_id, 'page_size'),
+            Input('datatable-row-ids' + table_id, 'sort_by'),
+            Input('datatable-row-ids' + table_id, 'filter_query'),
+        ],
+        [
+            State('release', 'value'),
+        ]
+        )
+    def update_table(page_current, page_size, sort_by, filter_query, release):
+        release_data = release_registry.get(release)
+        if disp_type not in release_data.grouping_data:
+            return dash.no_update, dash.no_update
+
+        query = release_data.memoize(
+            ('table', table_id),
+            lambda: table_query.TableQuery(getattr(release_data.grouping_data[disp_type], table))
+        )
+        return query.page(filter_query, sort_by, page_current, page_size)
+
+    return update_table
+
+
+for grouping in groupings.GROUPINGS:
+    register_table_callbacks(grouping.disp_type, grouping.disp_type, 'table_data')
+    register_table_callbacks(grouping.disp_type + 'Prev', grouping.disp_type, 'prev_data')
+
+
+# Populating information tiles and graphs
+def register_tab_callbacks(disp_type):
+    # One callback per disparity tab: the active phenotype is resolved once
+    # and every output of the tab is returned from the same round-trip.
+    if FIGURE_PATCHES:
+        figure_output = Output('figure_patch' + disp_type, 'data')
+    else:
+        figure_output = Output('disp_graph' + disp_type, 'figure')
+
+    @app.callback(
+        [
+            Output('disease_text' + disp_type, 'children'),
+            Output('caseText' + disp_type, 'children'),
+            Output('controlText' + disp_type, 'children'),
+            Output('prevalenceText' + disp_type, 'children'),
+            figure_output,
+        ],
+        [
+            Input('datatable-row-ids' + disp_type, 'active_cell'),
+            Input('datatable-row-ids' + disp_type + 'Prev', 'active_cell'),
+            Input('phenotype_search_pick', 'data'),
+        ],
+        [
+            State('release', 'value'),
+        ]
+        )
+    def update_tab(active_cell, prev_cell, pick, release):
+        release_data = release_registry.get(release)
+        searched = pick['phenotype'] if pick else None
+        if disp_type not in release_data.grouping_data:
+            return [dash.no_update] * 5
+
+        default_trait = release_data.groupings[disp_type].default_trait
+        index = release_data.grouping_data[disp_type].index
+        template = release_data.grouping_data[disp_type].template
+
+        active_row_id = get_active_row_id(disp_type, active_cell, prev_cell, searched, default_trait)
+        if active_row_id not in index:
+            active_row_id = default_trait
+
+        cases, controls, prevalence = index.overall(active_row_id)
+
+        if FIGURE_PATCHES:
+            figure = template.patch(index.rows(active_row_id))
+        else:
+            figure = None
+            if prebuilt_figures is not None and release_data.name == release_registry.default:
+                figure = prebuilt_figures.get(disp_type, active_row_id)
+            if figure is None:
+                figure = disp_figures.get(
+                    (release_data.name, disp_type), active_row_id, lambda: template.to_json(index.rows(active_row_id))
+                )
+
+        return (
+            f"{active_row_id} ({index.phecode(active_row_id)})",
+            format(cases, ',d'),
+            format(controls, ',d'),
+            str(prevalence) + "%",
+            figure,
+        )
+
+    return update_tab
+
+
+# Merging the patches sent by update_tab into the figure on screen
+def register_patch_callbacks(disp_type):
+    app.clientside_callback(
+        ClientsideFunction(namespace = 'clientside', function_name = 'apply_figure_patch'),
+        Output('disp_graph' + disp_type, 'figure'),
+        [
+            Input('figure_patch' + disp_type, 'data'),
+        ],
+        [
+            State('disp_graph' + disp_type, 'figure'),
+            State('figure_styles' + disp_type, 'data'),
+        ]
     )
-def make_figure(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_ETHNIC_PREV
-    global CURR_ETHNIC_TABLE
-    
-    curr_prev = CURR_ETHNIC_PREV['figure'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_ETHNIC_TABLE['figure'] if active_cell is None else active_cell['row_id']
 
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_ETHNIC_TABLE['figure'] else curr_prev
 
-    # Updating for next round
-    CURR_ETHNIC_TABLE['figure'] = curr_table
-    CURR_ETHNIC_PREV['figure'] = curr_prev
-    
-    return components.get_ethnic_disp_plot(ethnic_plotting_data, active_row_id)
+# Populating information tiles and graphs in the browser, from the bundle
+# shipped with the tab (see assets/disparity_figures.js)
+def register_clientside_tab_callbacks(disp_type):
+    app.clientside_callback(
+        ClientsideFunction(namespace = 'clientside', function_name = 'update_tab'),
+        [
+            Output('disease_text' + disp_type, 'children'),
+            Output('caseText' + disp_type, 'children'),
+            Output('controlText' + disp_type, 'children'),
+            Output('prevalenceText' + disp_type, 'children'),
+            Output('disp_graph' + disp_type, 'figure'),
+        ],
+        [
+            Input('datatable-row-ids' + disp_type, 'active_cell'),
+            Input('datatable-row-ids' + disp_type + 'Prev', 'active_cell'),
+            Input('phenotype_search_pick', 'data'),
+        ],
+        [
+            State('figure_bundle' + disp_type, 'data'),
+        ]
+    )
 
-# Socio-economic status
 
-@app.callback(
-    Output('disp_graphSES', 'figure'),
-    [
-        Input('datatable-row-idsSES', 'active_cell'),
-        Input('datatable-row-idsSESPrev', 'active_cell')
-    ]
-    )
-def make_figure(active_cell, prev_cell):
-    # Using global variables to store older state
-    global CURR_SES_PREV
-    global CURR_SES_TABLE
-    
-    curr_prev = CURR_SES_PREV['figure'] if prev_cell is None else prev_cell['row_id']
-    curr_table = CURR_SES_TABLE['figure'] if active_cell is None else active_cell['row_id']
-
-    # Checking which one changed
-    active_row_id = curr_table if curr_table != CURR_SES_TABLE['figure'] else curr_prev
-
-    # Updating for next round
-    CURR_SES_TABLE['figure'] = curr_table
-    CURR_SES_PREV['figure'] = curr_prev
-    
-    return components.get_ses_disp_plot(ses_plotting_data, active_row_id)
+for grouping in groupings.GROUPINGS:
+    if CLIENTSIDE_FIGURES:
+        register_clientside_tab_callbacks(grouping.disp_type)
+    else:
+        register_tab_callbacks(grouping.disp_type)
+        if FIGURE_PATCHES:
+            register_patch_callbacks(grouping.disp_type)
 
 # Main
 if __name__ == '__main__':
@@ -0,0 +1,124 @@
+if (!window.dash_clientside) {
+  window.dash_clientside = {};
+}
+
+// Inputs last seen on each tab, used to tell which one fired when the
+// clientside callback context is not available
+var lastInputs = {};
+
+// Python's str() of a float, so the tiles read the same as when drawn on the server
+function formatPrevalence(value) {
+  return Number.isInteger(value) ? value.toFixed(1) : String(value);
+}
+
+function sameCell(a, b) {
+  return JSON.stringify(a || null) === JSON.stringify(b || null);
+}
+
+// pick: the last search hit picked, {phenotype, picks}
+function getActiveRowId(bundle, activeCell, prevCell, pick) {
+  var prevId = "datatable-row-ids" + bundle.disp_type + "Prev.active_cell";
+  var context = window.dash_clientside.callback_context;
+  var seen = lastInputs[bundle.disp_type];
+  var searched = pick ? pick.phenotype : null;
+  var prevTriggered, searchTriggered;
+
+  if (context && context.triggered) {
+    var triggered = context.triggered.map(function(trigger) { return trigger.prop_id; });
+    prevTriggered = triggered.indexOf(prevId) >= 0;
+    searchTriggered = triggered.indexOf("phenotype_search_pick.data") >= 0;
+  } else {
+    prevTriggered = seen !== undefined && !sameCell(prevCell, seen.prev);
+    searchTriggered = seen !== undefined && !sameCell(pick, seen.pick);
+  }
+  lastInputs[bundle.disp_type] = {table: activeCell, prev: prevCell, pick: pick};
+
+  if (searched && searchTriggered) {
+    return searched;
+  }
+  if (prevCell && prevTriggered) {
+    return prevCell.row_id;
+  }
+  if (activeCell) {
+    return activeCell.row_id;
+  }
+  if (prevCell) {
+    return prevCell.row_id;
+  }
+  // A tab opened after a search shows the searched phenotype
+  if (searched) {
+    return searched;
+  }
+  return bundle.default_trait;
+}
+
+window.dash_clientside.clientside = Object.assign(window.dash_clientside.clientside || {}, {
+  // Swaps the bars of the base figure for those of the selected phenotype
+  update_tab: function(activeCell, prevCell, pick, bundle) {
+    if (!bundle) {
+      return window.dash_clientside.no_update;
+    }
+
+    var phenotype = getActiveRowId(bundle, activeCell, prevCell, pick);
+    if (!(phenotype in bundle.rows)) {
+      phenotype = bundle.default_trait;
+    }
+    var row = bundle.rows[phenotype];
+    // [PheCode, trait codes, prevalences, cases, controls, error bars above, error bars below]
+    var traits = row[1].map(function(code) { return bundle.traits[code]; });
+    var prevalences = row[2], cases = row[3], controls = row[4];
+    var errorsPlus = row[5], errorsMinus = row[6];
+
+    var data = [];
+    bundle.base.data.forEach(function(trace) {
+      var i = traits.indexOf(trace.name);
+      if (i < 0) {
+        return;
+      }
+      data.push(Object.assign({}, trace, {
+        x: [prevalences[i]],
+        y: [traits[i]],
+        customdata: [[cases[i], controls[i]]],
+        error_x: Object.assign({}, trace.error_x, {array: [errorsPlus[i]], arrayminus: [errorsMinus[i]]})
+      }));
+    });
+
+    var layout = JSON.parse(JSON.stringify(bundle.base.layout));
+    // Up to the end of the longest error bar
+    var upper = prevalences.map(function(prevalence, i) {
+      return Math.round((prevalence + errorsPlus[i]) * 100) / 100;
+    });
+    layout.xaxis.range = [0, Math.max.apply(null, upper)];
+
+    var overall = traits.indexOf("Overall");
+
+    return [
+      phenotype + " (" + row[0] + ")",
+      cases[overall],
+      controls[overall],
+      formatPrevalence(prevalences[overall]) + "%",
+      {data: data, layout: layout}
+    ];
+  },
+
+  // Merges the bars and x-axis range sent by the server into the figure on
+  // screen. Each bar takes the styling of its trace position from `styles`,
+  // which covers every position of the grouping, not only the bars on screen.
+  apply_figure_patch: function(patch, figure, styles) {
+    if (!patch || !figure || !figure.layout) {
+      return window.dash_clientside.no_update;
+    }
+
+    var data = patch.data.map(function(trace, i) {
+      var style = styles && styles[i] ? styles[i] : figure.data[i];
+      return Object.assign({}, style, trace, {
+        error_x: Object.assign({}, style && style.error_x, trace.error_x)
+      });
+    });
+    var layout = Object.assign({}, figure.layout, {
+      xaxis: Object.assign({}, figure.layout.xaxis, {range: patch.range})
+    });
+
+    return {data: data, layout: layout};
+  }
+});
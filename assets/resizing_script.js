@@ -1,7 +1,7 @@
 if (!window.dash_clientside) {
   window.dash_clientside = {};
 }
-window.dash_clientside.clientside = {
+window.dash_clientside.clientside = Object.assign(window.dash_clientside.clientside || {}, {
   resize: function(value) {
     console.log("resizing..."); // for testing
     setTimeout(function() {
@@ -10,4 +10,4 @@ window.dash_clientside.clientside = {
     }, 500);
     return null;
   }
-};
+});
@@ -0,0 +1,481 @@
+# Python imports
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import urllib.request
+
+'''
+Microbenchmarks for the request path of the atlas.
+
+Run with `python benchmark.py` from the repository root. Each benchmark prints
+the mean time per simulated click (or per operation) so numbers can be compared
+before and after a change.
+'''
+
+
+def report(label, seconds, number):
+    print(f"{label:<45}{1e6 * seconds / number:>12.1f} us")
+
+
+def bench_lookup(number = 200):
+    import app
+
+    print("Per-click lookup (PheCode, cases, controls, prevalence, figure rows)")
+    for disp_type, data in app.release_registry.get().grouping_data.items():
+        table_data, plotting_data, index = data.table_data, data.plotting_data, data.index
+        phenotypes = list(table_data['Disease'])
+
+        # Before: one boolean mask over the whole table per output
+        def scan():
+            for active_row_id in phenotypes[:25]:
+                table_data.loc[table_data['Disease'] == active_row_id, 'Phecode'].values[0]
+                overall = (plotting_data.Phenotype == active_row_id) & (plotting_data.Trait == "Overall")
+                plotting_data[overall].Cases.unique()[0]
+                plotting_data[overall].Controls.unique()[0]
+                plotting_data[overall].Prevalence.unique()[0]
+                plotting_data[(plotting_data.Phenotype == active_row_id)]
+
+        # After: dict hits and a positional slice
+        def lookup():
+            for active_row_id in phenotypes[:25]:
+                index.phecode(active_row_id)
+                index.overall(active_row_id)
+                index.rows(active_row_id)
+
+        report(f"  {disp_type} - boolean masks", timeit.timeit(scan, number = number), 25 * number)
+        report(f"  {disp_type} - phenotype index", timeit.timeit(lookup, number = number), 25 * number)
+
+
+def bench_figure(number = 20):
+    import figure_cache
+    import app
+
+    print("Per-click figure (px.bar vs template vs LRU cache hit)")
+    for grouping in app.groupings.GROUPINGS:
+        disp_type, trait = grouping.disp_type, grouping.default_trait
+        index, template = app.release_registry.get().grouping_data[disp_type].index, app.release_registry.get().grouping_data[disp_type].template
+        cache = figure_cache.FigureCache()
+
+        def build():
+            grouping.get_disp_plot(index.rows(trait)).to_json()
+
+        def fill():
+            template.to_json(index.rows(trait))
+
+        def cached():
+            cache.get(disp_type, trait, lambda: template.to_json(index.rows(trait)))
+
+        # Warming the cache so only hits are timed
+        cached()
+
+        report(f"  {disp_type} - px.bar build", timeit.timeit(build, number = number), number)
+        report(f"  {disp_type} - template fill", timeit.timeit(fill, number = 10 * number), 10 * number)
+        report(f"  {disp_type} - cache hit", timeit.timeit(cached, number = number), number)
+
+
+def bench_store(number = 200):
+    import app
+    import figure_store
+
+    store = figure_store.load_figure_store(app.FIGURE_STORE_PATH, app.release_registry.releases[app.release_registry.default])
+    if store is None:
+        print("No current figure store, run `python figure_store.py` first")
+        return
+
+    print("Per-click figure (prebuilt store)")
+    for grouping in app.groupings.GROUPINGS:
+        if grouping.disp_type in store.groupings():
+            read = lambda: store.get(grouping.disp_type, grouping.default_trait)
+            report(f"  {grouping.disp_type} - store read", timeit.timeit(read, number = number), number)
+
+
+def bench_startup(number = 3):
+    import data_loader
+
+    data_path = data_loader.PATH.joinpath("data").joinpath("summary_stats")
+
+    def load_tsv():
+        for load_table in data_loader.TABLE_LOADERS:
+            load_table(data_path, use_cache = False)
+
+    def load_cache():
+        for load_table in data_loader.TABLE_LOADERS:
+            load_table(data_path)
+
+    # Warming the cache so only cache reads are timed
+    load_cache()
+
+    print(f"Loading the {len(data_loader.TABLE_LOADERS)} cleaned tables")
+    report("  TSV + cleaning", timeit.timeit(load_tsv, number = number), number)
+    report("  binary cache", timeit.timeit(load_cache, number = number), number)
+
+    # A worker boot is an import of app in a fresh interpreter
+    print("Worker boot (python -c 'import app')")
+    for label, cache_path in [("TSV", ''), ("binary cache", str(data_loader.CACHE_PATH))]:
+        env = dict(os.environ, TABLE_CACHE_PATH = cache_path)
+        start = time.perf_counter()
+        for _ in range(number):
+            subprocess.run([sys.executable, '-W', 'ignore', '-c', 'import app'], cwd = data_loader.PATH, env = env, check = True)
+        report(f"  {label}", time.perf_counter() - start, number)
+
+
+def read_memory(pid):
+    # Rss, Pss and private (unshared) memory of a process, in kB (Linux only)
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            fields = line.split()
+            if fields[0].rstrip(':') in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                memory[fields[0].rstrip(':')] = int(fields[1])
+
+    return memory['Rss'], memory['Pss'], memory['Private_Clean'] + memory['Private_Dirty']
+
+
+def bench_memory(workers = 4):
+    import data_loader
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    print(f"Per-worker memory, {workers} gunicorn workers (kB)")
+    with tempfile.NamedTemporaryFile('w', suffix = '.py') as empty_config:
+        for label, config in [("no preload", empty_config.name), ("preload + gc.freeze", 'gunicorn.conf.py')]:
+            master = subprocess.Popen(
+                ['gunicorn', '-c', config, '-w', str(workers), '-b', f"127.0.0.1:{port}", 'app:server'],
+                cwd = data_loader.PATH, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL
+            )
+            try:
+                # Waiting for the workers and sending them a few requests each
+                deadline = time.time() + 120
+                while True:
+                    try:
+                        urllib.request.urlopen(f"http://127.0.0.1:{port}/_dash-layout").read()
+                        break
+                    except OSError:
+                        if time.time() > deadline:
+                            raise
+                        time.sleep(0.5)
+                for _ in range(4 * workers):
+                    urllib.request.urlopen(f"http://127.0.0.1:{port}/_dash-layout").read()
+
+                with open(f"/proc/{master.pid}/task/{master.pid}/children") as children:
+                    pids = [int(pid) for pid in children.read().split()]
+
+                usage = [read_memory(pid) for pid in pids]
+                rss, pss, private = [sum(values) / len(values) for values in zip(*usage)]
+                print(f"  {label:<25} RSS {rss:>9.0f}   PSS {pss:>9.0f}   private {private:>9.0f}")
+            finally:
+                master.terminate()
+                master.wait()
+
+
+def bench_dtypes():
+    import groupings
+
+    data_path = groupings.data_loader.PATH.joinpath("data").joinpath("summary_stats")
+
+    print("Plotting table memory, previous layout vs compact layout (kB, deep)")
+    for grouping in groupings.GROUPINGS:
+        compact = grouping.load_plotting_data(data_path)
+
+        # Rebuilding the previous layout: object strings, float64 prevalence,
+        # an 'id' copy of Phenotype as index and column, pre-formatted counts
+        previous = compact.astype({'Phenotype' : object, 'Trait' : object, 'Prevalence' : 'float64'})
+        previous['id'] = previous['Phenotype']
+        previous = previous.set_index('id', drop = False)
+        previous['Pretty_cases'] = previous['Cases'].map("{:,}".format)
+        previous['Pretty_controls'] = previous['Controls'].map("{:,}".format)
+
+        previous_kb = previous.memory_usage(deep = True).sum() / 1024
+        compact_kb = compact.memory_usage(deep = True).sum() / 1024
+        print(f"  {grouping.disp_type:<10}{len(compact):>7} rows {previous_kb:>10.0f} -> {compact_kb:>6.0f}")
+
+
+def bench_api(number = 5):
+    import api
+    import app
+
+    print("Batch of 500 PheCodes")
+    for disp_type, data in app.release_registry.get().grouping_data.items():
+        plotting_data = data.plotting_data
+        phecodes = data.table_data['Phecode'].tolist()[:500]
+
+        # Before: one boolean mask over the plotting table per PheCode
+        def scan():
+            for phecode in phecodes:
+                plotting_data[plotting_data['PheCode'] == phecode]
+
+        def batch():
+            api.get_records(data, phecodes)
+
+        report(f"  {disp_type} - 500 filters", timeit.timeit(scan, number = number), number)
+        report(f"  {disp_type} - indexed batch (with records)", timeit.timeit(batch, number = number), number)
+
+
+def bench_search(number = 1000):
+    import app
+
+    names = list(app.release_registry.get().search_index.phenotypes)
+
+    print("Phenotype search, per query")
+    for query in ('diab', 'type 2 diab', 'hypertensoin', '401'):
+        # Before: substring scan over every name, as the DataTable filter does
+        scan = lambda: [name for name in names if query in name.lower()]
+        search = lambda: app.release_registry.get().search_index.search(query)
+
+        report(f"  '{query}' - substring scan", timeit.timeit(scan, number = number), number)
+        report(f"  '{query}' - index", timeit.timeit(search, number = number), number)
+
+
+def bench_metrics(number = 20):
+    import app
+    import disparity_metrics
+
+    plotting_tables = {disp_type : data.plotting_data for disp_type, data in app.release_registry.get().grouping_data.items()}
+    metrics = disparity_metrics.compute_all(plotting_tables)
+
+    print("Recomputing the disparity metrics of all groupings from counts")
+    report("  all groupings, one pass", timeit.timeit(lambda: disparity_metrics.compute_all(plotting_tables), number = number), number)
+
+    # Agreement with the published tables
+    for disp_type, data in app.release_registry.get().grouping_data.items():
+        published = data.table_data.set_index('Disease')
+        recomputed = metrics[disp_type].set_index('Disease').loc[published.index]
+        difference = 'Difference' if disp_type == 'Sex' else 'Maximum Difference'
+        print(
+            f"  {disp_type:<10}max |Variance - published| {(recomputed['Variance'] - published['Variance']).abs().max():.2f}"
+            f"   max |difference - published| {(recomputed['Maximum Difference'] - published[difference].abs()).abs().max():.2f}"
+        )
+
+
+def bench_stats(number = 20):
+    import app
+    import disparity_stats
+    import groupings
+
+    print("Confidence intervals and p-values of every phenotype")
+    for disp_type, data in app.release_registry.get().grouping_data.items():
+        grouping = groupings.GROUPINGS_BY_TYPE[disp_type]
+        test = grouping.test
+        intervals = timeit.timeit(lambda: disparity_stats.add_intervals(data.plotting_data), number = number)
+        p_values = timeit.timeit(lambda: disparity_stats.compute_p_values(data.plotting_data, test, grouping.bands), number = number)
+        significant = (data.table_data[disparity_stats.P_VALUE] < 0.05).mean()
+        print(
+            f"  {disp_type:<10}{test:<12}intervals {intervals / number * 1000:>6.2f} ms"
+            f"   p-values {p_values / number * 1000:>6.2f} ms   p < 0.05 for {significant:.0%}"
+        )
+
+    # Every bar's prevalence lies within its interval
+    for disp_type, data in app.release_registry.get().grouping_data.items():
+        rows = data.plotting_data
+        prevalence = rows['Prevalence'].astype('float64').round(2)
+        assert ((rows['Lower'] <= prevalence + 0.01) & (prevalence <= rows['Upper'] + 0.01)).all(), disp_type
+
+
+def bench_convert():
+    import convert_legacy
+
+    source = convert_legacy.pathlib.Path(__file__).parent.joinpath("data").joinpath("legacy").joinpath("overall_summary.txt")
+
+    print("Converting the wide legacy summary, by chunk size")
+    outputs = []
+    for chunk_rows in (100, 500, 2000, 100000):
+        output = tempfile.TemporaryDirectory()
+        outputs.append(output)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        convert_legacy.convert(source, output.name, chunk_rows = chunk_rows)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"  {chunk_rows:>6} rows per chunk {seconds * 1000:>8.0f} ms   peak {peak / 1024 ** 2:>6.1f} MB")
+
+    # The chunk size never changes the output
+    first = convert_legacy.pathlib.Path(outputs[0].name)
+    for output in outputs[1:]:
+        for path in first.iterdir():
+            assert path.read_bytes() == convert_legacy.pathlib.Path(output.name).joinpath(path.name).read_bytes(), path.name
+
+    # Same layout as the published legacy tables; the values only differ by
+    # the counts of their later extraction
+    report = convert_legacy.compare_tables(first, source.parent, tolerance = 0.2)
+    for file_name, problems in report.items():
+        assert not {'columns', 'rows', 'PheCode'} & set(problems), (file_name, problems)
+        print(f"  {file_name:<26} {', '.join(problems) if problems else 'matches'}")
+
+    for output in outputs:
+        output.cleanup()
+
+
+def bench_releases():
+    import releases
+
+    registry = releases.ReleaseRegistry()
+    print("Loading each release on first use")
+    for name in registry.releases:
+        start = time.perf_counter()
+        data = registry.get(name)
+        print(f"  {name:<15}{(time.perf_counter() - start) * 1000:>8.0f} ms {data.nbytes / 1024 ** 2:>8.1f} MB (estimated)")
+
+    start = time.perf_counter()
+    registry.get()
+    print(f"  {'loaded again':<15}{(time.perf_counter() - start) * 1e6:>8.1f} us")
+
+    # A budget that only fits one release keeps the one used last
+    budget = max(registry.get(name).nbytes for name in registry.releases)
+    registry = releases.ReleaseRegistry(memory_budget = budget)
+    for name in list(registry.releases) * 2:
+        registry.get(name)
+        assert registry.loaded() == [name], registry.loaded()
+    print(f"  budget of {budget / 1024 ** 2:.1f} MB: {registry.stats()['evictions']} evictions over {registry.stats()['loads']} loads")
+
+
+def bench_diff(number = 20):
+    import disparity_metrics
+    import releases
+    import release_diff
+
+    registry = releases.ReleaseRegistry()
+    old, new = registry.get('legacy'), registry.get('summary_stats')
+
+    start = time.perf_counter()
+    for _ in range(number):
+        diff = release_diff.diff_releases(old, new)
+    report("legacy -> summary_stats diff", time.perf_counter() - start, number)
+
+    # Every PheCode of a grouping is either compared, added or removed
+    for disp_type, grouping_diff in diff.groupings.items():
+        assert len(grouping_diff.changes) + len(grouping_diff.added) == len(new.grouping_data[disp_type].table_data)
+        assert len(grouping_diff.changes) + len(grouping_diff.removed) == len(old.grouping_data[disp_type].table_data)
+
+    # Against a plain merge on PheCode of the metrics recomputed from the counts
+    changes = diff.groupings['SES'].changes
+    metrics = [
+        disparity_metrics.compute_metrics(release.grouping_data['SES'].plotting_data)[['Phecode', 'Variance']]
+        for release in (old, new)
+    ]
+    merged = metrics[0].merge(metrics[1], on = 'Phecode', suffixes = (' old', ' new'))
+    merged = merged.set_index('Phecode').loc[changes['Phecode'].values]
+    assert (merged['Variance new'].values - merged['Variance old'].values).round(2).tolist() == changes['Variance shift'].tolist()
+
+    # Both sides use the same variance, whatever the selection tables publish
+    changes = diff.groupings['Age'].changes.set_index('Phecode')
+    recomputed = disparity_metrics.compute_metrics(old.grouping_data['Age'].plotting_data).set_index('Phecode')
+    assert (changes['Variance old'] == recomputed.loc[changes.index, 'Variance']).all()
+
+    shifts = release_diff.largest_shifts(diff.groupings['Age'].changes, 'Variance', 5)
+    print(f"  largest Age Variance shifts: {', '.join(shifts['Disease'])}")
+
+
+def bench_leaderboard(number = 1000):
+    import pandas as pd
+    import leaderboard
+    import releases
+
+    data = releases.ReleaseRegistry().get()
+    board = data.leaderboard
+
+    start = time.perf_counter()
+    leaderboard.Leaderboard(data.grouping_data)
+    report("rank indexes of every grouping", time.perf_counter() - start, 1)
+
+    for metric, unique in (('Variance', False), ('Variance', True), ('Ratio', False), ('Ratio', True)):
+        start = time.perf_counter()
+        for _ in range(number):
+            results = board.top(metric, 10, unique = unique)
+        report(f"top 10 by {metric}{' (unique)' if unique else ''}", time.perf_counter() - start, number)
+
+        # Same rows as sorting every table, best first
+        frames = []
+        for disp_type, grouping_data in data.grouping_data.items():
+            frame = pd.DataFrame({'Disease' : grouping_data.table_data['Disease'].values, 'Grouping' : disp_type})
+            frame[metric] = board.values[metric][board.grouping_codes == board.disp_types.index(disp_type)]
+            frames.append(frame)
+        expected = pd.concat(frames).sort_values(metric, ascending = False, kind = 'stable')
+        if unique:
+            expected = expected.drop_duplicates('Disease')
+        assert results[metric].tolist() == expected[metric].head(10).tolist()
+
+    start = time.perf_counter()
+    for _ in range(number):
+        ranks = board.ranks_of(phecode = 401.1)
+    report("ranks of one PheCode", time.perf_counter() - start, number)
+
+    # Ranks agree with sorting the selection table
+    table_data = data.grouping_data['Age'].table_data
+    rank = int((table_data['Variance'] > table_data.loc[table_data['Phecode'] == 401.1, 'Variance'].iloc[0]).sum()) + 1
+    assert ranks.loc[ranks['Grouping'] == 'Age', 'Variance rank'].iloc[0] == rank
+
+
+def bench_compression():
+    import app
+
+    client = app.server.test_client()
+    tab_request = lambda tab_value: {
+        'output' : 'tab_content.children',
+        'outputs' : {'id' : 'tab_content', 'property' : 'children'},
+        'inputs' : [
+            {'id' : 'disparity_tabs', 'property' : 'value', 'value' : tab_value},
+            {'id' : 'release', 'property' : 'value', 'value' : app.release_registry.default},
+        ],
+        'changedPropIds' : ['disparity_tabs.value'],
+    }
+
+    # Home is what /_dash-layout embeds, Age is rendered by the tab callback,
+    # a POST that is never revalidated
+    payloads = [
+        ("Home (layout)", True, lambda headers: client.get('/_dash-layout', headers = headers)),
+        ("Age tab", False, lambda headers: client.post('/_dash-update-component', json = tab_request('age_tab'), headers = headers)),
+    ]
+
+    print("Response size by Accept-Encoding (bytes)")
+    for label, validated, fetch in payloads:
+        sizes = {}
+        for encoding in ('identity', 'gzip', 'br'):
+            response = fetch({'Accept-Encoding' : encoding})
+            assert response.status_code == 200, f"{label} answered {response.status_code}"
+            assert response.headers.get('Content-Encoding', 'identity') == encoding, f"{label} not sent as {encoding}"
+            assert bool(response.headers.get('ETag')) == validated, f"{label} ETag: {response.headers.get('ETag')}"
+            sizes[encoding] = len(response.data)
+
+        # Both encodings should shrink these JSON payloads at least threefold
+        assert sizes['gzip'] * 3 < sizes['identity'] and sizes['br'] * 3 < sizes['identity'], f"{label} compresses poorly: {sizes}"
+        print(f"  {label:<20}" + "".join(f"{encoding:>10} {size:>7}" for encoding, size in sizes.items()))
+
+    layout = client.get('/_dash-layout', headers = {'Accept-Encoding' : 'br'})
+    revalidated = client.get('/_dash-layout', headers = {'Accept-Encoding' : 'br', 'If-None-Match' : layout.headers['ETag']})
+    assert revalidated.status_code == 304
+    print(f"  Home revalidation: {revalidated.status_code}, {len(revalidated.data)} bytes")
+
+
+BENCHMARKS = {
+    'lookup': bench_lookup,
+    'figure': bench_figure,
+    'store': bench_store,
+    'startup': bench_startup,
+    'memory': bench_memory,
+    'dtypes': bench_dtypes,
+    'compression': bench_compression,
+    'api': bench_api,
+    'search': bench_search,
+    'metrics': bench_metrics,
+    'stats': bench_stats,
+    'convert': bench_convert,
+    'releases': bench_releases,
+    'diff': bench_diff,
+    'leaderboard': bench_leaderboard,
+}
+
+# Main
+if __name__ == '__main__':
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
@@ -1,61 +1,116 @@
 # Dash imports
 import dash_table
+from dash_table.Format import Format, Scheme
 
 # Plotting bits
 import plotly.express as px
 
-def get_dash_table(view_data, disp_type):
+# Local imports
+import disparity_stats
+import table_query
+
+TABLE_CELL_STYLE = {
+    'borderStyle' : 'none',
+    'height': '4me',
+    # all three widths are needed
+    'minWidth': '2em', 
+    'width': '2em', 
+    'maxWidth': '2em',
+    'whiteSpace': 'normal',
+    'text-align' : 'center',
+    'fontSize': 12, 
+    'font-family': ["Open Sans", "HelveticaNeue", "Helvetica Neue", 'Helvetica', 'Arial', 'sans-serif']
+}
+
+def get_table_column(column):
+    # p-values span hundreds of orders of magnitude, so they are shown in
+    # scientific notation
+    if column == disparity_stats.P_VALUE:
+        return {'name': column, 'id': column, 'deletable': False, 'type': 'numeric', 'format': Format(precision = 3, scheme = Scheme.exponent)}
+    return {'name': column, 'id': column, 'deletable': False}
+
+def get_dash_table(view_data, disp_type, page_size = 5):
+    # Only the first page is embedded in the layout; filtering, sorting and
+    # paging are answered by the server (see table_query.py)
+    first_page, page_count = table_query.TableQuery(view_data).page(page_size = page_size)
+
     my_table = dash_table.DataTable(
                                     # ID
                                     id = 'datatable-row-ids' + disp_type,
 
                                     # Data
-                                    data = view_data.to_dict('records'),
+                                    data = first_page,
                                     columns = [
-                                                {'name': i, 'id': i, 'deletable': False} for i in view_data.columns
+                                                get_table_column(i) for i in view_data.columns
                                                 # omit the id column
                                                 if i != 'id'
                                             ],
                                     # Options
                                     editable = False,
-                                    sort_action="native",
+                                    sort_action='custom',
                                     sort_mode='single',
-                                    page_action='native',
-                                    filter_action = 'native',
+                                    sort_by = [],
+                                    page_action='custom',
+                                    filter_action = 'custom',
+                                    filter_query = '',
                                     page_current= 0,
-                                    page_size= 5,
-                                    virtualization=True,
-
-                                    style_cell={
-                                        'borderStyle' : 'none',
-                                        'height': '4me',
-                                        # all three widths are needed
-                                        'minWidth': '2em', 
-                                        'width': '2em', 
-                                        'maxWidth': '2em',
-                                        'whiteSpace': 'normal',
-                                        'text-align' : 'center',
-                                        'fontSize': 12, 
-                                        'font-family': ["Open Sans", "HelveticaNeue", "Helvetica Neue", 'Helvetica', 'Arial', 'sans-serif']
-                                    },
+                                    page_size= page_size,
+                                    page_count = page_count,
+
+                                    style_cell = TABLE_CELL_STYLE,
                                 )
     
     return my_table
 
-def get_sex_disp_plot(plotting_data, active_row_id):
+def get_leaderboard_table(table_id, columns):
+    # Small tables filled whole by their callbacks, without paging
+    return dash_table.DataTable(
+                                id = table_id,
+                                data = [],
+                                columns = [get_table_column(column) for column in columns],
+                                editable = False,
+                                page_action = 'none',
+                                style_table = {'maxHeight' : '40rem', 'overflowY' : 'auto'},
+                                style_cell = TABLE_CELL_STYLE,
+                            )
+
+def get_plotting_rows(plotting_data):
+    # Turning the compact rows of one phenotype into what the bar charts show:
+    # plain trait labels, prevalence rounded to two decimals and counts with
+    # thousands separators for the hover text. The error bars span the 95%
+    # confidence interval (disparity_stats.add_intervals).
+    prevalence = plotting_data['Prevalence'].astype('float64').round(2)
+    lower = plotting_data['Lower'].astype('float64').round(2)
+    upper = plotting_data['Upper'].astype('float64').round(2)
+
+    return plotting_data.assign(
+        Trait = plotting_data['Trait'].astype(str),
+        Prevalence = prevalence,
+        Upper = upper,
+        Error_plus = (upper - prevalence).clip(lower = 0).round(2),
+        Error_minus = (prevalence - lower).clip(lower = 0).round(2),
+        Pretty_cases = [format(cases, ',d') for cases in plotting_data['Cases']],
+        Pretty_controls = [format(controls, ',d') for controls in plotting_data['Controls']],
+    )
+
+def get_sex_disp_plot(plotting_data):
+    plotting_data = get_plotting_rows(plotting_data)
+
     fig = px.bar(
-                    plotting_data[(plotting_data.Phenotype == active_row_id)], 
+                    plotting_data, 
                     y = 'Trait', 
                     x = 'Prevalence',
+                    error_x = 'Error_plus',
+                    error_x_minus = 'Error_minus',
                     hover_data = ['Pretty_cases', 'Pretty_controls'],
                     color='Trait', 
                     template = "plotly_white", 
                     orientation='h',
                     color_discrete_sequence = [
                         
+                        '#39393A', # Overall
                         '#FC737A', # Female
                         '#1C77C3', # Male
-                        '#39393A', # Overall
                     ]
                 )
 
@@ -83,7 +138,7 @@ def get_sex_disp_plot(plotting_data, active_row_id):
                     )
 
     fig.update_xaxes(
-                        range = [0, max(plotting_data[(plotting_data.Phenotype == active_row_id)].Prevalence)],
+                        range = [0, max(plotting_data.Upper)],
                         title_text = "Percent Prevalence",
                         automargin = True
                     )
@@ -100,12 +155,16 @@ def get_sex_disp_plot(plotting_data, active_row_id):
     return fig
 
 
-def get_age_disp_plot(plotting_data, active_row_id):
-    
+def get_age_disp_plot(plotting_data, age_bands = ('35-44', '45-54', '55-64', '65-74')):
+    # Youngest band at the top; the legacy release has other bands
+    plotting_data = get_plotting_rows(plotting_data)
+
     fig = px.bar(
-                    plotting_data[(plotting_data.Phenotype == active_row_id)], 
+                    plotting_data, 
                     y = 'Trait', 
                     x = 'Prevalence',
+                    error_x = 'Error_plus',
+                    error_x_minus = 'Error_minus',
                     hover_data = ['Pretty_cases', 'Pretty_controls'],
                     color='Trait', 
                     template = "plotly_white", 
@@ -113,13 +172,13 @@ def get_age_disp_plot(plotting_data, active_row_id):
                     orientation='h',
                     color_discrete_sequence = [
 
-                        '#A22A31', # 70-79
-                        '#214084', # 60-69
-                        '#EDB88B', # 40-49
-                        '#FAA51A', # 50-59
-                        # '#006C67', # 30-39
                         '#7AC74F', # Overall  
 
+                        '#EDB88B', # 35-44
+                        '#FAA51A', # 45-54
+                        '#214084', # 55-64
+                        '#A22A31', # 65-74
+
                         '#FFFFFF', # Blank
                     ]
                 )
@@ -144,12 +203,12 @@ def get_age_disp_plot(plotting_data, active_row_id):
                         categoryorder = 'array',
                         categoryarray = ['Overall', 
                                         ' ',
-                                        '70-79', '60-69', '50-59', '40-49'][::-1],
+                                        *age_bands[::-1]][::-1],
                         automargin = True
                     )
 
     fig.update_xaxes(
-                        range = [0, max(plotting_data[(plotting_data.Phenotype == active_row_id)].Prevalence)],
+                        range = [0, max(plotting_data.Upper)],
                         title_text = "Percent Prevalence",
                         automargin = True
                     )
@@ -166,11 +225,15 @@ def get_age_disp_plot(plotting_data, active_row_id):
     return fig
 
 
-def get_ethnic_disp_plot(plotting_data, active_row_id):
+def get_ethnic_disp_plot(plotting_data):
+    plotting_data = get_plotting_rows(plotting_data)
+
     fig = px.bar(
-                    plotting_data[(plotting_data.Phenotype == active_row_id)], 
+                    plotting_data, 
                     y = 'Trait', 
                     x = 'Prevalence',
+                    error_x = 'Error_plus',
+                    error_x_minus = 'Error_minus',
                     hover_data = ['Pretty_cases', 'Pretty_controls'],
                     color='Trait', 
                     template = "plotly_white", 
@@ -178,34 +241,16 @@ def get_ethnic_disp_plot(plotting_data, active_row_id):
                     orientation='h',
                     color_discrete_sequence = [
 
-                        '#A22A31', # Asian Total
-                        '#214084', # Black Total
-                        '#EDB88B', # Mixed Total
-                        '#EDADC7', # Other ethnic group
-                        '#FAA51A', # White Total
-                        '#5075AC', # African
-                        '#D69B9F', # Asian, other
-                        '#B5CDE1', # Black other
-                        '#F2CEB1', # Mixed Other
-                        '#F4D6AF', # White Other
-                        '#AB3E45', # Bangladeshi
-                        '#F3C88B', # British
-                        '#839FC6', # Caribbean
-                        '#006C67', # Chinese
-                        '#B95F65', # Indian
-                        '#F8C16F', # Irish
-                        '#C47B7F', # Pakistani
-                        '#F1C9A9', # White and Asian
-                        '#EFBE96', # White and Black African
-                        '#F0C4A0', # White and Black Caribbean
                         '#7AC74F', # Overall  
 
+                        '#A22A31', # Asian
+                        '#214084', # Black
+                        '#006C67', # Chinese
+                        '#EDB88B', # Mixed
+                        '#EDADC7', # Other
+                        '#FAA51A', # White
+
                         '#FFFFFF', # Blank
-                        '#FFFFFF', # Blank
-                        '#FFFFFF', # Blank
-                        '#FFFFFF', # Blank
-                        '#FFFFFF', # Blank
-                        '#FFFFFF', # Blank  
                     ]
                 )
 
@@ -229,22 +274,12 @@ def get_ethnic_disp_plot(plotting_data, active_row_id):
                         categoryorder = 'array',
                         categoryarray = ['Overall', 
                                         ' ',
-                                        'Asian (all)', 'Bangladeshi', 'Indian', 'Pakistani', 'Other Asian', 
-                                        '  ',
-                                        'Black (all)', 'African', 'Caribbean', 'Other Black', 
-                                        '   ', 
-                                        'Chinese', 
-                                        '    ', 
-                                        'Mixed (all)', 'White and Black African', 'White and Black Caribbean', 'White and Asian', 'Other Mixed', 
-                                        '     ',
-                                        'White (all)', 'Irish', 'British', 'Other White', 
-                                        '      ', 
-                                        'Other'][::-1],
+                                        'Asian', 'Black', 'Chinese', 'Mixed', 'White', 'Other'][::-1],
                         automargin = True
                     )
 
     fig.update_xaxes(
-                        range = [0, max(plotting_data[(plotting_data.Phenotype == active_row_id)].Prevalence)],
+                        range = [0, max(plotting_data.Upper)],
                         title_text = "Percent Prevalence",
                         automargin = True
                     )
@@ -260,11 +295,15 @@ def get_ethnic_disp_plot(plotting_data, active_row_id):
 
     return fig
 
-def get_ses_disp_plot(plotting_data, active_row_id):
+def get_ses_disp_plot(plotting_data):
+    plotting_data = get_plotting_rows(plotting_data)
+
     fig = px.bar(
-                    plotting_data[(plotting_data.Phenotype == active_row_id)], 
+                    plotting_data, 
                     y = 'Trait', 
                     x = 'Prevalence',
+                    error_x = 'Error_plus',
+                    error_x_minus = 'Error_minus',
                     hover_data = ['Pretty_cases', 'Pretty_controls'],
                     color='Trait', 
                     template = "plotly_white", 
@@ -313,7 +352,72 @@ def get_ses_disp_plot(plotting_data, active_row_id):
                     )
 
     fig.update_xaxes(
-                        range = [0, max(plotting_data[(plotting_data.Phenotype == active_row_id)].Prevalence)],
+                        range = [0, max(plotting_data.Upper)],
+                        title_text = "Percent Prevalence",
+                        automargin = True
+                    )
+    
+    fig.update_traces(
+                        hovertemplate=
+                                    "<b>%{y}</b><br><br>" +
+                                    "%{customdata[0]} cases<br>" +
+                                    "%{customdata[1]} controls<br>" +
+                                    "<b>Prevalence:</b> %{x}%" +
+                                    "<extra></extra>",
+    )
+
+    return fig
+
+def get_country_disp_plot(plotting_data):
+    plotting_data = get_plotting_rows(plotting_data)
+
+    fig = px.bar(
+                    plotting_data, 
+                    y = 'Trait', 
+                    x = 'Prevalence',
+                    error_x = 'Error_plus',
+                    error_x_minus = 'Error_minus',
+                    hover_data = ['Pretty_cases', 'Pretty_controls'],
+                    color='Trait', 
+                    template = "plotly_white", 
+                    orientation='h',
+                    color_discrete_sequence = [
+                        
+                        '#7AC74F', # Overall  
+
+                        '#A22A31', # England
+                        '#214084', # Scotland
+                        '#FAA51A', # Wales
+
+                        '#FFFFFF', # Blank
+                    ]
+                )
+
+    fig.update_layout(
+                        title = {'x' : 0.5}, 
+                        showlegend = False, 
+                        autosize = True,
+                        height = 590,
+                        plot_bgcolor = '#f9f9f9',
+                        paper_bgcolor = '#f9f9f9'
+                    )
+
+    for a in fig.layout.annotations:
+        a.text = ""
+        
+    fig.update_yaxes(
+                        matches = None,
+                        title_text = '', 
+                        tickmode = 'linear',
+                        categoryorder = 'array',
+                        categoryarray = ['Overall', 
+                                        ' ',
+                                        'England', 'Scotland', 'Wales'][::-1],
+                        automargin = True
+                    )
+
+    fig.update_xaxes(
+                        range = [0, max(plotting_data.Upper)],
                         title_text = "Percent Prevalence",
                         automargin = True
                     )
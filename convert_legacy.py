@@ -0,0 +1,391 @@
+# Python imports
+import argparse
+import contextlib
+import csv
+import os
+import pathlib
+import shutil
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Local imports
+import disparity_metrics
+
+'''
+Streaming conversion of a wide release summary into the long tables the app
+reads.
+
+The legacy release ships one very wide table, overall_summary.txt: PheCode,
+Phenotype and the Total counts, followed by blocks of per-group counts
+(<group>_Controls ..., <group>_Cases ...) and prevalences, each block
+separated by an 'index' / 'Status' column. This script writes, for every
+grouping,
+
+    <grouping>_plotting.txt         one row per group and phenotype, group by group, Total last
+    <grouping>_prev_table.txt       one column of prevalences per group
+    <grouping>_selection_table.txt  Variance and Maximum Difference (Sex: Difference)
+    <grouping>_analysis_table.txt   lowest and highest prevalence
+
+in the layout of data/legacy: the same group labels, column names and row
+order. The header is parsed once into a column map; the body is read and
+written CHUNK_ROWS phenotypes at a time, so memory stays bounded whatever the
+number of phenotypes (plotting rows are spooled to one part file per group and
+joined at the end). Prevalences are recomputed from the counts and the
+disparity metrics follow disparity_metrics, with the population variance
+(VARIANCE_DDOF) the legacy tables use rather than the sample variance of
+data/summary_stats.
+
+The counts of the published legacy tables come from a later extraction than
+overall_summary.txt, so cases, controls and the prevalences derived from them
+differ slightly; `--check data/legacy` compares the output with the published
+tables and reports those differences.
+
+    python convert_legacy.py --input data/legacy/overall_summary.txt --output data/converted --check data/legacy
+'''
+
+CHUNK_ROWS = 2000
+
+TOTAL = 'Total'
+
+# 0: population variance, as in the legacy tables; 1: sample variance, as in
+# data/summary_stats
+VARIANCE_DDOF = 0
+
+# Count blocks of the wide header, keyed by their first group:
+# (grouping, whether the block is summarised in the prevalence, selection and
+# analysis tables). Every block of a grouping is plotted.
+BLOCKS = {
+    'Female' : ('sex', True),
+    '30-39' : ('age', True),
+    'AsianG' : ('ethnic', True),
+    'African' : ('ethnic', False),
+    '0' : ('ses', True),
+}
+
+# Group column of the plotting tables
+GROUP_COLUMNS = {
+    'sex' : 'Sex',
+    'age' : 'Age',
+    'ethnic' : 'Ethnicity',
+    'ses' : 'Socio-economic Quintile',
+}
+
+# Group labels of the long tables that differ from the wide header
+LABELS = {
+    'ethnic' : {
+        'AsianG' : 'Asian (all)',
+        'BlackG' : 'Black (all)',
+        'ChineseG' : 'Chinese (all)',
+        'MixedG' : 'Mixed (all)',
+        'OtherEthnicityG' : 'Other',
+        'WhiteG' : 'White (all)',
+    },
+    'ses' : {'0' : '1', '1' : '2', '2' : '3', '3' : '4', '4' : '5'},
+}
+
+# Groups of the wide header left out of the legacy tables: the broad
+# self-reported categories, which the "(all)" groups already cover
+EXCLUDED = {
+    'ethnic' : {'Asian or Asian British', 'Black or Black British', 'Mixed', 'White'},
+}
+
+# Prevalence table columns, by group label, where they differ from the
+# plotting labels or order
+PREV_COLUMNS = {
+    'ethnic' : {
+        'Asian (all)' : 'Asian (all)',
+        'Black (all)' : 'Black (all)',
+        'Chinese (all)' : 'Chinese (all)',
+        'Mixed (all)' : 'Mixed (all)',
+        'White (all)' : 'White (all)',
+        'Other' : 'Other',
+    },
+    'ses' : {'1' : '0.0', '2' : '1.0', '3' : '2.0', '4' : '3.0', '5' : '4.0'},
+}
+
+# Selection table columns, as written -> disparity_metrics.METRICS
+SELECTION_COLUMNS = {
+    'sex' : {'Difference' : 'Maximum Difference'},
+}
+DEFAULT_SELECTION_COLUMNS = {'Variance' : 'Variance', 'Maximum Difference' : 'Maximum Difference'}
+
+TABLES = ['plotting', 'prev_table', 'selection_table', 'analysis_table']
+
+# Positions of the count columns of one grouping in the wide table
+GroupingColumns = namedtuple('GroupingColumns', ['labels', 'cases', 'controls', 'summarised'])
+ColumnMap = namedtuple('ColumnMap', ['phecode', 'phenotype', 'total_cases', 'total_controls', 'groupings'])
+
+
+# Header
+def read_header(path):
+    with open(path, newline = '') as source:
+        return next(csv.reader(source, delimiter = '\t'))
+
+
+def get_column_map(header):
+    positions = {}
+    for position, column in enumerate(header):
+        positions.setdefault(column, position)
+
+    for column in ('PheCode', 'Phenotype', 'Total_Cases', 'Total_Controls'):
+        if column not in positions:
+            raise ValueError(f"Summary has no {column!r} column")
+
+    # Count blocks in header order: the groups of consecutive _Controls /
+    # _Cases columns between two separators
+    blocks = []
+    groups = None
+    for position, column in enumerate(header):
+        name, _, kind = column.rpartition('_')
+        if kind not in ('Cases', 'Controls') or name == TOTAL:
+            groups = None
+            continue
+        if groups is None:
+            groups = {}
+            blocks.append(groups)
+        groups.setdefault(name, {})[kind] = position
+
+    groupings = {}
+    for groups in blocks:
+        first = next(iter(groups))
+        if first not in BLOCKS:
+            raise ValueError(f"Unknown block of groups starting with {first!r}")
+
+        grouping, summarised = BLOCKS[first]
+        labels = LABELS.get(grouping, {})
+        excluded = EXCLUDED.get(grouping, set())
+        columns = groupings.setdefault(grouping, GroupingColumns([], [], [], []))
+
+        for name, kinds in groups.items():
+            if set(kinds) != {'Cases', 'Controls'}:
+                raise ValueError(f"Group {name!r} needs both _Cases and _Controls columns")
+            if name in excluded:
+                continue
+            columns.labels.append(labels.get(name, name))
+            columns.cases.append(kinds['Cases'])
+            columns.controls.append(kinds['Controls'])
+            columns.summarised.append(summarised)
+
+    return ColumnMap(
+        positions['PheCode'], positions['Phenotype'], positions['Total_Cases'], positions['Total_Controls'], groupings
+    )
+
+
+def get_plotting_labels(column_map, grouping):
+    # In the order of the plotting table: every group, then the total
+    return column_map.groupings[grouping].labels + [TOTAL]
+
+
+# Body
+def get_prevalence(cases, controls):
+    totals = cases + controls
+    prevalence = np.zeros(cases.shape)
+    np.divide(100 * cases, totals, out = prevalence, where = totals > 0)
+    return prevalence.round(disparity_metrics.PREVALENCE_DECIMALS)
+
+
+def convert_chunk(chunk, column_map, grouping):
+    # Long tables of one grouping for one chunk of wide rows. The plotting
+    # rows are group by group, so each group is one slice of len(chunk) rows.
+    columns = column_map.groupings[grouping]
+    phecodes = chunk[column_map.phecode].values
+    phenotypes = chunk[column_map.phenotype].values
+
+    counts = lambda positions: chunk[positions].fillna(0).values.astype('int64')
+    cases = counts(columns.cases + [column_map.total_cases])
+    controls = counts(columns.controls + [column_map.total_controls])
+    prevalence = get_prevalence(cases.astype('float64'), controls.astype('float64'))
+
+    labels = get_plotting_labels(column_map, grouping)
+    plotting = pd.DataFrame({
+        'PheCode' : np.tile(phecodes, len(labels)),
+        'Phenotype' : np.tile(phenotypes, len(labels)),
+        GROUP_COLUMNS[grouping] : np.repeat(labels, len(chunk)),
+        'Prevalence' : prevalence.T.ravel(),
+        'Cases' : cases.T.ravel(),
+        'Controls' : controls.T.ravel(),
+    })
+
+    # Summaries over the summarised groups (never the total)
+    prev_columns = PREV_COLUMNS.get(grouping)
+    summarised = [position for position, flag in enumerate(columns.summarised) if flag]
+    if prev_columns is not None:
+        summarised = [labels.index(label) for label in prev_columns]
+    summarised_prevalence = prevalence[:, summarised]
+
+    prev_table = pd.DataFrame(
+        summarised_prevalence,
+        columns = [labels[position] if prev_columns is None else prev_columns[labels[position]] for position in summarised]
+    )
+    prev_table.insert(0, 'PheCode', phecodes)
+    prev_table.insert(0, 'Phenotype', phenotypes)
+
+    stats = disparity_metrics.block_stats(
+        summarised_prevalence.ravel(), np.full(len(chunk), len(summarised), dtype = 'int64'), ddof = VARIANCE_DDOF
+    )
+    selection_columns = SELECTION_COLUMNS.get(grouping, DEFAULT_SELECTION_COLUMNS)
+    selection_table = pd.DataFrame(dict(
+        {'PheCode' : phecodes, 'Phenotype' : phenotypes},
+        **{
+            column : np.round(disparity_metrics.METRICS[metric](stats), 2)
+            for column, metric in selection_columns.items()
+        }
+    ))
+    analysis_table = pd.DataFrame({
+        'PheCode' : phecodes,
+        'Phenotype' : phenotypes,
+        'MinPrev' : stats.minimum,
+        'MaxPrev' : stats.maximum,
+    })
+
+    return {
+        'plotting' : plotting,
+        'prev_table' : prev_table,
+        'selection_table' : selection_table,
+        'analysis_table' : analysis_table,
+    }
+
+
+def iter_wide_chunks(path, column_map, chunk_rows = CHUNK_ROWS):
+    # Only the columns in the map are parsed; separators, prevalence columns
+    # and anything else in the wide table are skipped
+    positions = {column_map.phecode, column_map.phenotype, column_map.total_cases, column_map.total_controls}
+    for columns in column_map.groupings.values():
+        positions.update(columns.cases)
+        positions.update(columns.controls)
+
+    return pd.read_csv(
+        path, sep = '\t', header = None, skiprows = 1, usecols = sorted(positions),
+        dtype = {column_map.phenotype : str}, chunksize = chunk_rows
+    )
+
+
+def convert(input_path, output_path, chunk_rows = CHUNK_ROWS):
+    input_path = pathlib.Path(input_path)
+    output_path = pathlib.Path(output_path)
+    output_path.mkdir(parents = True, exist_ok = True)
+
+    column_map = get_column_map(read_header(input_path))
+    paths = {
+        (grouping, table) : output_path.joinpath(f"{grouping}_{table}.txt")
+        for grouping in column_map.groupings for table in TABLES
+    }
+    tmp_path = lambda path: path.with_name(path.name + '.tmp')
+
+    # The plotting rows of each group go to their own part file, joined in
+    # group order once every chunk is read
+    parts = {
+        (grouping, label) : output_path.joinpath(f"{grouping}_plotting.{position}.part")
+        for grouping in column_map.groupings
+        for position, label in enumerate(get_plotting_labels(column_map, grouping))
+    }
+
+    rows = 0
+    with contextlib.ExitStack() as stack:
+        outputs = {
+            key : stack.enter_context(open(tmp_path(path) if key[1] != 'plotting' else parts[(key[0], TOTAL)], 'w', newline = ''))
+            for key, path in paths.items()
+        }
+        outputs.update({
+            key : stack.enter_context(open(path, 'w', newline = ''))
+            for key, path in parts.items() if key[1] != TOTAL
+        })
+
+        for chunk in iter_wide_chunks(input_path, column_map, chunk_rows):
+            for grouping in column_map.groupings:
+                for table, frame in convert_chunk(chunk, column_map, grouping).items():
+                    if table != 'plotting':
+                        frame.to_csv(outputs[(grouping, table)], sep = '\t', index = False, header = rows == 0)
+                        continue
+
+                    for position, label in enumerate(get_plotting_labels(column_map, grouping)):
+                        part = frame.iloc[position * len(chunk):(position + 1) * len(chunk)]
+                        key = (grouping, 'plotting') if label == TOTAL else (grouping, label)
+                        part.to_csv(outputs[key], sep = '\t', index = False, header = rows == 0 and position == 0)
+            rows += len(chunk)
+
+    for grouping in column_map.groupings:
+        path = paths[(grouping, 'plotting')]
+        with open(tmp_path(path), 'wb') as plotting:
+            for label in get_plotting_labels(column_map, grouping):
+                part = parts[(grouping, label)]
+                with open(part, 'rb') as source:
+                    shutil.copyfileobj(source, plotting)
+                os.remove(part)
+
+    # Swapping in the finished files, so readers never see a partial table
+    for path in paths.values():
+        os.replace(tmp_path(path), path)
+
+    return {'phenotypes' : rows, 'groupings' : list(column_map.groupings)}
+
+
+# Checking against published tables
+def compare_tables(output_path, reference_path, tolerance = 0.01):
+    # Differences between the tables written to `output_path` and the ones of
+    # the same name in `reference_path` (e.g. data/legacy), as
+    # {file name : {problem : description}}. Structural problems are keyed
+    # 'columns', 'rows' and 'PheCode' (the row order); a column whose labels
+    # differ, or whose values are further apart than `tolerance`, is keyed by
+    # its name.
+    output_path = pathlib.Path(output_path)
+    reference_path = pathlib.Path(reference_path)
+
+    report = {}
+    for path in sorted(output_path.glob('*.txt')):
+        reference_file = reference_path.joinpath(path.name)
+        if not reference_file.exists():
+            continue
+
+        output = pd.read_csv(path, sep = '\t', dtype = {'Phenotype' : str})
+        reference = pd.read_csv(reference_file, sep = '\t', dtype = {'Phenotype' : str})
+        problems = report[path.name] = {}
+
+        if list(output.columns) != list(reference.columns):
+            problems['columns'] = f"{list(output.columns)} != {list(reference.columns)}"
+        if len(output) != len(reference):
+            problems['rows'] = f"{len(output)} != {len(reference)}"
+        if problems:
+            continue
+
+        if not np.array_equal(output['PheCode'].values, reference['PheCode'].values):
+            problems['PheCode'] = "rows in another order"
+        for column in output.columns:
+            if column in ('PheCode', 'Phenotype'):
+                continue
+            numeric = pd.api.types.is_numeric_dtype(output[column]) and pd.api.types.is_numeric_dtype(reference[column])
+            if not numeric:
+                differing = int((output[column].astype(str).values != reference[column].astype(str).values).sum())
+                if differing:
+                    problems[column] = f"{differing} labels differ"
+                continue
+
+            difference = np.abs(output[column].values.astype('float64') - reference[column].values.astype('float64'))
+            difference = np.where(np.isnan(difference), 0, difference)
+            differing = int((difference > tolerance + 1e-9).sum())
+            if differing:
+                problems[column] = f"{differing} values differ by more than {tolerance}, up to {difference.max():g}"
+
+    return report
+
+
+# Main
+if __name__ == '__main__':
+    PATH = pathlib.Path(__file__).parent
+
+    parser = argparse.ArgumentParser(description = "Convert a wide release summary into the long per-grouping tables.")
+    parser.add_argument('--input', default = str(PATH.joinpath("data").joinpath("legacy").joinpath("overall_summary.txt")))
+    parser.add_argument('--output', default = str(PATH.joinpath("data").joinpath("converted")))
+    parser.add_argument('--chunk-rows', type = int, default = CHUNK_ROWS)
+    parser.add_argument('--check', help = "directory of published tables to compare the output with, e.g. data/legacy")
+    args = parser.parse_args()
+
+    result = convert(args.input, args.output, chunk_rows = args.chunk_rows)
+    print(f"Wrote {', '.join(result['groupings'])} tables for {result['phenotypes']} phenotypes to {args.output}")
+
+    if args.check:
+        for file_name, problems in compare_tables(args.output, args.check).items():
+            described = [f"{problem}: {description}" for problem, description in problems.items()]
+            print(f"{file_name}: {'; '.join(described) if described else 'matches'}")
@@ -0,0 +1,465 @@
+# Python imports
+import argparse
+import functools
+import glob
+import hashlib
+import os
+import pathlib
+import pickle
+
+import numpy as np
+import pandas as pd
+
+'''
+Loaders for the summary statistics of each disparity grouping. Every loader
+reads one tab-separated table from `data_path` and returns the cleaned frame.
+
+Cleaned frames are cached as binary pickles (numpy column blocks, no text
+parsing) under CACHE_PATH. A cache file is keyed on the source file's path,
+mtime and size, on this module's code and on the pandas version, so editing
+either the data or the cleaning steps invalidates it. When no valid cache
+exists the loader falls back to the TSV and writes a fresh cache.
+
+Prebuild the caches with:
+
+    python data_loader.py --data data/summary_stats
+'''
+
+PATH = pathlib.Path(__file__).parent
+
+# Set TABLE_CACHE_PATH to an empty string to always read the TSVs
+CACHE_PATH = os.environ.get('TABLE_CACHE_PATH', str(PATH.joinpath("cache").joinpath("tables")))
+CACHE_PATH = pathlib.Path(CACHE_PATH) if CACHE_PATH else None
+
+CODE_HASH = hashlib.sha1(pathlib.Path(__file__).read_bytes()).hexdigest()
+
+
+def get_cache_file(load_name, data_path, file_name):
+    # <release>-<loader>-<source>-<version>.pkl: the source digest tells apart
+    # releases whose directories share a name, the version digest changes with
+    # the file, the cleaning code and pandas
+    source = data_path.joinpath(file_name).resolve()
+    stat = source.stat()
+    source_digest = hashlib.sha1(f"{source}|{load_name}".encode()).hexdigest()[:12]
+    key = f"{source}|{stat.st_mtime_ns}|{stat.st_size}|{CODE_HASH}|{pd.__version__}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:20]
+
+    return CACHE_PATH.joinpath(f"{data_path.name}-{load_name}-{source_digest}-{digest}.pkl")
+
+
+def write_cache(cache_file, data):
+    try:
+        cache_file.parent.mkdir(parents = True, exist_ok = True)
+
+        # Writing to a temporary file first so concurrent workers never read a partial cache
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+        data.to_pickle(tmp_file, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+
+        # Dropping caches of older versions of the same table, read from the
+        # same source file by the same loader
+        prefix = cache_file.name.rsplit('-', 1)[0]
+        for stale_file in cache_file.parent.glob(f"{glob.escape(prefix)}-*.pkl"):
+            if stale_file != cache_file:
+                stale_file.unlink()
+    except OSError:
+        # A read-only deployment simply keeps reading the TSVs
+        pass
+
+
+def cached_table(file_name):
+    def decorator(load_function):
+        @functools.wraps(load_function)
+        def load(data_path, use_cache = True):
+            data_path = pathlib.Path(data_path)
+            if not use_cache or CACHE_PATH is None:
+                return load_function(data_path)
+
+            cache_file = get_cache_file(load_function.__name__, data_path, file_name)
+            try:
+                return pd.read_pickle(cache_file)
+            except (OSError, EOFError, ValueError, AttributeError, ImportError, pickle.UnpicklingError):
+                pass
+
+            data = load_function(data_path)
+            write_cache(cache_file, data)
+            return data
+
+        load.file_name = file_name
+        return load
+
+    return decorator
+
+def compact_plotting_data(plotting_data):
+    # The long-format tables repeat the phenotype and trait names on every row,
+    # so they are stored as categorical codes next to narrow numeric columns.
+    # Counts are formatted with thousands separators only when drawn.
+    # Rows are laid out one phenotype after another with the overall row
+    # first, the order the figures colour the bars in.
+    phenotype_codes, _ = pd.factorize(plotting_data['Phenotype'])
+    order = np.lexsort(((plotting_data['Trait'] != 'Overall').values, phenotype_codes))
+    plotting_data = plotting_data.iloc[order].reset_index(drop = True)
+
+    return plotting_data.astype({
+        'Phenotype' : 'category',
+        'Trait' : 'category',
+        'Prevalence' : 'float32',
+        'Cases' : 'int32',
+        'Controls' : 'int32',
+    })
+
+
+'''
+First, the view tables ( these tables will populate the searchable 
+tables from which a trait will be chosen ).
+'''
+
+@cached_table("sex_selection_table.txt")
+def load_sex_table_data(data_path):
+    # Grouping - Sex
+    table_data = pd.read_csv(data_path.joinpath("sex_selection_table.txt"), sep = '\t')
+    table_data.loc[:, 'Variance'] = 0.5*(table_data['Difference'] ** 2)
+    table_data.loc[:, 'Variance'] = table_data.loc[:, 'Variance'].round(2)
+
+    table_data.loc[:, 'Difference'] = table_data.loc[:, 'Difference'].round(2)
+
+    table_data.columns = ['Phecode', 'Disease', 'Difference', 'Variance']
+    table_data = table_data.loc[:, ['Disease', 'Phecode', 'Variance', 'Difference']]
+
+    table_data['id'] = table_data['Disease']
+    table_data.set_index('id', inplace = True, drop = False)
+    table_data = table_data.sort_values(by = ['Variance'], ascending = False)
+
+    return table_data
+
+@cached_table("age_selection_table.txt")
+def load_age_table_data(data_path):
+    # Grouping - Age
+    table_data = pd.read_csv(data_path.joinpath("age_selection_table.txt"), sep = '\t')
+    table_data.loc[:, 'Maximum Difference'] = table_data.loc[:, 'Maximum Difference'].round(2)
+
+    table_data.columns = ['Phecode', 'Disease', 'Variance', 'Maximum Difference']
+    table_data = table_data.loc[:, ['Disease', 'Phecode', 'Variance', 'Maximum Difference']]
+
+    table_data['id'] = table_data['Disease']
+    table_data.set_index('id', inplace = True, drop = False)
+    table_data = table_data.sort_values(by = ['Variance'], ascending = False)
+
+    return table_data
+
+@cached_table("ethnic_selection_table.txt")
+def load_ethnic_table_data(data_path):
+    # Grouping - Ethnic Group
+    table_data = pd.read_csv(data_path.joinpath("ethnic_selection_table.txt"), sep = '\t')
+    table_data.loc[:, 'Maximum Difference'] = table_data.loc[:, 'Maximum Difference'].round(2)
+
+    table_data.columns = ['Phecode', 'Disease', 'Variance', 'Maximum Difference']
+    table_data = table_data.loc[:, ['Disease', 'Phecode', 'Variance', 'Maximum Difference']]
+
+    table_data['id'] = table_data['Disease']
+    table_data.set_index('id', inplace = True, drop = False)
+    table_data = table_data.sort_values(by = ['Variance'], ascending = False)
+
+    return table_data
+
+@cached_table("ses_selection_table.txt")
+def load_ses_table_data(data_path):
+    # Grouping - Socio-economic status
+    table_data = pd.read_csv(data_path.joinpath("ses_selection_table.txt"), sep = '\t')
+    table_data.loc[:, 'Maximum Difference'] = table_data.loc[:, 'Maximum Difference'].round(2)
+
+    table_data.columns = ['Phecode', 'Disease', 'Variance', 'Maximum Difference']
+    table_data = table_data.loc[:, ['Disease', 'Phecode', 'Variance', 'Maximum Difference']]
+
+    table_data['id'] = table_data['Disease']
+    table_data.set_index('id', inplace = True, drop = False)
+    table_data = table_data.sort_values(by = ['Variance'], ascending = False)
+
+    return table_data
+
+@cached_table("country_selection_table.txt")
+def load_country_table_data(data_path):
+    # Grouping - Country
+    table_data = pd.read_csv(data_path.joinpath("country_selection_table.txt"), sep = '\t')
+    table_data.loc[:, 'Maximum Difference'] = table_data.loc[:, 'Maximum Difference'].round(2)
+
+    table_data.columns = ['Phecode', 'Disease', 'Variance', 'Maximum Difference']
+    table_data = table_data.loc[:, ['Disease', 'Phecode', 'Variance', 'Maximum Difference']]
+
+    table_data['id'] = table_data['Disease']
+    table_data.set_index('id', inplace = True, drop = False)
+    table_data = table_data.sort_values(by = ['Variance'], ascending = False)
+
+    return table_data
+
+'''
+Next, the data for the prevalence tables
+'''
+
+@cached_table("sex_prev_table.txt")
+def load_sex_prev_data(data_path):
+    # Grouping - Sex
+    prev_data = pd.read_csv(data_path.joinpath("sex_prev_table.txt"), sep = '\t')
+
+    prev_data = prev_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+
+    prev_data['id'] = prev_data['Disease']
+    prev_data.set_index('id', inplace = True, drop = False)
+    prev_data = prev_data.sort_values(by = ['Male'], ascending = False)
+
+    return prev_data
+
+@cached_table("age_prev_table.txt")
+def load_age_prev_data(data_path):
+    # Grouping - Age
+    prev_data = pd.read_csv(data_path.joinpath("age_prev_table.txt"), sep = '\t')
+
+    prev_data = prev_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+    prev_data = prev_data.loc[:, [colname for colname in prev_data.columns if colname != '30-39']]
+
+    prev_data['id'] = prev_data['Disease']
+    prev_data.set_index('id', inplace = True, drop = False)
+    prev_data = prev_data.sort_values(by = ['65-74'], ascending = False)
+
+    return prev_data
+
+@cached_table("ethnic_prev_table.txt")
+def load_ethnic_prev_data(data_path):
+    # Grouping - Ethnic Group
+    prev_data = pd.read_csv(data_path.joinpath("ethnic_prev_table.txt"), sep = '\t')
+
+    prev_data = prev_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+
+    prev_data['id'] = prev_data['Disease']
+    prev_data.set_index('id', inplace = True, drop = False)
+    prev_data = prev_data.sort_values(by = ['Asian'], ascending = False)
+
+    return prev_data
+
+@cached_table("ses_prev_table.txt")
+def load_ses_prev_data(data_path):
+    # Grouping - Socio-economic status
+    prev_data = pd.read_csv(data_path.joinpath("ses_prev_table.txt"), sep = '\t')
+    prev_data.columns = ['Phenotype', 'PheCode', 'First Quintile of Deprivation', 'Second Quintile of Deprivation', 'Third Quintile of Deprivation', 'Fourth Quintile of Deprivation' ,'Fifth Quintile of Deprivation']
+
+    prev_data = prev_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+
+    prev_data['id'] = prev_data['Disease']
+    prev_data.set_index('id', inplace = True, drop = False)
+    prev_data = prev_data.sort_values(by = ['Fifth Quintile of Deprivation'], ascending = False)
+
+    return prev_data
+
+@cached_table("country_prev_table.txt")
+def load_country_prev_data(data_path):
+    # Grouping - Country
+    prev_data = pd.read_csv(data_path.joinpath("country_prev_table.txt"), sep = '\t')
+
+    prev_data = prev_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+
+    prev_data['id'] = prev_data['Disease']
+    prev_data.set_index('id', inplace = True, drop = False)
+    prev_data = prev_data.sort_values(by = ['England'], ascending = False)
+
+    return prev_data
+
+'''
+Finally, the data for visualization.
+'''
+
+@cached_table("sex_plotting.txt")
+def load_sex_plotting_data(data_path):
+    # Grouping - Sex
+    plotting_data = pd.read_csv(data_path.joinpath("sex_plotting.txt"), sep = '\t')
+    plotting_data.columns = ['PheCode', 'Phenotype', 'Trait', 'Prevalence', 'Cases', 'Controls']
+    plotting_data.loc[plotting_data['Trait'] == 'Total', 'Trait'] = 'Overall'
+
+    return compact_plotting_data(plotting_data)
+
+@cached_table("age_plotting.txt")
+def load_age_plotting_data(data_path):
+    # Grouping - Age
+    plotting_data = pd.read_csv(data_path.joinpath("age_plotting.txt"), sep = '\t')
+    plotting_data.columns = ['PheCode', 'Phenotype', 'Trait', 'Prevalence', 'Cases', 'Controls']
+    plotting_data = plotting_data.loc[plotting_data['Trait'] != '30-39', :]
+    plotting_data.loc[plotting_data['Trait'] == 'Total', 'Trait'] = 'Overall'
+
+    return compact_plotting_data(plotting_data)
+
+@cached_table("ethnic_plotting.txt")
+def load_ethnic_plotting_data(data_path):
+    # Grouping - Ethnic Group
+    plotting_data = pd.read_csv(data_path.joinpath("ethnic_plotting.txt"), sep = '\t')
+    plotting_data.columns = ['PheCode', 'Phenotype', 'Trait', 'Prevalence', 'Cases', 'Controls']
+    plotting_data.loc[plotting_data['Trait'] == 'Any other white background', 'Trait'] = 'Other White'
+    plotting_data.loc[plotting_data['Trait'] == 'Any other mixed background', 'Trait'] = 'Other Mixed'
+    plotting_data.loc[plotting_data['Trait'] == 'Any other Black background', 'Trait'] = 'Other Black'
+    plotting_data.loc[plotting_data['Trait'] == 'Any other Asian background', 'Trait'] = 'Other Asian'
+    plotting_data = plotting_data.loc[~plotting_data['Trait'].isin(['Prefer not to answer', 'Do not know', 'Other ethnic group', 'Chinese (all)']),:]
+    plotting_data.loc[plotting_data['Trait'] == 'Total', 'Trait'] = 'Overall'
+
+    return compact_plotting_data(plotting_data)
+
+@cached_table("ses_plotting.txt")
+def load_ses_plotting_data(data_path):
+    # Grouping - Socio-economic status
+    plotting_data = pd.read_csv(data_path.joinpath("ses_plotting.txt"), sep = '\t')
+    plotting_data.columns = ['PheCode', 'Phenotype', 'Trait', 'Prevalence', 'Cases', 'Controls']
+    plotting_data.loc[plotting_data['Trait'] == '1', 'Trait'] = 'First Quintile of Deprivation<br>(Least Deprived)'
+    plotting_data.loc[plotting_data['Trait'] == '2', 'Trait'] = 'Second Quintile of Deprivation'
+    plotting_data.loc[plotting_data['Trait'] == '3', 'Trait'] = 'Third Quintile of Deprivation'
+    plotting_data.loc[plotting_data['Trait'] == '4', 'Trait'] = 'Fourth Quintile of Deprivation'
+    plotting_data.loc[plotting_data['Trait'] == '5', 'Trait'] = 'Fifth Quintile of Deprivation<br>(Most Deprived)'
+    plotting_data.loc[plotting_data['Trait'] == 'Total', 'Trait'] = 'Overall'
+
+    return compact_plotting_data(plotting_data)
+
+
+@cached_table("country_plotting.txt")
+def load_country_plotting_data(data_path):
+    # Grouping - Country
+    plotting_data = pd.read_csv(data_path.joinpath("country_plotting.txt"), sep = '\t')
+    plotting_data.columns = ['PheCode', 'Phenotype', 'Trait', 'Prevalence', 'Cases', 'Controls']
+    plotting_data.loc[plotting_data['Trait'] == 'Total', 'Trait'] = 'Overall'
+
+    return compact_plotting_data(plotting_data)
+
+'''
+The analysis tables, with the lowest and highest prevalence across groups.
+They are not shown in the app, only exported.
+'''
+
+@cached_table("sex_analysis_table.txt")
+def load_sex_analysis_data(data_path):
+    # Grouping - Sex
+    analysis_data = pd.read_csv(data_path.joinpath("sex_analysis_table.txt"), sep = '\t')
+
+    analysis_data = analysis_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+    analysis_data = analysis_data.loc[:, ['Disease', 'Phecode', 'MinPrev', 'MaxPrev']]
+
+    return analysis_data
+
+@cached_table("age_analysis_table.txt")
+def load_age_analysis_data(data_path):
+    # Grouping - Age
+    analysis_data = pd.read_csv(data_path.joinpath("age_analysis_table.txt"), sep = '\t')
+
+    analysis_data = analysis_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+    analysis_data = analysis_data.loc[:, ['Disease', 'Phecode', 'MinPrev', 'MaxPrev']]
+
+    return analysis_data
+
+@cached_table("ethnic_analysis_table.txt")
+def load_ethnic_analysis_data(data_path):
+    # Grouping - Ethnic Group
+    analysis_data = pd.read_csv(data_path.joinpath("ethnic_analysis_table.txt"), sep = '\t')
+
+    analysis_data = analysis_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+    analysis_data = analysis_data.loc[:, ['Disease', 'Phecode', 'MinPrev', 'MaxPrev']]
+
+    return analysis_data
+
+@cached_table("ses_analysis_table.txt")
+def load_ses_analysis_data(data_path):
+    # Grouping - Socio-economic status
+    analysis_data = pd.read_csv(data_path.joinpath("ses_analysis_table.txt"), sep = '\t')
+
+    analysis_data = analysis_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+    analysis_data = analysis_data.loc[:, ['Disease', 'Phecode', 'MinPrev', 'MaxPrev']]
+
+    return analysis_data
+
+@cached_table("country_analysis_table.txt")
+def load_country_analysis_data(data_path):
+    # Grouping - Country
+    analysis_data = pd.read_csv(data_path.joinpath("country_analysis_table.txt"), sep = '\t')
+
+    analysis_data = analysis_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+    analysis_data = analysis_data.loc[:, ['Disease', 'Phecode', 'MinPrev', 'MaxPrev']]
+
+    return analysis_data
+
+'''
+Loaders of the legacy release (data/legacy) where its tables differ from the
+current ones: age bands of ten years (the 30-39 band is dropped, as above)
+and ethnic groups named 'Asian (all)' etc. next to the detailed backgrounds.
+The summary ethnic groups are given the labels of the current release and
+the detailed backgrounds are left out, as in the current release. The other
+tables are read by the loaders above; the legacy release has no analysis tables.
+'''
+
+LEGACY_AGE_BANDS = ['40-49', '50-59', '60-69', '70-79']
+
+LEGACY_ETHNIC_GROUPS = {
+    'Asian (all)' : 'Asian',
+    'Black (all)' : 'Black',
+    'Chinese (all)' : 'Chinese',
+    'Mixed (all)' : 'Mixed',
+    'Other' : 'Other',
+    'White (all)' : 'White',
+}
+
+@cached_table("age_prev_table.txt")
+def load_legacy_age_prev_data(data_path):
+    # Grouping - Age (legacy release)
+    prev_data = pd.read_csv(data_path.joinpath("age_prev_table.txt"), sep = '\t')
+
+    prev_data = prev_data.rename(columns = {'Phenotype' : 'Disease', 'PheCode' : 'Phecode'})
+    prev_data = prev_data.loc[:, [colname for colname in prev_data.columns if colname != '30-39']]
+
+    prev_data['id'] = prev_data['Disease']
+    prev_data.set_index('id', inplace = True, drop = False)
+    prev_data = prev_data.sort_values(by = ['70-79'], ascending = False)
+
+    return prev_data
+
+@cached_table("ethnic_prev_table.txt")
+def load_legacy_ethnic_prev_data(data_path):
+    # Grouping - Ethnic Group (legacy release)
+    prev_data = pd.read_csv(data_path.joinpath("ethnic_prev_table.txt"), sep = '\t')
+
+    prev_data = prev_data.rename(columns = dict({'Phenotype' : 'Disease', 'PheCode' : 'Phecode'}, **LEGACY_ETHNIC_GROUPS))
+
+    prev_data['id'] = prev_data['Disease']
+    prev_data.set_index('id', inplace = True, drop = False)
+    prev_data = prev_data.sort_values(by = ['Asian'], ascending = False)
+
+    return prev_data
+
+@cached_table("ethnic_plotting.txt")
+def load_legacy_ethnic_plotting_data(data_path):
+    # Grouping - Ethnic Group (legacy release)
+    plotting_data = pd.read_csv(data_path.joinpath("ethnic_plotting.txt"), sep = '\t')
+    plotting_data.columns = ['PheCode', 'Phenotype', 'Trait', 'Prevalence', 'Cases', 'Controls']
+    plotting_data = plotting_data.loc[plotting_data['Trait'].isin(['Total'] + list(LEGACY_ETHNIC_GROUPS)), :]
+
+    # Groups in the order of the current release, which the colours follow
+    groups = sorted(LEGACY_ETHNIC_GROUPS, key = LEGACY_ETHNIC_GROUPS.get)
+    ranks = plotting_data['Trait'].map({group : rank for rank, group in enumerate(groups)}).fillna(-1)
+    plotting_data = plotting_data.iloc[np.argsort(ranks.values, kind = 'mergesort')]
+    plotting_data['Trait'] = plotting_data['Trait'].replace(dict(LEGACY_ETHNIC_GROUPS, Total = 'Overall'))
+
+    return compact_plotting_data(plotting_data)
+
+
+TABLE_LOADERS = [
+    load_sex_table_data, load_age_table_data, load_ethnic_table_data, load_ses_table_data, load_country_table_data,
+    load_sex_prev_data, load_age_prev_data, load_ethnic_prev_data, load_ses_prev_data, load_country_prev_data,
+    load_sex_plotting_data, load_age_plotting_data, load_ethnic_plotting_data, load_ses_plotting_data, load_country_plotting_data,
+    load_sex_analysis_data, load_age_analysis_data, load_ethnic_analysis_data, load_ses_analysis_data, load_country_analysis_data,
+]
+
+# Main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Write the binary cache of every cleaned table.")
+    parser.add_argument('--data', default = str(PATH.joinpath("data").joinpath("summary_stats")))
+    args = parser.parse_args()
+
+    if CACHE_PATH is None:
+        parser.error("TABLE_CACHE_PATH is empty, caching is disabled")
+
+    for load_table in TABLE_LOADERS:
+        data = load_table(args.data, use_cache = False)
+        write_cache(get_cache_file(load_table.__name__, pathlib.Path(args.data), load_table.file_name), data)
+
+    print(f"Wrote {len(TABLE_LOADERS)} table caches to {CACHE_PATH}")
@@ -0,0 +1,125 @@
+# Python imports
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+'''
+Disparity metrics recomputed from the case and control counts.
+
+The selection and analysis tables ship with precomputed Variance, Maximum
+Difference and Min/MaxPrev columns. Here they are derived again from the
+Cases / Controls of the long-format plotting tables: prevalence is recomputed
+per group (rounded to two decimals, as in the published tables), the rows of
+each phenotype are laid out contiguously, and every metric is a vectorized
+reduction over those blocks. All groupings are concatenated and reduced in
+one pass.
+
+A metric is a function of the per-phenotype block statistics below; adding an
+entry to METRICS adds a column everywhere the engine is used.
+'''
+
+PREVALENCE_DECIMALS = 2
+
+# Per-phenotype statistics of the group prevalences
+BlockStats = namedtuple('BlockStats', ['count', 'mean', 'variance', 'minimum', 'maximum'])
+
+
+def ratio(stats):
+    out = np.full(len(stats.count), np.nan)
+    return np.divide(stats.maximum, stats.minimum, out = out, where = stats.minimum > 0)
+
+
+# In column order
+METRICS = {
+    'Variance' : lambda stats: stats.variance,
+    'Maximum Difference' : lambda stats: stats.maximum - stats.minimum,
+    'Ratio' : ratio,
+    'MinPrev' : lambda stats: stats.minimum,
+    'MaxPrev' : lambda stats: stats.maximum,
+}
+
+
+def get_block_order(plotting_data, overall_label = 'Overall'):
+    # Group rows (without the overall row), the order that makes each
+    # phenotype one contiguous block, and the phenotypes and their row counts
+    rows = plotting_data.loc[(plotting_data['Trait'] != overall_label).values]
+    codes, phenotypes = pd.factorize(rows['Phenotype'])
+    order = np.argsort(codes, kind = 'mergesort')
+
+    return rows, order, phenotypes, np.bincount(codes, minlength = len(phenotypes))
+
+
+def get_blocks(plotting_data, overall_label = 'Overall'):
+    rows, order, phenotypes, counts = get_block_order(plotting_data, overall_label)
+    starts = np.cumsum(counts) - counts
+
+    return (
+        np.asarray(phenotypes, dtype = object),
+        rows['PheCode'].values[order][starts],
+        rows['Cases'].values[order].astype('float64'),
+        rows['Controls'].values[order].astype('float64'),
+        counts,
+    )
+
+
+def block_stats(prevalence, counts, ddof = 1):
+    starts = np.cumsum(counts) - counts
+
+    sums = np.add.reduceat(prevalence, starts)
+    means = sums / counts
+    deviations = (prevalence - np.repeat(means, counts)) ** 2
+    squares = np.add.reduceat(deviations, starts)
+
+    # Sample variance by default, like the summary_stats tables (and
+    # 0.5 * Difference ** 2 for two groups); ddof = 0 gives the population
+    # variance of the legacy tables
+    variance = np.full(len(counts), np.nan)
+    np.divide(squares, counts - ddof, out = variance, where = counts > ddof)
+
+    return BlockStats(
+        counts,
+        means,
+        variance,
+        np.minimum.reduceat(prevalence, starts),
+        np.maximum.reduceat(prevalence, starts),
+    )
+
+
+def compute_all(plotting_tables, overall_label = 'Overall', metrics = None, ddof = 1):
+    # `plotting_tables` maps grouping -> long-format plotting table. Returns
+    # grouping -> one row of metrics per phenotype. `ddof` as in block_stats.
+    metrics = METRICS if metrics is None else metrics
+    blocks = {name : get_blocks(plotting_data, overall_label) for name, plotting_data in plotting_tables.items()}
+    if not blocks:
+        return {}
+
+    cases = np.concatenate([block[2] for block in blocks.values()])
+    controls = np.concatenate([block[3] for block in blocks.values()])
+    counts = np.concatenate([block[4] for block in blocks.values()])
+
+    totals = cases + controls
+    prevalence = np.zeros(len(totals))
+    np.divide(100 * cases, totals, out = prevalence, where = totals > 0)
+    prevalence = prevalence.round(PREVALENCE_DECIMALS)
+
+    stats = block_stats(prevalence, counts, ddof)
+    values = {name : np.round(metric(stats), 2) for name, metric in metrics.items()}
+
+    results = {}
+    start = 0
+    for name, (phenotypes, phecodes, _, _, block_counts) in blocks.items():
+        stop = start + len(block_counts)
+        results[name] = pd.DataFrame(
+            dict(
+                {'Disease' : phenotypes, 'Phecode' : phecodes, 'Groups' : block_counts},
+                **{column : column_values[start:stop] for column, column_values in values.items()}
+            )
+        )
+        start = stop
+
+    return results
+
+
+def compute_metrics(plotting_data, overall_label = 'Overall', metrics = None):
+    return compute_all({None : plotting_data}, overall_label, metrics)[None]
@@ -0,0 +1,161 @@
+# Python imports
+import numpy as np
+import pandas as pd
+from scipy import special
+
+# Local imports
+import disparity_metrics
+
+'''
+Confidence intervals and significance tests for every phenotype and group.
+
+Both are computed once per grouping when the data is loaded, from the Cases /
+Controls of the long-format plotting table:
+
+  * a 95% Wilson score interval for the prevalence of every bar, kept next to
+    the prevalence as Lower / Upper (percent) and drawn as error bars;
+  * one p-value per phenotype for the selection table: Pearson's chi-square
+    test of homogeneity across the groups, or the Cochran-Armitage test for
+    trend when the groups are ordered (age bands, deprivation quintiles).
+    Trend scores are the positions of the groups in the grouping's band order
+    (0, 1, 2, ...), so a phenotype missing a band keeps the scores of the
+    others.
+
+Every row is handled in one vectorized pass; the per-phenotype sums are
+reductions over the contiguous phenotype blocks of disparity_metrics.get_blocks.
+'''
+
+# Two-sided 95%
+Z = 1.959963984540054
+
+P_VALUE = 'P-value'
+INTERVAL_DECIMALS = 2
+
+
+def wilson_interval(cases, controls, z = Z):
+    # Lower and upper bound of the prevalence in percent, nan without samples
+    cases = np.asarray(cases, dtype = 'float64')
+    totals = cases + np.asarray(controls, dtype = 'float64')
+
+    lower = np.full(len(totals), np.nan)
+    upper = np.full(len(totals), np.nan)
+    valid = totals > 0
+    n = totals[valid]
+    p = cases[valid] / n
+
+    denominator = 1 + z ** 2 / n
+    centre = (p + z ** 2 / (2 * n)) / denominator
+    half_width = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator
+
+    lower[valid] = 100 * np.clip(centre - half_width, 0, 1)
+    upper[valid] = 100 * np.clip(centre + half_width, 0, 1)
+
+    return lower, upper
+
+
+def add_intervals(plotting_data):
+    lower, upper = wilson_interval(plotting_data['Cases'].values, plotting_data['Controls'].values)
+    return plotting_data.assign(
+        Lower = lower.round(INTERVAL_DECIMALS).astype('float32'),
+        Upper = upper.round(INTERVAL_DECIMALS).astype('float32'),
+    )
+
+
+def _block_sums(cases, controls, counts):
+    starts = np.cumsum(counts) - counts
+    totals = cases + controls
+
+    block_cases = np.add.reduceat(cases, starts)
+    block_totals = np.add.reduceat(totals, starts)
+
+    pooled = np.full(len(counts), np.nan)
+    np.divide(block_cases, block_totals, out = pooled, where = block_totals > 0)
+
+    # Cases expected in each group if every group had the pooled prevalence
+    deviations = cases - totals * np.repeat(pooled, counts)
+
+    return starts, totals, block_totals, pooled, deviations
+
+
+def chi_square_test(cases, controls, counts):
+    # Pearson's chi-square test of homogeneity of each 2 x k block, which for
+    # two rows reduces to sum((a - n p)^2 / n) / (p (1 - p))
+    starts, totals, _, pooled, deviations = _block_sums(cases, controls, counts)
+
+    terms = np.zeros(len(totals))
+    np.divide(deviations ** 2, totals, out = terms, where = totals > 0)
+    spread = pooled * (1 - pooled)
+
+    statistic = np.full(len(counts), np.nan)
+    np.divide(np.add.reduceat(terms, starts), spread, out = statistic, where = spread > 0)
+
+    groups = np.add.reduceat((totals > 0).astype('int64'), starts)
+    p_values = special.chdtrc(np.maximum(groups - 1, 1), statistic)
+
+    return np.where(groups > 1, p_values, np.nan)
+
+
+def get_scores(plotting_data, bands, overall_label = 'Overall'):
+    # Position of every group row's band in `bands`, in the row order of
+    # disparity_metrics.get_blocks
+    rows, order, _, _ = disparity_metrics.get_block_order(plotting_data, overall_label)
+    codes, traits = pd.factorize(rows['Trait'])
+
+    positions = pd.Index(bands).get_indexer(np.asarray(traits, dtype = str))
+    if (positions < 0).any():
+        raise ValueError(f"Groups {sorted(np.asarray(traits, dtype = str)[positions < 0])} are not among the bands {list(bands)}")
+    return positions[codes[order]].astype('float64')
+
+
+def trend_test(cases, controls, counts, scores):
+    # Cochran-Armitage test for trend, two-sided
+    starts, totals, block_totals, pooled, deviations = _block_sums(cases, controls, counts)
+
+    statistic = np.add.reduceat(scores * deviations, starts)
+    weighted = np.add.reduceat(totals * scores, starts)
+    spread = np.add.reduceat(totals * scores ** 2, starts)
+
+    centred = np.zeros(len(counts))
+    np.divide(weighted ** 2, block_totals, out = centred, where = block_totals > 0)
+    variance = pooled * (1 - pooled) * (spread - centred)
+
+    z = np.full(len(counts), np.nan)
+    np.divide(statistic, np.sqrt(np.maximum(variance, 0)), out = z, where = variance > 0)
+
+    return 2 * special.ndtr(-np.abs(z))
+
+
+TESTS = {
+    'chi-square' : chi_square_test,
+    'trend' : trend_test,
+}
+
+# Tests of ordered groups, given the band scores of every row
+ORDERED_TESTS = {'trend'}
+
+
+def compute_p_values(plotting_data, test = 'chi-square', bands = None, overall_label = 'Overall'):
+    # One row per phenotype: Disease, Phecode and the p-value of `test`;
+    # `bands` are the groups in order, for the ORDERED_TESTS
+    phenotypes, phecodes, cases, controls, counts = disparity_metrics.get_blocks(plotting_data, overall_label)
+    if len(counts) == 0:
+        return pd.DataFrame({'Disease' : [], 'Phecode' : [], P_VALUE : []})
+
+    arguments = [cases, controls, counts]
+    if test in ORDERED_TESTS:
+        if bands is None:
+            raise ValueError(f"The {test} test needs the order of the bands")
+        arguments.append(get_scores(plotting_data, bands, overall_label))
+
+    return pd.DataFrame({
+        'Disease' : phenotypes,
+        'Phecode' : phecodes,
+        P_VALUE : TESTS[test](*arguments),
+    })
+
+
+def add_p_values(table_data, plotting_data, test = 'chi-square', bands = None, overall_label = 'Overall'):
+    p_values = compute_p_values(plotting_data, test, bands, overall_label)
+    return table_data.assign(
+        **{P_VALUE : table_data['Disease'].map(dict(zip(p_values['Disease'], p_values[P_VALUE]))).values}
+    )
@@ -0,0 +1,83 @@
+# Python imports
+import io
+
+'''
+Streaming exports of the disparity tables.
+
+The rows to export are given as positions into a table (see
+TableQuery.positions), and the file is produced a chunk of rows at a time so
+neither the filtered frame nor the whole file is ever held in memory.
+Parquet needs the optional pyarrow package.
+'''
+
+CHUNK_ROWS = 2000
+
+FORMATS = {
+    'csv' : 'text/csv',
+    'parquet' : 'application/vnd.apache.parquet',
+}
+
+
+def iter_chunks(data, positions, chunk_rows = CHUNK_ROWS):
+    for start in range(0, len(positions), chunk_rows):
+        yield data.iloc[positions[start:start + chunk_rows]]
+
+
+def iter_csv(data, positions, chunk_rows = CHUNK_ROWS):
+    yield data.iloc[:0].to_csv(index = False)
+    for chunk in iter_chunks(data, positions, chunk_rows):
+        yield chunk.to_csv(index = False, header = False)
+
+
+class ChunkSink(io.RawIOBase):
+    # Write-only file that hands back what was written since the last drain
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def iter_parquet(data, positions, chunk_rows = CHUNK_ROWS):
+    import pyarrow
+    import pyarrow.parquet
+
+    schema = pyarrow.Schema.from_pandas(data.iloc[:0], preserve_index = False)
+    sink = ChunkSink()
+
+    # One row group per chunk
+    with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+        for chunk in iter_chunks(data, positions, chunk_rows):
+            writer.write_table(pyarrow.Table.from_pandas(chunk, schema = schema, preserve_index = False))
+            yield sink.drain()
+
+    yield sink.drain()
+
+
+def has_parquet():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return False
+    return True
+
+
+def iter_export(data, positions, file_format, chunk_rows = CHUNK_ROWS):
+    if file_format == 'parquet':
+        return iter_parquet(data, positions, chunk_rows)
+    return iter_csv(data, positions, chunk_rows)
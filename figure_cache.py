@@ -0,0 +1,67 @@
+# Python imports
+import json
+import threading
+from collections import OrderedDict
+
+'''
+Bounded LRU cache for the disparity figures.
+
+Building a figure is the most expensive part of a click, while the set of
+figures is small and heavily skewed towards a few popular phenotypes. Figures
+are kept as serialized JSON keyed by (grouping, phenotype) so cached entries
+are immutable and can be shared between threads.
+'''
+
+
+class FigureCache:
+
+    def __init__(self, maxsize = 512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._figures)
+
+    def get(self, grouping, phenotype, build_json):
+        key = (grouping, phenotype)
+
+        with self._lock:
+            figure_json = self._figures.get(key)
+            if figure_json is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+
+        if figure_json is None:
+            # Building outside the lock; two threads racing on the same key
+            # produce the same figure, so the second write is harmless.
+            figure_json = build_json()
+
+            with self._lock:
+                self.misses += 1
+                self._figures[key] = figure_json
+                self._figures.move_to_end(key)
+
+                while len(self._figures) > self.maxsize:
+                    self._figures.popitem(last = False)
+                    self.evictions += 1
+
+        return json.loads(figure_json)
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size' : len(self._figures),
+                'maxsize' : self.maxsize,
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'evictions' : self.evictions,
+            }
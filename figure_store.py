@@ -0,0 +1,309 @@
+# Python imports
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Local imports
+import components
+import data_loader
+import disparity_stats
+import figure_template
+import groupings
+import releases
+
+'''
+Offline figure store.
+
+Every (grouping, phenotype) bar chart is built ahead of time and written to a
+single file:
+
+    MAGIC | header length (uint64) | JSON header | blob
+
+The header maps each grouping and phenotype to an (offset, length, input hash)
+entry into the blob, where each figure is stored as zlib-compressed plotly
+JSON drawn from the grouping's figure template. The app memory-maps the file and serves figures straight from it, so
+plotly is never called at request time for a prebuilt figure.
+
+A store holds the figures of one release, drawn with that release's
+groupings (e.g. the legacy age bands); the release is recorded in the header
+and a store is only served for the release it was built for. Build with:
+
+    python figure_store.py --release summary_stats --output cache/figures.bin
+
+Figures whose input rows (and the code that draws them) are unchanged are
+copied over from the previous store instead of being rebuilt.
+'''
+
+MAGIC = b'UKBFIG1\n'
+HEADER_LENGTH = struct.Struct('<Q')
+
+PATH = pathlib.Path(__file__).parent
+
+RELEASES = {release.name : release for release in releases.RELEASES}
+
+
+def get_groupings(release):
+    # Plotting source and figure builder for each disparity tab of the release
+    return {
+        grouping.disp_type : (grouping.load_plotting_data.file_name, grouping.load_plotting_data, grouping.get_disp_plot)
+        for grouping in release.groupings
+    }
+
+
+# Fingerprints
+def hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_fingerprint():
+    # Figures depend on the cleaning and the drawing code as well as the data
+    digest = hashlib.sha1()
+    for module in (components, data_loader, disparity_stats, figure_template, groupings):
+        digest.update(pathlib.Path(module.__file__).read_bytes())
+    return digest.hexdigest()
+
+
+def source_fingerprint(data_path, file_name):
+    return hash_file(pathlib.Path(data_path).joinpath(file_name))
+
+
+def rows_fingerprint(rows, code):
+    digest = hashlib.sha1(code.encode())
+    digest.update(pd.util.hash_pandas_object(rows, index = False).values.tobytes())
+    return digest.hexdigest()
+
+
+# Reading
+class FigureStore:
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+
+        with open(self.path, 'rb') as store_file:
+            self._map = mmap.mmap(store_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a figure store")
+
+        start = len(MAGIC) + HEADER_LENGTH.size
+        (header_length,) = HEADER_LENGTH.unpack(self._map[len(MAGIC):start])
+        self.header = json.loads(self._map[start:start + header_length])
+        self._blob_start = start + header_length
+
+        self._figures = self.header['figures']
+
+    def __contains__(self, key):
+        disp_type, phenotype = key
+        return phenotype in self._figures.get(disp_type, {})
+
+    def groupings(self):
+        return list(self._figures)
+
+    def is_current(self, disp_type, release, code = None):
+        code = code_fingerprint() if code is None else code
+        release_groupings = get_groupings(release)
+        return (
+            disp_type in self._figures and
+            disp_type in release_groupings and
+            self.header.get('release') == release.name and
+            self.header['code'] == code and
+            self.header['sources'].get(disp_type) == source_fingerprint(release.data_path, release_groupings[disp_type][0])
+        )
+
+    def drop(self, disp_type):
+        self._figures.pop(disp_type, None)
+
+    def entry(self, disp_type, phenotype):
+        return self._figures.get(disp_type, {}).get(phenotype)
+
+    def get_compressed(self, disp_type, phenotype):
+        entry = self.entry(disp_type, phenotype)
+        if entry is None:
+            return None
+
+        offset, length, _ = entry
+        start = self._blob_start + offset
+        return self._map[start:start + length]
+
+    def get_json(self, disp_type, phenotype):
+        compressed = self.get_compressed(disp_type, phenotype)
+        return None if compressed is None else zlib.decompress(compressed)
+
+    def get(self, disp_type, phenotype):
+        figure_json = self.get_json(disp_type, phenotype)
+        return None if figure_json is None else json.loads(figure_json)
+
+    def close(self):
+        self._map.close()
+
+
+def load_figure_store(path, release):
+    # Opens the store if it exists, keeping only groupings that were built
+    # for `release` (a releases.Release) from its current data and code.
+    # Returns None when there is nothing to serve.
+    if not pathlib.Path(path).exists():
+        return None
+
+    try:
+        store = FigureStore(path)
+    except (ValueError, OSError, json.JSONDecodeError):
+        return None
+
+    code = code_fingerprint()
+    for disp_type in store.groupings():
+        if not store.is_current(disp_type, release, code):
+            store.drop(disp_type)
+
+    return store if store.groupings() else None
+
+
+# Writing
+# Figure templates of the build, handed to each worker once
+_templates = {}
+
+
+def _init_worker(templates):
+    _templates.update(templates)
+
+
+def _build_figure(task):
+    disp_type, rows = task
+    return zlib.compress(_templates[disp_type].to_json(rows).encode(), 9)
+
+
+def write_store(path, release_name, code, sources, figures):
+    # `figures` maps grouping -> phenotype -> (input hash, compressed figure)
+    header = {'version' : 1, 'release' : release_name, 'code' : code, 'sources' : sources, 'figures' : {}}
+    blobs = []
+    offset = 0
+
+    for disp_type, entries in figures.items():
+        header['figures'][disp_type] = {}
+        for phenotype, (input_hash, compressed) in entries.items():
+            header['figures'][disp_type][phenotype] = [offset, len(compressed), input_hash]
+            blobs.append(compressed)
+            offset += len(compressed)
+
+    header_bytes = json.dumps(header, separators = (',', ':')).encode()
+
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents = True, exist_ok = True)
+    tmp_path = path.with_name(path.name + '.tmp')
+
+    with open(tmp_path, 'wb') as store_file:
+        store_file.write(MAGIC)
+        store_file.write(HEADER_LENGTH.pack(len(header_bytes)))
+        store_file.write(header_bytes)
+        for compressed in blobs:
+            store_file.write(compressed)
+
+    # Swapping in the finished file so running workers never see a partial store
+    os.replace(tmp_path, path)
+
+
+def build_store(release, output, groupings = None, workers = None):
+    # `release`: a releases.Release, or its name
+    release = RELEASES[release] if isinstance(release, str) else release
+    data_path = pathlib.Path(release.data_path)
+    release_groupings = get_groupings(release)
+    groupings = list(release_groupings) if groupings is None else groupings
+    code = code_fingerprint()
+
+    previous = None
+    if pathlib.Path(output).exists():
+        try:
+            previous = FigureStore(output)
+        except (ValueError, OSError, json.JSONDecodeError):
+            previous = None
+
+    # Figures of another release are never reused
+    if previous is not None and previous.header.get('release') != release.name:
+        previous.close()
+        previous = None
+
+    sources = {}
+    figures = {}
+    templates = {}
+    tasks = []
+    reused = 0
+
+    for disp_type in groupings:
+        file_name, load_plotting_data, get_disp_plot = release_groupings[disp_type]
+        sources[disp_type] = hash_file(data_path.joinpath(file_name))
+        figures[disp_type] = {}
+
+        plotting_data = disparity_stats.add_intervals(load_plotting_data(data_path))
+        phenotype_rows = list(plotting_data.groupby('Phenotype', sort = False, observed = True))
+
+        # The phenotype with the most traits covers every trace of the grouping
+        reference = max(phenotype_rows, key = lambda item: len(item[1]))[1]
+        templates[disp_type] = figure_template.FigureTemplate(get_disp_plot, reference)
+
+        for phenotype, rows in phenotype_rows:
+            input_hash = rows_fingerprint(rows, code)
+
+            entry = previous.entry(disp_type, phenotype) if previous is not None else None
+            if entry is not None and entry[2] == input_hash:
+                figures[disp_type][phenotype] = (input_hash, bytes(previous.get_compressed(disp_type, phenotype)))
+                reused += 1
+            else:
+                figures[disp_type][phenotype] = (input_hash, None)
+                tasks.append((disp_type, phenotype, rows))
+
+    # Groupings left out of this build keep their previous figures
+    if previous is not None:
+        for disp_type in previous.groupings():
+            if disp_type in figures:
+                continue
+            sources[disp_type] = previous.header['sources'][disp_type]
+            figures[disp_type] = {
+                phenotype : (entry[2], bytes(previous.get_compressed(disp_type, phenotype)))
+                for phenotype, entry in previous.header['figures'][disp_type].items()
+            }
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers = workers, initializer = _init_worker, initargs = (templates,)) as pool:
+            built = pool.map(
+                _build_figure,
+                [(disp_type, rows) for disp_type, _, rows in tasks],
+                chunksize = 16
+            )
+            for (disp_type, phenotype, _), compressed in zip(tasks, built):
+                input_hash, _ = figures[disp_type][phenotype]
+                figures[disp_type][phenotype] = (input_hash, compressed)
+
+    if previous is not None:
+        previous.close()
+
+    write_store(output, release.name, code, sources, figures)
+
+    return {'built' : len(tasks), 'reused' : reused}
+
+
+# Main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Prebuild every disparity figure into a figure store.")
+    parser.add_argument('--release', default = releases.DEFAULT_RELEASE, choices = list(RELEASES))
+    parser.add_argument('--output', default = str(PATH.joinpath("cache").joinpath("figures.bin")))
+    parser.add_argument('--groupings', nargs = '+', default = None)
+    parser.add_argument('--workers', type = int, default = None)
+    args = parser.parse_args()
+
+    unknown = set(args.groupings or []) - set(get_groupings(RELEASES[args.release]))
+    if unknown:
+        parser.error(f"groupings {sorted(unknown)} are not part of release '{args.release}'")
+
+    counts = build_store(args.release, args.output, groupings = args.groupings, workers = args.workers)
+    print(f"Wrote {args.output}: {counts['built']} figures built, {counts['reused']} reused")
@@ -0,0 +1,127 @@
+# Python imports
+import base64
+import json
+
+import numpy as np
+import plotly.io.json
+
+'''
+Templated disparity figures.
+
+Every get_*_disp_plot call runs px.bar and then re-applies the same layout,
+colours, category order and hover template, although between phenotypes only
+the bars change. A template draws one reference phenotype with the grouping's
+own plot function, keeps the layout and the per-trace styling of that figure,
+and builds any other phenotype's figure by filling in the bar values, the
+error bars, the hover counts and the x-axis range.
+
+The result is the same JSON that get_*_disp_plot(rows).to_json() returns.
+When the browser already shows a figure of the grouping, `patch` gives just
+the parts that differ, to be merged clientside into the styling of every
+trace position (`styles`, shipped once with the tab), so a phenotype with more
+traits than the one on screen still gets styled bars.
+'''
+
+# Trace properties sent by `patch`
+PATCHED = ('customdata', 'error_x', 'legendgroup', 'name', 'x', 'y')
+
+
+class FigureTemplate:
+
+    def __init__(self, get_disp_plot, reference_rows):
+        figure = json.loads(get_disp_plot(reference_rows).to_json())
+
+        # px.bar draws one trace per trait in order of appearance and colours
+        # them by position, so trace i of a phenotype is styled like trace i of
+        # the reference. The reference should have the most traits of its
+        # grouping so that every position is covered.
+        self._traces = figure['data']
+        self._layout = figure['layout']
+
+        # Bar values are written the way plotly encodes them (typed arrays in
+        # recent versions, plain lists in older ones)
+        self._typed_x = isinstance(self._traces[0]['x'], dict) if self._traces else False
+
+    def __len__(self):
+        return len(self._traces)
+
+    def _encode_x(self, value):
+        if self._typed_x:
+            return {'dtype' : 'f8', 'bdata' : base64.b64encode(value.tobytes()).decode()}
+        return value.tolist()
+
+    def _values(self, rows):
+        # Same cleaning as components.get_plotting_rows
+        traits = [str(trait) for trait in rows['Trait']]
+        prevalences = rows['Prevalence'].values.astype('float64').round(2)
+        lower = rows['Lower'].values.astype('float64').round(2)
+        upper = rows['Upper'].values.astype('float64').round(2)
+        errors_plus = np.clip(upper - prevalences, 0, None).round(2)
+        errors_minus = np.clip(prevalences - lower, 0, None).round(2)
+        cases = [format(count, ',d') for count in rows['Cases'].values.tolist()]
+        controls = [format(count, ',d') for count in rows['Controls'].values.tolist()]
+
+        if len(traits) > len(self._traces):
+            raise ValueError(f"Template has {len(self._traces)} traces, rows have {len(traits)} traits")
+
+        return traits, prevalences, errors_plus, errors_minus, upper, cases, controls
+
+    def figure(self, rows):
+        traits, prevalences, errors_plus, errors_minus, upper, cases, controls = self._values(rows)
+
+        data = []
+        for position, trait in enumerate(traits):
+            trace = dict(self._traces[position])
+            trace['customdata'] = [[cases[position], controls[position]]]
+            trace['error_x'] = dict(
+                trace['error_x'],
+                array = self._encode_x(errors_plus[position:position + 1]),
+                arrayminus = self._encode_x(errors_minus[position:position + 1])
+            )
+            trace['legendgroup'] = trait
+            trace['name'] = trait
+            trace['x'] = self._encode_x(prevalences[position:position + 1])
+            trace['y'] = [trait]
+            data.append(trace)
+
+        layout = dict(self._layout)
+        layout['xaxis'] = dict(layout['xaxis'], range = [0, float(upper.max())])
+
+        return {'data' : data, 'layout' : layout}
+
+    def to_json(self, rows):
+        return plotly.io.json.to_json_plotly(self.figure(rows))
+
+    def styles(self):
+        # Per-position trace styling: everything a patch does not carry
+        styles = []
+        for trace in self._traces:
+            style = {key : value for key, value in trace.items() if key not in PATCHED}
+            style['error_x'] = {key : value for key, value in trace['error_x'].items() if key not in ('array', 'arrayminus')}
+            styles.append(style)
+        return styles
+
+    def patch(self, rows):
+        # Trace properties that differ between phenotypes, by trace position,
+        # and the new x-axis range. Everything else is in `styles`.
+        traits, prevalences, errors_plus, errors_minus, upper, cases, controls = self._values(rows)
+
+        data = [
+            {
+                'customdata' : [[cases[position], controls[position]]],
+                'error_x' : dict(
+                    self._traces[position]['error_x'],
+                    array = [error_plus],
+                    arrayminus = [error_minus]
+                ),
+                'legendgroup' : trait,
+                'name' : trait,
+                'x' : [prevalence],
+                'y' : [trait],
+            }
+            for position, (trait, prevalence, error_plus, error_minus) in enumerate(
+                zip(traits, prevalences.tolist(), errors_plus.tolist(), errors_minus.tolist())
+            )
+        ]
+
+        return {'data' : data, 'range' : [0, float(upper.max())]}
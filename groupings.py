@@ -0,0 +1,134 @@
+# Python imports
+import functools
+from collections import namedtuple
+
+# Local imports
+import components
+import data_loader
+import disparity_stats
+import figure_template
+import phecode_index
+import phenotype_index
+
+'''
+Registry of the disparity groupings shown as tabs.
+
+Each entry declares everything the app needs for one grouping: its tab,
+its loaders, the figure builder and the trait selected by default. The app,
+the figure store and the benchmarks are all driven by this list, so adding a
+grouping only means adding its loaders, its plot and one entry here.
+'''
+
+Grouping = namedtuple(
+    'Grouping',
+    [
+        'disp_type',            # suffix of every component id in the tab
+        'tab_value',
+        'label',
+        'default_trait',
+        'load_table_data',
+        'load_prev_data',
+        'load_plotting_data',
+        'load_analysis_data',   # exports only, loaded on request; None when the release has none
+        'get_disp_plot',
+        'test',                 # p-value column of the selection table, see disparity_stats.TESTS
+        'bands',                # groups in order, scored by the trend test; None when unordered
+    ]
+)
+
+# Loaded frames, lookup indexes and figure template of one grouping
+GroupingData = namedtuple('GroupingData', ['table_data', 'prev_data', 'plotting_data', 'index', 'hierarchy', 'template'])
+
+
+AGE_BANDS = ['35-44', '45-54', '55-64', '65-74']
+SES_QUINTILES = [
+    'First Quintile of Deprivation<br>(Least Deprived)',
+    'Second Quintile of Deprivation',
+    'Third Quintile of Deprivation',
+    'Fourth Quintile of Deprivation',
+    'Fifth Quintile of Deprivation<br>(Most Deprived)',
+]
+
+# In tab order
+GROUPINGS = [
+    Grouping(
+        'Age', 'age_tab', 'Age', 'Essential hypertension',
+        data_loader.load_age_table_data, data_loader.load_age_prev_data, data_loader.load_age_plotting_data,
+        data_loader.load_age_analysis_data,
+        components.get_age_disp_plot,
+        'trend', AGE_BANDS
+    ),
+    Grouping(
+        'Ethnic', 'ethnic_tab', 'Ethnicity', 'Essential hypertension',
+        data_loader.load_ethnic_table_data, data_loader.load_ethnic_prev_data, data_loader.load_ethnic_plotting_data,
+        data_loader.load_ethnic_analysis_data,
+        components.get_ethnic_disp_plot,
+        'chi-square', None
+    ),
+    Grouping(
+        'Sex', 'sex_tab', 'Sex', 'Inguinal hernia',
+        data_loader.load_sex_table_data, data_loader.load_sex_prev_data, data_loader.load_sex_plotting_data,
+        data_loader.load_sex_analysis_data,
+        components.get_sex_disp_plot,
+        'chi-square', None
+    ),
+    Grouping(
+        'SES', 'ses_tab', 'Socioeconomic', 'Tobacco use disorder',
+        data_loader.load_ses_table_data, data_loader.load_ses_prev_data, data_loader.load_ses_plotting_data,
+        data_loader.load_ses_analysis_data,
+        components.get_ses_disp_plot,
+        'trend', SES_QUINTILES
+    ),
+    Grouping(
+        'Country', 'country_tab', 'Country', 'Essential hypertension',
+        data_loader.load_country_table_data, data_loader.load_country_prev_data, data_loader.load_country_plotting_data,
+        data_loader.load_country_analysis_data,
+        components.get_country_disp_plot,
+        'chi-square', None
+    ),
+]
+
+GROUPINGS_BY_TYPE = {grouping.disp_type : grouping for grouping in GROUPINGS}
+GROUPINGS_BY_TAB = {grouping.tab_value : grouping for grouping in GROUPINGS}
+
+# The legacy release (data/legacy) has other age bands and ethnic labels, no
+# Country grouping and no analysis tables
+LEGACY_GROUPINGS = [
+    GROUPINGS_BY_TYPE['Age']._replace(
+        load_prev_data = data_loader.load_legacy_age_prev_data,
+        load_analysis_data = None,
+        get_disp_plot = functools.partial(components.get_age_disp_plot, age_bands = data_loader.LEGACY_AGE_BANDS),
+        bands = data_loader.LEGACY_AGE_BANDS
+    ),
+    GROUPINGS_BY_TYPE['Ethnic']._replace(
+        load_prev_data = data_loader.load_legacy_ethnic_prev_data,
+        load_plotting_data = data_loader.load_legacy_ethnic_plotting_data,
+        load_analysis_data = None
+    ),
+    GROUPINGS_BY_TYPE['Sex']._replace(load_analysis_data = None),
+    GROUPINGS_BY_TYPE['SES']._replace(load_analysis_data = None),
+]
+
+
+def load_grouping(grouping, data_path):
+    # Confidence intervals of every bar and the p-value of every phenotype are
+    # computed here once, never per click
+    plotting_data = disparity_stats.add_intervals(grouping.load_plotting_data(data_path))
+    table_data = disparity_stats.add_p_values(grouping.load_table_data(data_path), plotting_data, grouping.test, grouping.bands)
+    prev_data = grouping.load_prev_data(data_path)
+    index = phenotype_index.PhenotypeIndex(plotting_data, table_data)
+
+    return GroupingData(
+        table_data,
+        prev_data,
+        plotting_data,
+        index,
+        phecode_index.PhecodeHierarchy(table_data),
+        get_template(grouping, index)
+    )
+
+
+def get_template(grouping, index):
+    # The phenotype with the most traits covers every trace of the grouping
+    reference = max(index.phenotypes(), key = index.size)
+    return figure_template.FigureTemplate(grouping.get_disp_plot, index.rows(reference))
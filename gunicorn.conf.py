@@ -0,0 +1,21 @@
+# Python imports
+import gc
+
+'''
+Gunicorn settings, picked up automatically by `gunicorn app:server`
+(Procfile, app.yaml).
+
+The app is imported once in the master process and workers are forked from
+it, so every worker shares the master's copy of the tables, indexes and
+figure store instead of loading its own. Freezing the garbage collector
+before forking keeps the collector from writing to (and so un-sharing) the
+pages that hold those objects.
+
+The number of workers is read by gunicorn from WEB_CONCURRENCY.
+'''
+
+preload_app = True
+
+
+def pre_fork(server, worker):
+    gc.freeze()
@@ -0,0 +1,50 @@
+# Python imports
+import hashlib
+
+import flask
+
+'''
+Validators for the JSON endpoints fetched with GET.
+
+The Dash layout and callback graph, and every answer of the JSON API, are
+deterministic: the same request always produces the same body. Each of these
+responses gets a strong ETag (a hash of the body) and `Cache-Control:
+no-cache`, so browsers and the reverse proxy may keep them but revalidate
+first, and an unchanged layout costs a 304 instead of the payload. Callback
+responses, the figures drawn in the tabs included, are POSTs, which are never
+revalidated, so they get neither; the same figures are served for caching by
+GET /api/v1/<grouping>/<phecode>/figure.
+
+Compression is done by Flask-Compress (Dash's `compress` option), which runs
+after this hook and suffixes the ETag with the encoding it chose.
+'''
+
+# Dash routes, relative to the app's routes_pathname_prefix
+VALIDATED_ROUTES = ('_dash-layout', '_dash-dependencies')
+
+# Only GET and HEAD requests are answered with a 304
+VALIDATED_METHODS = ('GET', 'HEAD')
+
+
+def init_app(server, routes_pathname_prefix = '/', path_prefixes = ()):
+    # `path_prefixes`: other GET routes to validate, e.g. the JSON API
+    paths = {routes_pathname_prefix + route for route in VALIDATED_ROUTES}
+    path_prefixes = tuple(prefix.rstrip('/') + '/' for prefix in path_prefixes)
+
+    def is_validated(path):
+        return path in paths or path.startswith(path_prefixes)
+
+    @server.after_request
+    def add_validators(response):
+        if (
+            flask.request.method not in VALIDATED_METHODS or not is_validated(flask.request.path) or
+            response.status_code != 200 or response.is_streamed
+        ):
+            return response
+
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        response.headers['Cache-Control'] = 'no-cache'
+
+        return response.make_conditional(flask.request)
+
+    return add_validators
@@ -0,0 +1,204 @@
+# Python imports
+import numpy as np
+import pandas as pd
+
+# Local imports
+import disparity_metrics
+import disparity_stats
+
+'''
+Top-k disparity leaderboard across every grouping of a release.
+
+The selection tables of all groupings are laid end to end, one row per
+grouping and phenotype, so a leaderboard is a slice of one array. For the
+metrics shown in the selection tables (RANKED) the order of the rows across
+groupings and the rank of every row within its grouping are computed once,
+when the release is loaded:
+
+  * top-k is the head of the precomputed order, filtered to the requested
+    groupings (and to the best row of each phenotype when asked);
+  * the rank of a phenotype in each grouping is a hash lookup and a take.
+
+The other disparity_metrics.METRICS (Ratio, MinPrev, MaxPrev), recomputed
+from the counts, are ranked on request with argpartition, which only orders
+the k rows returned. Ranks are competition ranks (1, 2, 2, 4): tied
+phenotypes share the best rank.
+'''
+
+TOP = 10
+
+# Selection table columns named differently in a grouping
+COLUMNS = {'Difference' : 'Maximum Difference'}
+
+# Metrics of the selection tables, ranked at load time
+RANKED = ['Variance', 'Maximum Difference', disparity_stats.P_VALUE]
+
+# Metrics where the smallest value is the largest disparity
+ASCENDING = {disparity_stats.P_VALUE}
+
+
+def take(values, positions, size):
+    # values[i] placed at positions[i] of an array of `size`, NaN elsewhere
+    placed = np.full(size, np.nan)
+    found = positions >= 0
+    placed[positions[found]] = np.asarray(values, dtype = 'float64')[found]
+    return placed
+
+
+class Leaderboard:
+
+    def __init__(self, grouping_data, overall_label = 'Overall'):
+        # grouping_data: disp_type -> groupings.GroupingData
+        self.disp_types = list(grouping_data)
+        tables = [data.table_data.rename(columns = COLUMNS) for data in grouping_data.values()]
+
+        self.sizes = np.array([len(table) for table in tables], dtype = 'int64')
+        self.starts = np.cumsum(self.sizes) - self.sizes
+        self.grouping_codes = np.repeat(np.arange(len(tables)), self.sizes)
+        self.phenotypes = np.concatenate([np.asarray(table['Disease'], dtype = object) for table in tables])
+        self.phecodes = np.concatenate([table['Phecode'].values for table in tables])
+        self.phenotype_codes, _ = pd.factorize(self.phenotypes)
+
+        # Rows of every phenotype and PheCode, in grouping order
+        self.phenotype_rows = pd.Series(self.phenotypes).groupby(self.phenotypes, sort = False).indices
+        self.phecode_rows = pd.Series(self.phecodes).groupby(self.phecodes, sort = False).indices
+
+        self.values = {
+            metric : np.concatenate([
+                table[metric].values.astype('float64') if metric in table.columns else np.full(len(table), np.nan)
+                for table in tables
+            ])
+            for metric in RANKED
+        }
+
+        # Recomputed metrics, in the row order of the selection tables
+        by_phenotype = [pd.Index(table['Disease'].values) for table in tables]
+        recomputed = disparity_metrics.compute_all(
+            {disp_type : data.plotting_data for disp_type, data in grouping_data.items()}, overall_label
+        )
+        for metric in disparity_metrics.METRICS:
+            if metric not in self.values:
+                self.values[metric] = np.concatenate([
+                    take(recomputed[disp_type][metric].values, index.get_indexer(recomputed[disp_type]['Disease']), len(index))
+                    for disp_type, index in zip(self.disp_types, by_phenotype)
+                ])
+
+        self.keys = {metric : self.get_key(metric) for metric in self.values}
+        self.orders = {}
+        self.best_orders = {}
+        self.ranks = {}
+        self.ranked = {}
+        for metric in RANKED:
+            self.orders[metric], self.ranks[metric], self.ranked[metric] = self.rank(self.keys[metric])
+            self.best_orders[metric] = self.first_rows(self.orders[metric])
+
+    def metrics(self):
+        return list(self.values)
+
+    def get_key(self, metric):
+        # Sort key: the largest disparity first, missing values last
+        values = self.values[metric]
+        key = values if metric in ASCENDING else -values
+        return np.where(np.isnan(key), np.inf, key)
+
+    def rank(self, key):
+        # Order of the rows with a value, and the competition rank of each row
+        # within its grouping (0 when it has no value)
+        order = np.argsort(key, kind = 'stable')
+        order = order[np.isfinite(key[order])]
+
+        ranks = np.zeros(len(key), dtype = 'int64')
+        ranked = np.zeros(len(self.sizes), dtype = 'int64')
+        for code, (start, size) in enumerate(zip(self.starts, self.sizes)):
+            block = key[start:start + size]
+            valid = np.isfinite(block)
+            ranks[start:start + size] = np.where(valid, np.searchsorted(np.sort(block), block, side = 'left') + 1, 0)
+            ranked[code] = valid.sum()
+
+        return order, ranks, ranked
+
+    def first_rows(self, rows):
+        # The first of `rows` of each phenotype, in order
+        _, first = np.unique(self.phenotype_codes[rows], return_index = True)
+        return rows[np.sort(first)]
+
+    def get_mask(self, disp_types):
+        # Whether each grouping, by code, is one of `disp_types`
+        unknown = [disp_type for disp_type in disp_types if disp_type not in self.disp_types]
+        if unknown:
+            raise KeyError(f"Unknown groupings {unknown}, expected some of {self.disp_types}")
+        return np.isin(self.disp_types, disp_types)
+
+    def top(self, metric = 'Variance', k = TOP, disp_types = None, unique = False):
+        # The k (grouping, phenotype) rows with the largest disparity in the
+        # given groupings; with `unique`, only the best row of each phenotype
+        if metric not in self.values:
+            raise KeyError(f"Unknown metric '{metric}', expected one of {self.metrics()}")
+
+        key = self.keys[metric]
+        k = max(k, 0)
+
+        if metric in self.orders:
+            if disp_types is None:
+                rows = (self.best_orders if unique else self.orders)[metric]
+            else:
+                rows = self.orders[metric]
+                rows = rows[self.get_mask(disp_types)[self.grouping_codes[rows]]]
+                if unique:
+                    # Rows are in order, so the first row of a phenotype is its best
+                    rows = self.first_rows(rows)
+            return self.get_records(rows[:k], metric)
+
+        selected = np.isfinite(key)
+        if disp_types is not None:
+            selected &= self.get_mask(disp_types)[self.grouping_codes]
+        rows = np.flatnonzero(selected)
+        if unique:
+            rows = self.best_rows(rows, key)
+
+        k = min(k, len(rows))
+        if k == 0:
+            return self.get_records(rows[:0], metric)
+        rows = rows[np.argpartition(key[rows], k - 1)[:k]]
+        return self.get_records(rows[np.lexsort((rows, key[rows]))], metric)
+
+    def best_rows(self, rows, key):
+        # The row of each phenotype with the smallest key (the first one on ties)
+        best = np.full(self.phenotype_codes.max() + 1, np.inf)
+        np.minimum.at(best, self.phenotype_codes[rows], key[rows])
+        return self.first_rows(rows[key[rows] == best[self.phenotype_codes[rows]]])
+
+    def get_records(self, rows, metric):
+        columns = {
+            'Rank' : np.arange(1, len(rows) + 1),
+            'Disease' : self.phenotypes[rows],
+            'Phecode' : self.phecodes[rows],
+            'Grouping' : np.asarray(self.disp_types, dtype = object)[self.grouping_codes[rows]],
+            metric : self.values[metric][rows],
+        }
+        if metric in self.ranks:
+            columns['Rank in grouping'] = self.ranks[metric][rows]
+        return pd.DataFrame(columns)
+
+    def locate(self, phenotype = None, phecode = None):
+        # Rows of the phenotype (or PheCode), one per grouping holding it
+        if phecode is None:
+            return self.phenotype_rows.get(phenotype, np.zeros(0, dtype = 'int64'))
+        return self.phecode_rows.get(phecode, np.zeros(0, dtype = 'int64'))
+
+    def ranks_of(self, phenotype = None, phecode = None):
+        # Value and rank of each RANKED metric in every grouping holding the
+        # phenotype, one row per grouping
+        rows = self.locate(phenotype, phecode)
+        codes = self.grouping_codes[rows]
+
+        columns = {
+            'Grouping' : np.asarray(self.disp_types, dtype = object)[codes],
+            'Disease' : self.phenotypes[rows],
+            'Phecode' : self.phecodes[rows],
+        }
+        for metric in RANKED:
+            columns[metric] = self.values[metric][rows]
+            columns[f"{metric} rank"] = self.ranks[metric][rows]
+            columns[f"{metric} of"] = self.ranked[metric][codes]
+        return pd.DataFrame(columns)
@@ -0,0 +1,189 @@
+# Python imports
+import numpy as np
+
+'''
+PheCode hierarchy of a grouping's selection table.
+
+PheCodes are hierarchical by their digits: 250 is the parent of 250.1, which
+is the parent of 250.11. With at most two decimals, every PheCode is stored as
+the integer key round(PheCode * 100) and the descendants of a code form one
+contiguous key range:
+
+    250     -> [25000, 25100)
+    250.1   -> [25010, 25020)
+    250.11  -> [25011, 25012)
+
+Keys are kept sorted, so descendant and range queries are two searchsorted
+calls. Aggregates of the disparity metrics (count, mean, min, max and the code
+with the largest Variance) are precomputed for every parent node, that is every whole code and
+every one-decimal code, so rolling up or drilling down never scans the table.
+'''
+
+DECIMALS = 2
+SCALE = 10 ** DECIMALS
+
+# Key span of a node, by the number of decimals of its code
+SPANS = {decimals : 10 ** (DECIMALS - decimals) for decimals in range(DECIMALS + 1)}
+
+# Selection table columns rolled up; a mean or range of P-values across codes
+# means nothing, so other numeric columns are left out
+METRIC_COLUMNS = ['Variance', 'Maximum Difference', 'Difference']
+
+
+def parse_node(phecode):
+    # '250' / 250 -> (25000, 100); '250.1' -> (25010, 10). Codes given as
+    # numbers are read at the precision they print with.
+    text = str(phecode).strip()
+    try:
+        value = float(text)
+    except ValueError:
+        raise ValueError(f"'{phecode}' is not a PheCode")
+    if not np.isfinite(value) or value < 0:
+        raise ValueError(f"'{phecode}' is not a PheCode")
+
+    if isinstance(phecode, (int, np.integer)):
+        decimals = 0
+    else:
+        _, _, fraction = text.partition('.')
+        decimals = len(fraction.rstrip('0')) if isinstance(phecode, (float, np.floating)) else len(fraction)
+    if decimals > DECIMALS:
+        raise ValueError(f"'{phecode}' has more than {DECIMALS} decimals")
+
+    return int(round(value * SCALE)), SPANS[decimals]
+
+
+def format_node(key, span):
+    decimals = DECIMALS - len(str(span)) + 1
+    return f"{key / SCALE:.{decimals}f}"
+
+
+class PhecodeHierarchy:
+
+    def __init__(self, table_data, metric_columns = None):
+        metric_columns = metric_columns or [column for column in METRIC_COLUMNS if column in table_data.columns]
+
+        keys = np.round(table_data['Phecode'].values.astype('float64') * SCALE).astype(np.int64)
+        order = np.argsort(keys, kind = 'mergesort')
+
+        self.table_data = table_data.iloc[order]
+        self.metric_columns = metric_columns
+        self._keys = keys[order]
+        self._metrics = self.table_data[metric_columns].values.astype('float64')
+        self._phecodes = self.table_data['Phecode'].tolist()
+        self._phenotypes = self.table_data['Disease'].tolist()
+        # Padding row, so a segment may end at the last code
+        self._padded = np.vstack([self._metrics, np.zeros((1, len(metric_columns)))])
+
+        # Parent nodes: every whole code and every one-decimal code present
+        self._nodes = {}
+        for span in (SPANS[0], SPANS[1]):
+            node_keys = np.unique(self._keys // span * span)
+            starts = np.searchsorted(self._keys, node_keys)
+            stops = np.searchsorted(self._keys, node_keys + span)
+            self._nodes[span] = (node_keys, self._aggregate(starts, stops))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _aggregate(self, starts, stops):
+        # Aggregates of the rows in [start, stop) for every (non-empty) node
+        # at once. reduceat reduces between consecutive indices, so the
+        # starts and stops are interleaved and every other result is kept.
+        counts = stops - starts
+        bounds = np.column_stack([starts, stops]).ravel()
+        sums = np.add.reduceat(self._padded, bounds, axis = 0)[::2]
+        minima = np.minimum.reduceat(self._padded, bounds, axis = 0)[::2]
+        maxima = np.maximum.reduceat(self._padded, bounds, axis = 0)[::2]
+
+        if 'Variance' in self.metric_columns:
+            variance = self._metrics[:, self.metric_columns.index('Variance')]
+            top = np.array([start + np.argmax(variance[start:stop]) for start, stop in zip(starts, stops)], dtype = np.int64)
+        else:
+            top = starts
+
+        return counts, sums / counts[:, None], minima, maxima, top
+
+    def span(self, start, stop):
+        # Positions of the codes in [start, stop)
+        lo = np.searchsorted(self._keys, int(round(float(start) * SCALE)))
+        hi = np.searchsorted(self._keys, int(round(float(stop) * SCALE)))
+        return lo, hi
+
+    def range(self, start, stop):
+        # Selection table rows with start <= PheCode < stop, in PheCode order
+        lo, hi = self.span(start, stop)
+        return self.table_data.iloc[lo:hi]
+
+    def descendants(self, phecode):
+        # The code itself and every code below it, in PheCode order
+        key, span = parse_node(phecode)
+        lo = np.searchsorted(self._keys, key)
+        hi = np.searchsorted(self._keys, key + span)
+        return self.table_data.iloc[lo:hi]
+
+    def rollup(self, phecode):
+        # Aggregate metrics of a node, or None if no code falls under it
+        key, span = parse_node(phecode)
+
+        if span in self._nodes:
+            node_keys, aggregates = self._nodes[span]
+            position = np.searchsorted(node_keys, key)
+            if position == len(node_keys) or node_keys[position] != key:
+                return None
+            return self._summary(key, span, [values[position] for values in aggregates])
+
+        # Leaf codes have nothing to precompute
+        lo = np.searchsorted(self._keys, key)
+        hi = np.searchsorted(self._keys, key + span)
+        if lo == hi:
+            return None
+        aggregates = self._aggregate(np.array([lo]), np.array([hi]))
+        return self._summary(key, span, [values[0] for values in aggregates])
+
+    def children(self, phecode = None):
+        # Aggregates of the nodes one level below a code, or of every whole
+        # code when no code is given
+        if phecode is None:
+            node_keys, aggregates = self._nodes[SPANS[0]]
+            return [self._summary(key, SPANS[0], [values[i] for values in aggregates]) for i, key in enumerate(node_keys)]
+
+        key, span = parse_node(phecode)
+        child_span = span // 10
+        if child_span < 1:
+            return []
+
+        # The code itself is not one of its children. It shares its key with
+        # the first child node (250 with 250.0, 250.1 with the leaf 250.10), so
+        # that node only keeps the codes after it.
+        own = np.searchsorted(self._keys, key, side = 'right')
+
+        if child_span in self._nodes:
+            node_keys, aggregates = self._nodes[child_span]
+            lo, hi = np.searchsorted(node_keys, key), np.searchsorted(node_keys, key + span)
+            children = [self._summary(node_keys[i], child_span, [values[i] for values in aggregates]) for i in range(lo, hi)]
+
+            if children and node_keys[lo] == key and own > np.searchsorted(self._keys, key):
+                stop = np.searchsorted(self._keys, key + child_span)
+                if own == stop:
+                    return children[1:]
+                aggregates = self._aggregate(np.array([own]), np.array([stop]))
+                children[0] = self._summary(key, child_span, [values[0] for values in aggregates])
+            return children
+
+        # Children of a one-decimal code are leaves
+        lo, hi = own, np.searchsorted(self._keys, key + span)
+        aggregates = self._aggregate(np.arange(lo, hi), np.arange(lo, hi) + 1)
+        return [self._summary(self._keys[lo + i], child_span, [values[i] for values in aggregates]) for i in range(hi - lo)]
+
+    def _summary(self, key, span, aggregate):
+        count, means, minima, maxima, top = aggregate
+
+        return {
+            'phecode' : format_node(int(key), span),
+            'codes' : int(count),
+            'metrics' : {
+                column : {'mean' : round(float(mean), 4), 'min' : float(minimum), 'max' : float(maximum)}
+                for column, mean, minimum, maximum in zip(self.metric_columns, means, minima, maxima)
+            },
+            'top' : {'phecode' : self._phecodes[top], 'phenotype' : self._phenotypes[top]},
+        }
@@ -0,0 +1,135 @@
+# Python imports
+import numpy as np
+import pandas as pd
+
+'''
+Load-time lookup tables for the disparity tabs.
+
+Every callback used to answer "which rows / cases / PheCode belong to this
+phenotype" by masking a whole DataFrame on each click. The index below is built
+once per grouping when the data is loaded; afterwards every lookup is a dict hit
+followed by a positional slice.
+'''
+
+
+class PhenotypeIndex:
+
+    def __init__(self, plotting_data, table_data, overall_label = 'Overall'):
+        # Group the long-format rows so each phenotype occupies one contiguous
+        # block. The sort is stable, so trait order within a phenotype (which
+        # plotly uses for colour assignment) is preserved.
+        codes, phenotypes = pd.factorize(plotting_data['Phenotype'])
+        order = np.argsort(codes, kind = 'mergesort')
+        self.plotting_data = plotting_data.iloc[order]
+
+        counts = np.bincount(codes, minlength = len(phenotypes))
+        stops = np.cumsum(counts)
+        starts = stops - counts
+
+        self._slices = {
+            phenotype : (int(start), int(stop))
+            for phenotype, start, stop in zip(phenotypes, starts, stops)
+        }
+
+        # Overall cases / controls / prevalence for the information tiles
+        overall = self.plotting_data.loc[self.plotting_data['Trait'] == overall_label, :]
+        self._overall = {
+            phenotype : (int(cases), int(controls), round(float(prevalence), 2))
+            for phenotype, cases, controls, prevalence in zip(
+                overall['Phenotype'], overall['Cases'], overall['Controls'], overall['Prevalence']
+            )
+        }
+
+        # PheCode shown next to the disease name
+        self._phecodes = dict(zip(table_data['Disease'], table_data['Phecode']))
+
+        # Phenotype blocks sorted by PheCode, for looking up many PheCodes
+        # with one searchsorted
+        block_phecodes = self.plotting_data['PheCode'].values[starts].astype('float64')
+        by_phecode = np.argsort(block_phecodes, kind = 'mergesort')
+        self._sorted_phecodes = block_phecodes[by_phecode]
+        self._sorted_starts = starts[by_phecode]
+        self._sorted_stops = stops[by_phecode]
+        self._sorted_phenotypes = np.asarray(phenotypes, dtype = object)[by_phecode]
+
+    def __contains__(self, phenotype):
+        return phenotype in self._slices
+
+    def __len__(self):
+        return len(self._slices)
+
+    def rows(self, phenotype):
+        start, stop = self._slices[phenotype]
+        return self.plotting_data.iloc[start:stop]
+
+    def overall(self, phenotype):
+        return self._overall[phenotype]
+
+    def phecode(self, phenotype):
+        return self._phecodes[phenotype]
+
+    def locate(self, phecodes):
+        # Positions of the given PheCodes among the sorted phenotype blocks,
+        # and whether each one was found
+        phecodes = np.asarray(phecodes, dtype = 'float64')
+        if len(self._sorted_phecodes) == 0:
+            return np.zeros(len(phecodes), dtype = bool), np.zeros(len(phecodes), dtype = np.intp)
+
+        positions = np.searchsorted(self._sorted_phecodes, phecodes)
+        positions = np.minimum(positions, len(self._sorted_phecodes) - 1)
+        found = self._sorted_phecodes[positions] == phecodes
+
+        return found, positions
+
+    def rows_by_phecode(self, phecodes):
+        # Rows of every found PheCode in one positional take, in request
+        # order. Returns the found mask, the phenotype and row count of each
+        # found PheCode, and the rows.
+        found, positions = self.locate(phecodes)
+        hits = positions[found]
+
+        starts = self._sorted_starts[hits]
+        lengths = self._sorted_stops[hits] - starts
+        offsets = np.cumsum(lengths) - lengths
+        take = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+        return found, self._sorted_phenotypes[hits], lengths, self.plotting_data.iloc[take]
+
+    def bundle(self):
+        # Compact arrays of every phenotype for drawing the bars in the browser:
+        #   phenotype -> [PheCode, trait codes, prevalences, cases, controls,
+        #                 error bars above, error bars below]
+        # Trait codes index into `traits`, counts are already formatted for
+        # the hover text and the tiles.
+        data = self.plotting_data
+        traits = data['Trait'].astype('category')
+        trait_codes = traits.cat.codes.values.tolist()
+        prevalences = data['Prevalence'].values.astype('float64').round(2)
+        upper = data['Upper'].values.astype('float64').round(2)
+        lower = data['Lower'].values.astype('float64').round(2)
+        errors_plus = np.clip(upper - prevalences, 0, None).round(2).tolist()
+        errors_minus = np.clip(prevalences - lower, 0, None).round(2).tolist()
+        prevalences = prevalences.tolist()
+        cases = [format(count, ',d') for count in data['Cases'].values.tolist()]
+        controls = [format(count, ',d') for count in data['Controls'].values.tolist()]
+
+        rows = {}
+        for phenotype, (start, stop) in self._slices.items():
+            rows[phenotype] = [
+                str(self._phecodes.get(phenotype, '')),
+                trait_codes[start:stop],
+                prevalences[start:stop],
+                cases[start:stop],
+                controls[start:stop],
+                errors_plus[start:stop],
+                errors_minus[start:stop],
+            ]
+
+        return {'traits' : [str(trait) for trait in traits.cat.categories], 'rows' : rows}
+
+    def phenotypes(self):
+        return list(self._slices)
+
+    def size(self, phenotype):
+        start, stop = self._slices[phenotype]
+        return stop - start
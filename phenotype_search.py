@@ -0,0 +1,144 @@
+# Python imports
+import bisect
+import re
+from collections import defaultdict
+
+# Local imports
+import table_query
+
+'''
+Typeahead search over phenotype names and PheCodes.
+
+The index is built once at startup:
+
+  * the lower-cased words of every name, sorted, so the words starting with
+    a prefix are one bisect away
+  * the one-letter deletions of every word, so a query word with one wrong,
+    missing, extra or swapped letter still finds it (symmetric delete)
+  * every PheCode as the tables show it (8, not 8.0), sorted, for PheCode
+    prefixes such as "401"; a query naming a PheCode's value ("8", "366.0")
+    is its exact match
+
+A phenotype is a hit when each query word matches one of its words, exactly
+(best), as a prefix, or with one typo. Hits are ranked by how well the words
+matched, then by whether the name starts with the query, then by length.
+'''
+
+WORD = re.compile(r'[a-z0-9]+')
+PHECODE_QUERY = re.compile(r'^\d+(\.\d*)?$')
+
+# Words shorter than this are only matched exactly or by prefix
+MIN_TYPO_LENGTH = 4
+
+EXACT, PREFIX, TYPO = 3, 2, 1
+
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+def format_phecode(phecode):
+    return table_query.format_number(float(phecode))
+
+
+def deletions(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class PhenotypeSearch:
+
+    def __init__(self, phecodes):
+        # `phecodes` maps phenotype name -> PheCode
+        self.phenotypes = sorted(phecodes)
+        self.phecodes = [phecodes[phenotype] for phenotype in self.phenotypes]
+        self._names = [phenotype.lower() for phenotype in self.phenotypes]
+
+        postings = defaultdict(set)
+        for doc, name in enumerate(self._names):
+            for word in tokenize(name):
+                postings[word].add(doc)
+
+        self._words = sorted(postings)
+        self._word_ids = {word : word_id for word_id, word in enumerate(self._words)}
+        self._postings = [frozenset(postings[word]) for word in self._words]
+
+        self._deletions = defaultdict(set)
+        for word_id, word in enumerate(self._words):
+            if len(word) >= MIN_TYPO_LENGTH:
+                for deletion in deletions(word):
+                    self._deletions[deletion].add(word_id)
+
+        self._codes = sorted((format_phecode(phecode), doc) for doc, phecode in enumerate(self.phecodes))
+        self._code_keys = [code for code, _ in self._codes]
+        self._code_values = defaultdict(set)
+        for doc, phecode in enumerate(self.phecodes):
+            self._code_values[float(phecode)].add(doc)
+
+    def __len__(self):
+        return len(self.phenotypes)
+
+    def _prefix_ids(self, prefix):
+        start = bisect.bisect_left(self._words, prefix)
+        stop = bisect.bisect_left(self._words, prefix + '￿')
+        return range(start, stop)
+
+    def _typo_ids(self, word):
+        if len(word) < MIN_TYPO_LENGTH:
+            return set()
+
+        # Query has an extra letter, a missing letter, or a wrong / swapped one
+        word_ids = set(self._deletions.get(word, ()))
+        for deletion in deletions(word):
+            if deletion in self._word_ids:
+                word_ids.add(self._word_ids[deletion])
+            word_ids.update(self._deletions.get(deletion, ()))
+        return word_ids
+
+    def _match_word(self, word):
+        # doc -> best score of this query word
+        scores = {}
+
+        for word_id in self._typo_ids(word):
+            for doc in self._postings[word_id]:
+                scores[doc] = TYPO
+
+        for word_id in self._prefix_ids(word):
+            score = EXACT if self._words[word_id] == word else PREFIX
+            for doc in self._postings[word_id]:
+                if scores.get(doc, 0) < score:
+                    scores[doc] = score
+
+        return scores
+
+    def _match_phecode(self, query):
+        start = bisect.bisect_left(self._code_keys, query)
+        stop = bisect.bisect_left(self._code_keys, query + '￿')
+        scores = {doc : PREFIX for _, doc in self._codes[start:stop]}
+        scores.update({doc : EXACT for doc in self._code_values.get(float(query), ())})
+        return scores
+
+    def search(self, query, limit = 10):
+        # Ranked (phenotype, PheCode) hits
+        query = (query or '').strip().lower()
+        if not query:
+            return []
+
+        if PHECODE_QUERY.match(query):
+            scores = self._match_phecode(query)
+        else:
+            scores = None
+            for word in tokenize(query):
+                word_scores = self._match_word(word)
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {doc : score + word_scores[doc] for doc, score in scores.items() if doc in word_scores}
+                if not scores:
+                    break
+
+        ranked = sorted(
+            (scores or {}).items(),
+            key = lambda item: (-item[1], not self._names[item[0]].startswith(query), len(self._names[item[0]]), item[0])
+        )
+
+        return [(self.phenotypes[doc], self.phecodes[doc]) for doc, _ in ranked[:limit]]
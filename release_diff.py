@@ -0,0 +1,227 @@
+# Python imports
+import argparse
+import pathlib
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Local imports
+import disparity_metrics
+import releases
+
+'''
+Phenotype by phenotype comparison of two data releases.
+
+Every grouping the two releases share is joined on PheCode (a hash join:
+each PheCode of the new release is looked up in a hash index of the old
+one) and compared in one vectorized pass over the joined columns:
+
+    Prevalence          overall prevalence of the phenotype
+    Variance            recomputed from the counts, see below
+    Maximum Difference  recomputed from the counts, see below
+    Group Prevalence    the largest shift among the groups both releases
+                        report, e.g. Female / Male (age bands that differ
+                        between releases are not compared)
+
+The selection tables of the releases do not define their metrics the same
+way: the legacy Variance is the population variance over every age band,
+30-39 included, where summary_stats has the sample variance of the bands it
+plots. Diffing them would report the change of definition as a shift, so
+both releases' metrics are recomputed from their case and control counts with
+disparity_metrics (sample variance over the groups each release plots)
+before they are compared.
+
+Each comparison holds the old and new value and the shift (new - old). The
+PheCodes only in the new release are reported as added and the ones only in
+the old release as removed.
+
+    python release_diff.py --old legacy --new summary_stats --top 10
+'''
+
+TOP = 10
+SHIFT_DECIMALS = 2
+
+# disparity_metrics.METRICS compared
+METRICS = ['Variance', 'Maximum Difference']
+DEFINITION = (
+    "Variance and Maximum Difference of both releases recomputed from their case and control counts "
+    "(sample variance over the groups each release plots), not taken from the selection tables"
+)
+PREVALENCE = 'Prevalence'
+GROUP_PREVALENCE = 'Group Prevalence'
+SHIFTS = [PREVALENCE, 'Variance', 'Maximum Difference', GROUP_PREVALENCE]
+
+# `changes`: one row per PheCode in both releases; `added` / `removed`:
+# Phecode and Disease of the PheCodes in only one of them; `groups`: the
+# groups compared for Group Prevalence
+GroupingDiff = namedtuple('GroupingDiff', ['disp_type', 'changes', 'added', 'removed', 'groups'])
+ReleaseDiff = namedtuple('ReleaseDiff', ['old', 'new', 'groupings', 'added_groupings', 'removed_groupings'])
+
+
+def join(old_phecodes, new_phecodes):
+    # Position of every new PheCode among the old ones, -1 when it is new
+    return pd.Index(old_phecodes).get_indexer(new_phecodes)
+
+
+def take(values, positions):
+    # Values at `positions`, NaN where the position is -1
+    values = np.asarray(values, dtype = 'float64')
+    taken = np.full(len(positions), np.nan)
+    found = positions >= 0
+    taken[found] = values[positions[found]]
+    return taken
+
+
+def get_overall_prevalence(data, phecodes, overall_label = 'Overall'):
+    overall = data.plotting_data[(data.plotting_data['Trait'] == overall_label).values]
+    prevalence = take(overall['Prevalence'].values, join(overall['PheCode'].values, phecodes))
+    return prevalence.round(disparity_metrics.PREVALENCE_DECIMALS)
+
+
+def get_metrics(data, phecodes, overall_label = 'Overall'):
+    # METRICS of every PheCode, recomputed from the counts of the plotting table
+    metrics = disparity_metrics.compute_metrics(
+        data.plotting_data, overall_label, {metric : disparity_metrics.METRICS[metric] for metric in METRICS}
+    )
+    positions = join(metrics['Phecode'].values, phecodes)
+    return {metric : take(metrics[metric].values, positions) for metric in METRICS}
+
+
+def get_group_shift(old_prev, new_prev, phecodes, groups):
+    # The shift of largest magnitude among `groups`, and the group it is in
+    if not groups:
+        return np.full(len(phecodes), np.nan), np.full(len(phecodes), None, dtype = object)
+
+    old_positions = join(old_prev['Phecode'].values, phecodes)
+    new_positions = join(new_prev['Phecode'].values, phecodes)
+    shifts = np.column_stack([
+        take(new_prev[group].values, new_positions) - take(old_prev[group].values, old_positions)
+        for group in groups
+    ])
+
+    magnitudes = np.abs(shifts)
+    largest = np.where(np.isnan(magnitudes), -1, magnitudes).argmax(axis = 1)
+    shift = shifts[np.arange(len(shifts)), largest].round(SHIFT_DECIMALS)
+
+    return shift, np.where(np.isnan(shift), None, np.asarray(groups, dtype = object)[largest])
+
+
+def diff_grouping(disp_type, old, new):
+    # old / new: groupings.GroupingData of the same grouping in two releases
+    old_table = old.table_data
+    new_table = new.table_data
+    old_phecodes = old_table['Phecode'].values
+    new_phecodes = new_table['Phecode'].values
+
+    positions = join(old_phecodes, new_phecodes)
+    matched = positions >= 0
+    old_rows = positions[matched]
+    new_rows = np.flatnonzero(matched)
+    phecodes = new_phecodes[new_rows]
+
+    removed = np.ones(len(old_phecodes), dtype = bool)
+    removed[old_rows] = False
+
+    compared = {PREVALENCE : (get_overall_prevalence(old, phecodes), get_overall_prevalence(new, phecodes))}
+    old_metrics, new_metrics = get_metrics(old, phecodes), get_metrics(new, phecodes)
+    for metric in METRICS:
+        compared[metric] = (old_metrics[metric], new_metrics[metric])
+
+    skip = ('Disease', 'Phecode', 'id')
+    old_groups = set(old.prev_data.columns)
+    groups = [group for group in new.prev_data.columns if group in old_groups and group not in skip]
+
+    columns = {'Phecode' : phecodes, 'Disease' : new_table['Disease'].values[new_rows]}
+    for metric, (old_values, new_values) in compared.items():
+        columns[f"{metric} old"] = old_values
+        columns[f"{metric} new"] = new_values
+        columns[f"{metric} shift"] = (new_values - old_values).round(SHIFT_DECIMALS)
+
+    columns[f"{GROUP_PREVALENCE} shift"], columns['Group'] = get_group_shift(old.prev_data, new.prev_data, phecodes, groups)
+
+    return GroupingDiff(
+        disp_type,
+        pd.DataFrame(columns),
+        new_table.loc[~matched, ['Phecode', 'Disease']].reset_index(drop = True),
+        old_table.loc[removed, ['Phecode', 'Disease']].reset_index(drop = True),
+        groups
+    )
+
+
+def diff_releases(old, new):
+    # old / new: releases.ReleaseData
+    return ReleaseDiff(
+        old.name,
+        new.name,
+        {
+            disp_type : diff_grouping(disp_type, old.grouping_data[disp_type], data)
+            for disp_type, data in new.grouping_data.items()
+            if disp_type in old.grouping_data
+        },
+        [disp_type for disp_type in new.grouping_data if disp_type not in old.grouping_data],
+        [disp_type for disp_type in old.grouping_data if disp_type not in new.grouping_data],
+    )
+
+
+def largest_shifts(changes, metric = 'Variance', top = TOP):
+    # The `top` rows of `changes` whose `metric` moved most, either way;
+    # unchanged rows are left out
+    magnitudes = np.abs(changes[f"{metric} shift"].values)
+    magnitudes = np.where(np.isnan(magnitudes), -np.inf, magnitudes)
+
+    top = min(top, len(magnitudes))
+    if top <= 0:
+        return changes.iloc[:0]
+
+    positions = np.argpartition(-magnitudes, top - 1)[:top]
+    positions = positions[np.argsort(-magnitudes[positions], kind = 'stable')]
+    return changes.iloc[positions[magnitudes[positions] > 0]]
+
+
+# Main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Compare the disparities of two data releases, PheCode by PheCode.")
+    parser.add_argument('--old', default = 'legacy', choices = [release.name for release in releases.RELEASES])
+    parser.add_argument('--new', default = 'summary_stats', choices = [release.name for release in releases.RELEASES])
+    parser.add_argument('--metric', default = 'Variance', choices = SHIFTS)
+    parser.add_argument('--top', type = int, default = TOP)
+    parser.add_argument('--output', help = "directory to write the full comparison of every grouping to")
+    args = parser.parse_args()
+
+    registry = releases.ReleaseRegistry()
+    old, new = registry.get(args.old), registry.get(args.new)
+
+    start = time.perf_counter()
+    diff = diff_releases(old, new)
+    seconds = time.perf_counter() - start
+
+    print(f"{args.old} -> {args.new}, compared in {seconds * 1000:.0f} ms")
+    print(DEFINITION)
+    for disp_type in diff.added_groupings:
+        print(f"\n{disp_type}: only in {args.new}")
+    for disp_type in diff.removed_groupings:
+        print(f"\n{disp_type}: only in {args.old}")
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        for disp_type, grouping_diff in diff.groupings.items():
+            print(
+                f"\n{disp_type}: {len(grouping_diff.changes)} PheCodes in both, "
+                f"{len(grouping_diff.added)} added, {len(grouping_diff.removed)} removed"
+            )
+            if f"{args.metric} shift" in grouping_diff.changes.columns:
+                shifts = largest_shifts(grouping_diff.changes, args.metric, args.top)
+                columns = ['Phecode', 'Disease'] + [column for column in shifts.columns if column.startswith(args.metric + ' ')]
+                if args.metric == GROUP_PREVALENCE:
+                    columns.append('Group')
+                print(shifts[columns].to_string(index = False) if len(shifts) else f"No {args.metric} shifts")
+
+    if args.output:
+        output_path = pathlib.Path(args.output)
+        output_path.mkdir(parents = True, exist_ok = True)
+        for disp_type, grouping_diff in diff.groupings.items():
+            grouping_diff.changes.to_csv(output_path.joinpath(f"{disp_type.lower()}_changes.txt"), sep = '\t', index = False)
+            grouping_diff.added.to_csv(output_path.joinpath(f"{disp_type.lower()}_added.txt"), sep = '\t', index = False)
+            grouping_diff.removed.to_csv(output_path.joinpath(f"{disp_type.lower()}_removed.txt"), sep = '\t', index = False)
+        print(f"\nWrote the comparison of {len(diff.groupings)} groupings to {args.output}")
@@ -0,0 +1,221 @@
+# Python imports
+import os
+import pathlib
+import sys
+import threading
+import types
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Local imports
+import groupings
+import leaderboard
+import phenotype_search
+import table_query
+
+'''
+Registry of the data releases the browser can serve side by side.
+
+A release is a directory of summary tables and the groupings that read it.
+Nothing is loaded until a page or an API call first asks for a release; the
+loaded tables, indexes, figure templates, search index and leaderboard ranks
+are then kept until the memory budget is exceeded, at which point the
+releases used least recently are dropped (and loaded again on their next
+use). Views built from
+a release, such as tab layouts and table queries, are memoized on it so they
+are dropped with it.
+
+RELEASE_MEMORY_BUDGET_MB caps the estimated size of the loaded releases,
+including the views memoized on them and the caches of their table queries;
+by default there is no cap. DEFAULT_RELEASE names the release shown to new
+sessions.
+'''
+
+PATH = pathlib.Path(__file__).parent
+
+Release = namedtuple('Release', ['name', 'label', 'data_path', 'groupings'])
+
+RELEASES = [
+    Release(
+        'summary_stats', 'Current release',
+        PATH.joinpath("data").joinpath("summary_stats").resolve(), groupings.GROUPINGS
+    ),
+    Release(
+        'legacy', 'Legacy release',
+        PATH.joinpath("data").joinpath("legacy").resolve(), groupings.LEGACY_GROUPINGS
+    ),
+]
+
+DEFAULT_RELEASE = os.environ.get('DEFAULT_RELEASE', RELEASES[0].name)
+
+MEMORY_BUDGET = os.environ.get('RELEASE_MEMORY_BUDGET_MB', '')
+MEMORY_BUDGET = int(float(MEMORY_BUDGET) * 1024 ** 2) if MEMORY_BUDGET else None
+
+
+def frame_nbytes(frame):
+    return int(frame.memory_usage(index = True, deep = True).sum())
+
+
+def estimate_nbytes(value, seen):
+    # Estimated memory held by `value`. Frames, arrays and objects are counted
+    # once: their ids go into `seen`, which is kept with the release so that
+    # views sharing its frames do not count them again.
+    if id(value) in seen:
+        return 0
+    if isinstance(value, pd.DataFrame):
+        seen.add(id(value))
+        return frame_nbytes(value)
+    if isinstance(value, (pd.Series, pd.Index)):
+        seen.add(id(value))
+        return int(value.memory_usage(deep = True))
+    if isinstance(value, np.ndarray):
+        seen.add(id(value))
+        return value.nbytes
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(item, seen) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_nbytes(key, seen) + estimate_nbytes(item, seen) for key, item in value.items()
+        )
+    if hasattr(value, 'to_plotly_json'):
+        # Dash components and plotly figures
+        seen.add(id(value))
+        return sys.getsizeof(value) + estimate_nbytes(value.to_plotly_json(), seen)
+    if hasattr(value, '__dict__') and not callable(value) and not isinstance(value, types.ModuleType):
+        seen.add(id(value))
+        return sys.getsizeof(value) + estimate_nbytes(vars(value), seen)
+    return sys.getsizeof(value)
+
+
+class ReleaseData:
+
+    def __init__(self, release):
+        self.release = release
+        self.groupings = {grouping.disp_type : grouping for grouping in release.groupings}
+        self.grouping_data = {
+            grouping.disp_type : groupings.load_grouping(grouping, release.data_path)
+            for grouping in release.groupings
+        }
+
+        # Typeahead index over the phenotype names and PheCodes of every grouping
+        self.search_index = phenotype_search.PhenotypeSearch({
+            phenotype : phecode
+            for data in self.grouping_data.values()
+            for phenotype, phecode in zip(data.table_data['Disease'], data.table_data['Phecode'])
+        })
+
+        # Rank indexes of every grouping, for the top-k leaderboard
+        self.leaderboard = leaderboard.Leaderboard(self.grouping_data)
+
+        # Frames, indexes, hierarchies, figure templates, search index and
+        # leaderboard ranks
+        self._seen = set()
+        self._nbytes = estimate_nbytes((self.grouping_data, self.search_index, self.leaderboard), self._seen)
+
+        self._views = {}
+        self._views_nbytes = {}
+
+    @property
+    def name(self):
+        return self.release.name
+
+    def memoize(self, key, build):
+        # Two threads building the same view build equal ones, so the race is
+        # harmless and the first one stored wins
+        view = self._views.get(key)
+        if view is None:
+            view = self._views.setdefault(key, build())
+            self._views_nbytes.setdefault(key, estimate_nbytes(view, self._seen))
+        return view
+
+    @property
+    def nbytes(self):
+        # Estimated size of the release and of the views memoized on it since,
+        # with the row orders their table queries have cached so far
+        views = list(self._views.values())
+        return (
+            self._nbytes + sum(list(self._views_nbytes.values())) +
+            sum(view.cache_nbytes() for view in views if isinstance(view, table_query.TableQuery))
+        )
+
+
+class ReleaseRegistry:
+
+    def __init__(self, releases = RELEASES, default = DEFAULT_RELEASE, memory_budget = MEMORY_BUDGET):
+        self.releases = OrderedDict((release.name, release) for release in releases)
+        if default not in self.releases:
+            raise ValueError(f"Unknown release '{default}', expected one of {list(self.releases)}")
+
+        self.default = default
+        self.memory_budget = memory_budget
+        self.loads = 0
+        self.evictions = 0
+
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per release, so a release is only ever loaded once at a time
+        self._loading = {name : threading.Lock() for name in self.releases}
+
+    def __contains__(self, name):
+        return name in self.releases
+
+    def resolve(self, name):
+        # Unknown or missing names (e.g. a stale session) get the default
+        return name if name in self.releases else self.default
+
+    def get(self, name = None):
+        name = self.resolve(name)
+
+        with self._lock:
+            data = self._loaded.get(name)
+            if data is not None:
+                self._loaded.move_to_end(name)
+                # Memoized views grow the loaded releases after they are loaded
+                self._evict(keep = name)
+                return data
+
+        with self._loading[name]:
+            with self._lock:
+                data = self._loaded.get(name)
+            if data is None:
+                data = ReleaseData(self.releases[name])
+                with self._lock:
+                    self._loaded[name] = data
+                    self.loads += 1
+                    self._evict(keep = name)
+
+        return data
+
+    def _evict(self, keep):
+        # Least recently used first; the release just asked for always stays
+        if self.memory_budget is None:
+            return
+
+        while self.nbytes() > self.memory_budget:
+            name = next((name for name in self._loaded if name != keep), None)
+            if name is None:
+                break
+            del self._loaded[name]
+            self.evictions += 1
+
+    def nbytes(self):
+        return sum(data.nbytes for data in self._loaded.values())
+
+    def loaded(self):
+        with self._lock:
+            return list(self._loaded)
+
+    def options(self):
+        return [{'label' : release.label, 'value' : release.name} for release in self.releases.values()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded' : list(self._loaded),
+                'nbytes' : self.nbytes(),
+                'memory_budget' : self.memory_budget,
+                'loads' : self.loads,
+                'evictions' : self.evictions,
+            }
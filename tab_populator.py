@@ -8,7 +8,7 @@ import dash_html_components as html
 import components
 
 
-def get_tab_content(view_data, plotting_data, disp_type):
+def get_tab_content(view_data, plotting_data, disp_type, figure = None):
     return html.Div(
                 [
                     html.Div(
@@ -102,6 +102,8 @@ def get_tab_content(view_data, plotting_data, disp_type):
                                 [
                                     dcc.Graph(
                                         id = "disp_graph" + disp_type,
+                                        # Initial figure that later clicks patch
+                                        figure = figure if figure is not None else {'data' : [], 'layout' : {}},
                                         animate = True
                                     )
                                 ],
@@ -114,4 +116,128 @@ def get_tab_content(view_data, plotting_data, disp_type):
                     ),
                 ],
                 className="row flex-display",
-            )
\ No newline at end of file
+            )
+
+
+def get_prev_table_content(prev_data, disp_type):
+    return html.Div(
+                [
+                    html.Div(
+                        [    
+                            html.Div(
+                                [
+                                    html.Div(
+                                        [
+                                            html.H5(
+                                                "Disease Percent Prevalence",
+                                                className="control_label",
+                                            ),
+                                            html.Br(),
+                                            # Reading in table from our component library
+                                            components.get_dash_table(prev_data, disp_type + 'Prev'),
+
+                                            html.Br()
+                                        ],
+                                    
+                                        className="pretty_container",
+                                        style = {
+                                            'borderStyle' : 'none',
+                                        }
+                                    )
+                                ],
+                                className = 'pretty_container',
+                                style = {
+                                    'width' : '100%'
+                                }
+                            ),
+                        ],
+                        className = 'container',
+                        style = {
+                                    'width' : '90%'
+                                }
+                        
+                    )
+                ],
+                className="row flex-display"
+            )
+
+
+def get_leaderboard_content(metrics, grouping_options, top = 10):
+    # `grouping_options`: the groupings of the release, as checklist options
+    return html.Div(
+                [
+                    html.Div(
+                        [
+                            html.Div(
+                                [
+                                    html.H5(
+                                        "Disparity Leaderboard",
+                                        className="control_label",
+                                    ),
+                                    html.P(
+                                        "Phenotypes with the largest disparities across the selected groupings. Click a row to see where the phenotype ranks in every grouping.",
+                                        className="control_label",
+                                    ),
+                                    html.Div(
+                                        [
+                                            dcc.Dropdown(
+                                                id = 'leaderboard_metric',
+                                                options = [{'label' : metric, 'value' : metric} for metric in metrics],
+                                                value = metrics[0],
+                                                clearable = False,
+                                                style = {'width' : '15rem'}
+                                            ),
+                                            dcc.Input(
+                                                id = 'leaderboard_top',
+                                                type = 'number',
+                                                min = 1,
+                                                max = 100,
+                                                step = 1,
+                                                value = top,
+                                                style = {'width' : '6rem', 'marginLeft' : '1rem'}
+                                            ),
+                                            dcc.Checklist(
+                                                id = 'leaderboard_unique',
+                                                options = [{'label' : ' One row per phenotype', 'value' : 'unique'}],
+                                                value = [],
+                                                style = {'marginLeft' : '1rem'}
+                                            ),
+                                        ],
+                                        className = 'row container-display',
+                                        style = {'alignItems' : 'center'}
+                                    ),
+                                    dcc.Checklist(
+                                        id = 'leaderboard_groupings',
+                                        options = grouping_options,
+                                        value = [option['value'] for option in grouping_options],
+                                        labelStyle = {'display' : 'inline-block', 'marginRight' : '1rem'}
+                                    ),
+                                    html.Br(),
+                                    components.get_leaderboard_table(
+                                        'leaderboard_table', ['Rank', 'Disease', 'Phecode', 'Grouping', metrics[0], 'Rank in grouping']
+                                    ),
+                                ],
+                                className="pretty_container",
+                            ),
+                        ],
+                        className = 'container seven columns'
+                    ),
+
+                    html.Div(
+                        [
+                            html.Div(
+                                [
+                                    html.H5(
+                                        id = 'leaderboard_phenotype',
+                                        className="control_label",
+                                    ),
+                                    components.get_leaderboard_table('leaderboard_ranks', ['Grouping']),
+                                ],
+                                className="pretty_container",
+                            ),
+                        ],
+                        className="five columns",
+                    ),
+                ],
+                className="row flex-display",
+            )
@@ -0,0 +1,270 @@
+# Python imports
+import functools
+import math
+import re
+
+import numpy as np
+
+'''
+Server-side filtering, sorting and paging for the DataTables.
+
+The tables run with page_action / filter_action / sort_action set to 'custom',
+so the browser only ever holds the visible page. The filter_query strings the
+DataTable produces, e.g.
+
+    {Disease} contains "hyper" && {Variance} > 0.5
+
+are parsed here and evaluated against the pandas frame behind the table.
+'''
+
+# Operator spellings used by the DataTable filter syntax
+OPERATORS = {
+    '>=' : 'ge', 'ge' : 'ge',
+    '<=' : 'le', 'le' : 'le',
+    '<' : 'lt', 'lt' : 'lt',
+    '>' : 'gt', 'gt' : 'gt',
+    '!=' : 'ne', 'ne' : 'ne',
+    '=' : 'eq', 'eq' : 'eq',
+    'contains' : 'contains',
+    'datestartswith' : 'datestartswith',
+}
+
+# Unary operators, {column} is <name>, see UNARY below
+UNARY_TERM = re.compile(r'^\{(?P<column>[^}]+)\}\s+is\s+(?P<operator>[a-z]+)$')
+
+FILTER_TERM = re.compile(r'^\{(?P<column>[^}]+)\}\s+(?P<operator>\S+)\s*(?P<value>.*)$')
+
+QUOTES = ('"', "'", '`')
+AND = '&&'
+
+
+def split_terms(filter_query):
+    # Splits on the && between terms, not on one inside a quoted value
+    terms = []
+    start = 0
+    quote = None
+    position = 0
+    while position < len(filter_query):
+        character = filter_query[position]
+        if quote is not None:
+            if character == '\\':
+                position += 1
+            elif character == quote:
+                quote = None
+        elif character in QUOTES:
+            quote = character
+        elif filter_query.startswith(AND, position):
+            terms.append(filter_query[start:position])
+            start = position + len(AND)
+            position = start
+            continue
+        position += 1
+
+    terms.append(filter_query[start:])
+    return terms
+
+
+def format_number(value):
+    # A number as the DataTable shows it (JavaScript's String(value)):
+    # 401.0 -> '401', 1e-07 -> '1e-7', missing -> ''
+    if not np.isfinite(value):
+        return '' if np.isnan(value) else ('Infinity' if value > 0 else '-Infinity')
+    if value == 0:
+        return '0'
+    if 1e-7 <= abs(value) < 1e21:
+        return np.format_float_positional(value, trim = '-')
+    mantissa, _, exponent = np.format_float_scientific(value, trim = '-').partition('e')
+    return f"{mantissa}e{exponent[0]}{int(exponent[1:])}"
+
+
+def as_text(series):
+    # Cells as the DataTable displays them, for the text operators
+    if series.dtype.kind in 'iuf':
+        return series.map(lambda value: format_number(float(value)))
+    return series.astype(str)
+
+
+def parse_value(value):
+    value = value.strip()
+
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in QUOTES:
+        return value[1:-1].replace('\\' + value[0], value[0])
+
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    # 'nan' and 'inf' are words, not numbers, in the filter syntax
+    return number if math.isfinite(number) else value
+
+
+def parse_filter_query(filter_query):
+    # Returns a list of (column, operator, value, case_sensitive) terms;
+    # unary terms have the operator 'is <type>' and no value. Terms that
+    # can't be parsed are skipped.
+    terms = []
+
+    for part in split_terms(filter_query or ''):
+        unary = UNARY_TERM.match(part.strip())
+        if unary is not None and unary.group('operator') in UNARY:
+            terms.append((unary.group('column'), 'is ' + unary.group('operator'), None, True))
+            continue
+
+        match = FILTER_TERM.match(part.strip())
+        if match is None:
+            continue
+
+        operator = match.group('operator')
+        case_sensitive = True
+        if operator[0] in ('i', 's') and operator[1:] in OPERATORS:
+            case_sensitive = operator[0] == 's'
+            operator = operator[1:]
+
+        if operator not in OPERATORS:
+            continue
+
+        terms.append((match.group('column'), OPERATORS[operator], parse_value(match.group('value')), case_sensitive))
+
+    return terms
+
+
+def format_value(value):
+    # Filter values are parsed as numbers when they can be: {Phecode}
+    # contains 401 looks for the text '401'
+    return format_number(value) if isinstance(value, float) else str(value)
+
+
+def get_numbers(series):
+    # Which cells the DataTable holds as numbers (not missing), and their values
+    if series.dtype.kind in 'iuf':
+        values = series.values.astype('float64')
+        return ~np.isnan(values), values
+
+    numbers = np.array([
+        isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)) and not math.isnan(value)
+        for value in series
+    ], dtype = bool)
+    values = np.array([float(value) if number else np.nan for value, number in zip(series, numbers)])
+    return numbers, values
+
+
+def get_integers(series):
+    numbers, values = get_numbers(series)
+    values = np.where(numbers, values, 0)
+    return numbers & (np.floor(values) == values), values
+
+
+def is_even(series):
+    integers, values = get_integers(series)
+    return integers & (values % 2 == 0)
+
+
+def is_odd(series):
+    integers, values = get_integers(series)
+    return integers & (values % 2 == 1)
+
+
+def is_prime(series):
+    integers, values = get_integers(series)
+    return np.array([
+        integer and value >= 2 and all(int(value) % divisor for divisor in range(2, math.isqrt(int(value)) + 1))
+        for integer, value in zip(integers, values)
+    ], dtype = bool)
+
+
+def is_type(types):
+    return lambda series: np.array([isinstance(value, types) for value in series], dtype = bool)
+
+
+def is_blank(series):
+    blank = series.isna().values
+    if series.dtype.kind not in 'iuf':
+        blank = blank | np.array([isinstance(value, str) and value == '' for value in series], dtype = bool)
+    return blank
+
+
+# The DataTable's unary operators, {column} is <name>. Missing values (NaN,
+# None) are its null cells.
+UNARY = {
+    'blank' : is_blank,
+    'bool' : is_type((bool, np.bool_)),
+    'even' : is_even,
+    'nil' : lambda series: series.isna().values,
+    'num' : lambda series: get_numbers(series)[0],
+    'object' : is_type((dict, list)),
+    'odd' : is_odd,
+    'prime' : is_prime,
+    'str' : is_type(str),
+}
+
+
+def filter_mask(data, terms):
+    mask = np.ones(len(data), dtype = bool)
+
+    for column, operator, value, case_sensitive in terms:
+        if column not in data.columns:
+            continue
+
+        series = data[column]
+        numeric = series.dtype.kind in 'iuf'
+
+        if operator.startswith('is '):
+            mask &= UNARY[operator[3:]](series)
+        elif operator == 'contains':
+            mask &= as_text(series).str.contains(format_value(value), case = case_sensitive, regex = False).values
+        elif operator == 'datestartswith':
+            mask &= as_text(series).str.startswith(format_value(value)).values
+        elif numeric and not isinstance(value, float):
+            # Comparing a number column against text matches nothing
+            mask &= False
+        else:
+            if not numeric:
+                series = series.astype(str)
+                value = str(value)
+                if not case_sensitive:
+                    series = series.str.lower()
+                    value = value.lower()
+            mask &= getattr(series, operator)(value).values
+
+    return mask
+
+
+class TableQuery:
+
+    def __init__(self, view_data, cache_size = 64):
+        self.view_data = view_data
+        # Paging through the same filter and sort only slices the cached order
+        self._positions = functools.lru_cache(maxsize = cache_size)(self._filter_and_sort)
+
+    def _filter_and_sort(self, filter_query, sort_key):
+        data = self.view_data
+        positions = np.flatnonzero(filter_mask(data, parse_filter_query(filter_query)))
+
+        columns = [column for column, _ in sort_key if column in data.columns]
+        if columns:
+            ascending = [direction == 'asc' for column, direction in sort_key if column in data.columns]
+            subset = data.iloc[positions]
+            order = subset.reset_index(drop = True).sort_values(by = columns, ascending = ascending, kind = 'mergesort').index.values
+            positions = positions[order]
+
+        return positions
+
+    def cache_nbytes(self):
+        # Upper bound of the memory held by the cached row positions
+        return self._positions.cache_info().currsize * len(self.view_data) * np.dtype(np.intp).itemsize
+
+    def positions(self, filter_query = '', sort_by = None):
+        # Row positions of the filtered and sorted table
+        sort_key = tuple((sort['column_id'], sort['direction']) for sort in (sort_by or []))
+        return self._positions(filter_query or '', sort_key)
+
+    def page(self, filter_query = '', sort_by = None, page_current = 0, page_size = 5):
+        positions = self.positions(filter_query, sort_by)
+
+        page_current = page_current or 0
+        page_count = max(1, math.ceil(len(positions) / page_size))
+        start = page_current * page_size
+
+        records = self.view_data.iloc[positions[start:start + page_size]].to_dict('records')
+
+        return records, page_count
@@ -0,0 +1,34 @@
+# Python imports
+import pytest
+
+# Local imports
+import app
+
+'''
+Batch lookups of the JSON API, through the Flask test client.
+
+    python -m pytest -q test_api.py
+'''
+
+
+@pytest.fixture(scope = 'module')
+def client():
+    return app.server.test_client()
+
+
+def test_batch_matches_single_lookups(client):
+    response = client.post('/api/v1/age', json = {'phecodes' : [401.1, 250.2, 12345]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['missing'] == [12345]
+
+    for record in body['results']:
+        single = client.get(f"/api/v1/age/{record['phecode']}").get_json()
+        assert single == dict(record, grouping = 'age')
+
+
+@pytest.mark.parametrize('phecodes', [[True], [401.1, False], ['401.1x'], [None]])
+def test_batch_rejects_non_phecodes(client, phecodes):
+    response = client.post('/api/v1/age', json = {'phecodes' : phecodes})
+    assert response.status_code == 400
+    assert 'Not PheCodes' in response.get_json()['error']
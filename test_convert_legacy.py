@@ -0,0 +1,97 @@
+# Python imports
+import pathlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local imports
+import convert_legacy
+import disparity_metrics
+
+'''
+The converted wide legacy summary against the published tables in
+data/legacy.
+
+    python -m pytest -q test_convert_legacy.py
+'''
+
+LEGACY_PATH = pathlib.Path(__file__).parent.joinpath("data").joinpath("legacy")
+
+# Metrics against disparity_metrics on the converted plotting tables: only
+# rounding apart
+METRIC_TOLERANCE = 0.01
+
+# Against the published tables, whose counts come from a later extraction:
+# prevalences move by up to a few hundredths and, for small groups, the
+# metrics derived from them by up to a few units. A loose check of the
+# layout and definitions, not of the arithmetic.
+PUBLISHED_PREVALENCE_TOLERANCE = 0.2
+PUBLISHED_METRIC_TOLERANCE = 6
+
+
+@pytest.fixture(scope = 'module')
+def output_path(tmp_path_factory):
+    output_path = tmp_path_factory.mktemp('converted')
+    convert_legacy.convert(LEGACY_PATH.joinpath("overall_summary.txt"), output_path, chunk_rows = 500)
+    return output_path
+
+
+def test_layout_matches(output_path):
+    report = convert_legacy.compare_tables(output_path, LEGACY_PATH, tolerance = np.inf)
+    assert len(report) == 12
+    assert report == {file_name : {} for file_name in report}
+
+
+def test_prevalences_match(output_path):
+    report = convert_legacy.compare_tables(output_path, LEGACY_PATH, tolerance = PUBLISHED_PREVALENCE_TOLERANCE)
+    for file_name, problems in report.items():
+        if file_name.endswith('_plotting.txt'):
+            assert set(problems) <= {'Cases', 'Controls'}, (file_name, problems)
+        elif file_name.endswith('_prev_table.txt'):
+            assert problems == {}, (file_name, problems)
+
+
+def test_metrics_match_published(output_path):
+    report = convert_legacy.compare_tables(output_path, LEGACY_PATH, tolerance = PUBLISHED_METRIC_TOLERANCE)
+    for file_name, problems in report.items():
+        if file_name.endswith('_selection_table.txt'):
+            assert problems == {}, (file_name, problems)
+
+
+def test_metrics_match_disparity_metrics(output_path):
+    # Every selection and analysis table against the metrics recomputed from
+    # the converted plotting table, over the summarised groups
+    column_map = convert_legacy.get_column_map(convert_legacy.read_header(LEGACY_PATH.joinpath("overall_summary.txt")))
+
+    for grouping, columns in column_map.groupings.items():
+        summarised = [label for label, flag in zip(columns.labels, columns.summarised) if flag]
+        plotting = pd.read_csv(output_path.joinpath(f"{grouping}_plotting.txt"), sep = '\t', dtype = {'Phenotype' : str})
+        plotting = plotting.rename(columns = {convert_legacy.GROUP_COLUMNS[grouping] : 'Trait'})
+        plotting['Trait'] = plotting['Trait'].astype(str)
+        plotting = plotting[plotting['Trait'].isin(summarised + [convert_legacy.TOTAL])]
+
+        metrics = disparity_metrics.compute_all(
+            {grouping : plotting}, convert_legacy.TOTAL, ddof = convert_legacy.VARIANCE_DDOF
+        )[grouping].set_index('Phecode')
+
+        selection = pd.read_csv(output_path.joinpath(f"{grouping}_selection_table.txt"), sep = '\t').set_index('PheCode')
+        analysis = pd.read_csv(output_path.joinpath(f"{grouping}_analysis_table.txt"), sep = '\t').set_index('PheCode')
+        assert (metrics['Groups'] == len(summarised)).all(), grouping
+
+        compared = dict(convert_legacy.SELECTION_COLUMNS.get(grouping, convert_legacy.DEFAULT_SELECTION_COLUMNS))
+        for column, metric in compared.items():
+            difference = np.abs(selection[column] - metrics.loc[selection.index, metric].values)
+            assert difference.max() <= METRIC_TOLERANCE + 1e-9, (grouping, column, difference.max())
+        for column in ('MinPrev', 'MaxPrev'):
+            difference = np.abs(analysis[column] - metrics.loc[analysis.index, column].values)
+            assert difference.max() <= METRIC_TOLERANCE + 1e-9, (grouping, column, difference.max())
+
+
+def test_variance_is_population_variance(output_path):
+    prev_table = pd.read_csv(output_path.joinpath("age_prev_table.txt"), sep = '\t')
+    selection_table = pd.read_csv(output_path.joinpath("age_selection_table.txt"), sep = '\t')
+
+    prevalence = prev_table.drop(columns = ['Phenotype', 'PheCode']).values
+    assert prevalence.shape[1] == 5
+    assert np.allclose(selection_table['Variance'].values, prevalence.var(axis = 1).round(2), atol = 0.01)
@@ -0,0 +1,46 @@
+# Python imports
+import pandas as pd
+
+# Local imports
+import data_loader
+
+'''
+Binary caches of the cleaned tables.
+
+    python -m pytest -q test_data_loader.py
+'''
+
+
+@data_loader.cached_table('table.txt')
+def load_table(data_path):
+    return pd.read_csv(data_path.joinpath('table.txt'), sep = '\t')
+
+
+def write_release(data_path, values):
+    data_path.mkdir(parents = True)
+    pd.DataFrame({'Value' : values}).to_csv(data_path.joinpath('table.txt'), sep = '\t', index = False)
+
+
+def test_releases_with_the_same_directory_name_keep_their_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, 'CACHE_PATH', tmp_path.joinpath('cache'))
+    first = tmp_path.joinpath('first').joinpath('release')
+    second = tmp_path.joinpath('second').joinpath('release')
+    write_release(first, [1, 2])
+    write_release(second, [3])
+
+    load_table(first)
+    load_table(second)
+    assert len(list(tmp_path.joinpath('cache').glob('*.pkl'))) == 2
+    assert load_table(first)['Value'].tolist() == [1, 2]
+    assert load_table(second)['Value'].tolist() == [3]
+
+
+def test_a_changed_source_replaces_its_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, 'CACHE_PATH', tmp_path.joinpath('cache'))
+    data_path = tmp_path.joinpath('release')
+    write_release(data_path, [1, 2])
+    load_table(data_path)
+
+    pd.DataFrame({'Value' : [4, 5, 6]}).to_csv(data_path.joinpath('table.txt'), sep = '\t', index = False)
+    assert load_table(data_path)['Value'].tolist() == [4, 5, 6]
+    assert len(list(tmp_path.joinpath('cache').glob('*.pkl'))) == 1
@@ -0,0 +1,53 @@
+# Python imports
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# Local imports
+import disparity_stats
+
+'''
+Trend scores of the Cochran-Armitage test on ordered groups.
+
+    python -m pytest -q test_disparity_stats.py
+'''
+
+BANDS = ['40-49', '50-59', '60-69', '70-79']
+
+
+def get_plotting_data(rows):
+    # rows: (phenotype, band, cases, controls)
+    return pd.DataFrame(rows, columns = ['Phenotype', 'Trait', 'Cases', 'Controls']).assign(PheCode = 1.0)
+
+
+def cochran_armitage(scores, cases, totals):
+    # Reference two-sided p-value, one phenotype at a time
+    scores, cases, totals = (np.asarray(values, dtype = 'float64') for values in (scores, cases, totals))
+    pooled = cases.sum() / totals.sum()
+    statistic = (scores * (cases - totals * pooled)).sum()
+    variance = pooled * (1 - pooled) * ((totals * scores ** 2).sum() - (totals * scores).sum() ** 2 / totals.sum())
+    return 2 * stats.norm.sf(abs(statistic) / np.sqrt(variance))
+
+
+def close(a, b):
+    # p-values are tiny, so only a relative tolerance tells them apart
+    return np.isclose(a, b, rtol = 1e-9, atol = 0)
+
+
+def test_missing_band_keeps_the_other_scores():
+    plotting_data = get_plotting_data([
+        ('Complete', '40-49', 10, 990), ('Complete', '50-59', 20, 980), ('Complete', '60-69', 35, 965), ('Complete', '70-79', 60, 940),
+        ('Gap', '40-49', 10, 990), ('Gap', '60-69', 35, 965), ('Gap', '70-79', 60, 940),
+    ])
+    p_values = disparity_stats.compute_p_values(plotting_data, 'trend', BANDS).set_index('Disease')[disparity_stats.P_VALUE]
+
+    assert close(p_values['Complete'], cochran_armitage([0, 1, 2, 3], [10, 20, 35, 60], [1000] * 4))
+    assert close(p_values['Gap'], cochran_armitage([0, 2, 3], [10, 35, 60], [1000] * 3))
+    assert not close(p_values['Gap'], cochran_armitage([0, 1, 2], [10, 35, 60], [1000] * 3))
+
+
+def test_row_order_does_not_change_scores():
+    rows = [('Trend', band, cases, 1000 - cases) for band, cases in zip(BANDS, [60, 35, 20, 10])]
+    forward = disparity_stats.compute_p_values(get_plotting_data(rows), 'trend', BANDS)
+    backward = disparity_stats.compute_p_values(get_plotting_data(rows[::-1]), 'trend', BANDS)
+    assert close(forward[disparity_stats.P_VALUE][0], backward[disparity_stats.P_VALUE][0])
@@ -0,0 +1,52 @@
+# Python imports
+import base64
+
+import numpy as np
+import pytest
+
+# Local imports
+import releases
+
+'''
+Figure patches merged into the per-position trace styles, as the browser does
+in assets/disparity_figures.js (apply_figure_patch).
+
+    python -m pytest -q test_figure_template.py
+'''
+
+
+@pytest.fixture(scope = 'module')
+def grouping_data():
+    return releases.ReleaseRegistry().get().grouping_data['Ethnic']
+
+
+def decode(values):
+    if isinstance(values, dict):
+        return np.frombuffer(base64.b64decode(values['bdata']), dtype = values['dtype']).tolist()
+    return list(values)
+
+
+def apply_patch(styles, patch):
+    return [
+        dict(styles[position], **dict(trace, error_x = dict(styles[position]['error_x'], **trace['error_x'])))
+        for position, trace in enumerate(patch['data'])
+    ]
+
+
+def normalize(trace):
+    error_x = dict(trace['error_x'], array = decode(trace['error_x']['array']), arrayminus = decode(trace['error_x']['arrayminus']))
+    return dict(trace, x = decode(trace['x']), error_x = error_x)
+
+
+@pytest.mark.parametrize('traits', [3, None])
+def test_patch_on_styles_is_the_figure(grouping_data, traits):
+    # A phenotype drawn after one with fewer bars gets every bar styled
+    template = grouping_data.template
+    rows = grouping_data.index.rows('Essential hypertension')
+    rows = rows.iloc[:traits]
+
+    figure = template.figure(rows)
+    merged = apply_patch(template.styles(), template.patch(rows))
+
+    assert len(merged) == len(rows)
+    assert [normalize(trace) for trace in merged] == [normalize(trace) for trace in figure['data']]
@@ -0,0 +1,89 @@
+# Python imports
+import json
+
+import pytest
+
+# Local imports
+import app
+
+'''
+Compression and validators of the app's JSON responses, through the Flask
+test client.
+
+    python -m pytest -q test_http_caching.py
+'''
+
+ENCODINGS = ('gzip', 'br')
+
+
+@pytest.fixture(scope = 'module')
+def client():
+    return app.server.test_client()
+
+
+def tab_request(tab_value):
+    return {
+        'output' : 'tab_content.children',
+        'outputs' : {'id' : 'tab_content', 'property' : 'children'},
+        'inputs' : [
+            {'id' : 'disparity_tabs', 'property' : 'value', 'value' : tab_value},
+            {'id' : 'release', 'property' : 'value', 'value' : app.release_registry.default},
+        ],
+        'changedPropIds' : ['disparity_tabs.value'],
+    }
+
+
+def get_sizes(fetch):
+    sizes = {}
+    for encoding in ('identity',) + ENCODINGS:
+        response = fetch({'Accept-Encoding' : encoding})
+        assert response.status_code == 200
+        assert response.headers.get('Content-Encoding', 'identity') == encoding
+        sizes[encoding] = len(response.data)
+    return sizes
+
+
+def test_layout_is_compressed(client):
+    sizes = get_sizes(lambda headers: client.get('/_dash-layout', headers = headers))
+    for encoding in ENCODINGS:
+        assert sizes[encoding] * 3 < sizes['identity'], sizes
+
+
+def test_tab_is_compressed(client):
+    sizes = get_sizes(lambda headers: client.post('/_dash-update-component', json = tab_request('age_tab'), headers = headers))
+    for encoding in ENCODINGS:
+        assert sizes[encoding] * 3 < sizes['identity'], sizes
+
+
+@pytest.mark.parametrize('path', [
+    '/_dash-layout', '/_dash-dependencies', '/api/v1/groupings', '/api/v1/age/401.1', '/api/v1/age/401.1/figure'
+])
+def test_get_routes_are_validated(client, path):
+    response = client.get(path, headers = {'Accept-Encoding' : 'br'})
+    assert response.status_code == 200
+    assert response.headers.get('ETag')
+    assert response.headers.get('Cache-Control') == 'no-cache'
+
+    revalidated = client.get(path, headers = {'Accept-Encoding' : 'br', 'If-None-Match' : response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+
+
+def test_figure_matches_the_tab(client):
+    figure = client.get('/api/v1/age/401.1/figure').get_json()
+    data = app.release_registry.get().grouping_data['Age']
+    assert figure == json.loads(data.template.to_json(data.index.rows('Essential hypertension')))
+    assert client.get('/api/v1/age/12345/figure').status_code == 404
+
+
+def test_callbacks_are_not_validated(client):
+    response = client.post('/_dash-update-component', json = tab_request('age_tab'))
+    assert response.status_code == 200
+    assert response.headers.get('ETag') is None
+    assert response.headers.get('Cache-Control') is None
+
+
+def test_errors_are_not_validated(client):
+    response = client.get('/api/v1/age/12345')
+    assert response.status_code == 404
+    assert response.headers.get('ETag') is None
@@ -0,0 +1,40 @@
+# Python imports
+import pandas as pd
+import pytest
+
+# Local imports
+import phecode_index
+
+'''
+Roll-ups and drill-downs of the PheCode hierarchy.
+
+    python -m pytest -q test_phecode_index.py
+'''
+
+
+@pytest.fixture
+def hierarchy():
+    phecodes = [250.0, 250.01, 250.1, 250.2, 250.21, 250.22, 401.0, 401.1]
+    return phecode_index.PhecodeHierarchy(pd.DataFrame({
+        'Phecode' : phecodes,
+        'Disease' : [f"Phenotype {phecode}" for phecode in phecodes],
+        'Variance' : [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0],
+    }))
+
+
+def children(hierarchy, phecode):
+    return [(child['phecode'], child['codes']) for child in hierarchy.children(phecode)]
+
+
+def test_children_leave_out_the_code_itself(hierarchy):
+    assert children(hierarchy, '250') == [('250.0', 1), ('250.1', 1), ('250.2', 3)]
+    assert children(hierarchy, '250.2') == [('250.21', 1), ('250.22', 1)]
+    assert children(hierarchy, '401') == [('401.1', 1)]
+    assert children(hierarchy, '401.1') == []
+
+
+def test_children_aggregate_only_the_codes_below(hierarchy):
+    child = hierarchy.children('250')[0]
+    assert child['metrics']['Variance'] == {'mean' : 2.0, 'min' : 2.0, 'max' : 2.0}
+    assert child['top']['phecode'] == 250.01
+    assert hierarchy.rollup('250')['codes'] == 6
@@ -0,0 +1,39 @@
+# Python imports
+import pytest
+
+# Local imports
+import phenotype_search
+
+'''
+PheCode queries of the typeahead search.
+
+    python -m pytest -q test_phenotype_search.py
+'''
+
+
+@pytest.fixture
+def search_index():
+    return phenotype_search.PhenotypeSearch({
+        'Intestinal infection' : 8.0,
+        'Viral Enteritis' : 8.6,
+        'Dislocation' : 830.0,
+        'Cataract' : 366.0,
+        'Senile cataract' : 366.2,
+    })
+
+
+@pytest.mark.parametrize('query, first', [
+    ('8', 'Intestinal infection'),
+    ('8.0', 'Intestinal infection'),
+    ('366', 'Cataract'),
+    ('366.2', 'Senile cataract'),
+])
+def test_whole_codes_match_exactly(search_index, query, first):
+    assert search_index.search(query)[0][0] == first
+
+
+def test_codes_match_as_displayed(search_index):
+    hits = [phenotype for phenotype, _ in search_index.search('8')]
+    assert hits[0] == 'Intestinal infection'
+    assert sorted(hits[1:]) == ['Dislocation', 'Viral Enteritis']
+    assert search_index.search('366.0') == [('Cataract', 366.0)]
@@ -0,0 +1,93 @@
+# Python imports
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local imports
+import table_query
+
+'''
+Parsing and evaluation of the DataTable filter queries.
+
+    python -m pytest -q test_table_query.py
+'''
+
+
+@pytest.fixture
+def data():
+    return pd.DataFrame({
+        'Disease' : ['Essential hypertension', 'Salt && pepper', 'Type 2 diabetes', 'Hypertensive heart disease'],
+        'Phecode' : [401.1, 401.0, 250.2, 1401.0],
+        'Variance' : [5.26, 0.0, 4.02, np.nan],
+    })
+
+
+def matches(data, filter_query):
+    return data['Disease'][table_query.filter_mask(data, table_query.parse_filter_query(filter_query))].tolist()
+
+
+def test_quoted_and_is_not_split(data):
+    assert table_query.parse_filter_query('{Disease} contains "Salt && pepper" && {Phecode} > 400') == [
+        ('Disease', 'contains', 'Salt && pepper', True),
+        ('Phecode', 'gt', 400.0, True),
+    ]
+    assert matches(data, '{Disease} contains "Salt && pepper"') == ['Salt && pepper']
+    assert matches(data, "{Disease} icontains 'HYPER' && {Phecode} < 1000") == ['Essential hypertension']
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('{Phecode} contains 401', ['Essential hypertension', 'Salt && pepper', 'Hypertensive heart disease']),
+    ('{Phecode} contains 401.1', ['Essential hypertension']),
+    ('{Phecode} contains "401.0"', []),
+    ('{Variance} contains nan', []),
+])
+def test_numbers_match_as_displayed(data, filter_query, expected):
+    assert matches(data, filter_query) == expected
+
+
+@pytest.mark.parametrize('value, text', [
+    (401.0, '401'), (401.1, '401.1'), (0.1 + 0.2, '0.30000000000000004'),
+    (-0.0, '0'), (1e-8, '1e-8'), (2.5e21, '2.5e+21'), (np.nan, ''),
+])
+def test_format_number(value, text):
+    assert table_query.format_number(value) == text
+
+
+@pytest.fixture
+def mixed():
+    return pd.DataFrame({
+        'Disease' : ['Gout', '', None, 'Asthma'],
+        'Value' : [2.0, np.nan, 7.0, 9.0],
+        'Mixed' : ['text', 4, None, 3.5],
+    })
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('{Disease} is blank', [1, 2]),
+    ('{Disease} is nil', [2]),
+    ('{Disease} is str', [0, 1, 3]),
+    ('{Value} is num', [0, 2, 3]),
+    ('{Value} is blank', [1]),
+    ('{Value} is even', [0]),
+    ('{Value} is odd', [2, 3]),
+    ('{Value} is prime', [0, 2]),
+    ('{Mixed} is num', [1, 3]),
+    ('{Mixed} is str', [0]),
+    ('{Value} is num && {Disease} is str', [0, 3]),
+])
+def test_unary_operators(mixed, filter_query, expected):
+    assert np.flatnonzero(table_query.filter_mask(mixed, table_query.parse_filter_query(filter_query))).tolist() == expected
+
+
+def test_unknown_unary_operator_is_skipped(mixed):
+    assert table_query.parse_filter_query('{Value} is sparkly') == []
+
+
+def test_cache_nbytes_grows_with_the_cached_queries(data):
+    query = table_query.TableQuery(data)
+    assert query.cache_nbytes() == 0
+
+    query.page('{Variance} > 1')
+    query.page('{Variance} > 1', page_current = 1)
+    query.page('{Phecode} > 400')
+    assert query.cache_nbytes() == 2 * len(data) * np.dtype(np.intp).itemsize